@@ -136,6 +136,28 @@ void preprocess_image(uint8_t* input, float* output, int width, int height) {
     }
 }
 
+// Tiền xử lý cho model int8 (compress.py): lượng tử hóa theo scale/zero_point của tensor đầu vào
+void preprocess_image_int8(uint8_t* input, TfLiteTensor* tensor, int width, int height) {
+    uint8_t grayscale_img[width * height];
+    uint8_t equalized_img[width * height];
+    grayscale(input, grayscale_img, width, height);
+    equalize(grayscale_img, equalized_img, width, height);
+    float scale = tensor->params.scale;
+    int zero_point = tensor->params.zero_point;
+    for (int i = 0; i < width * height; i++) {
+        int q = (int)roundf(equalized_img[i] / 255.0f / scale) + zero_point;
+        tensor->data.int8[i] = (int8_t)(q < -128 ? -128 : (q > 127 ? 127 : q));
+    }
+}
+
+// Xác suất lớp i, model float hoặc int8
+float outputProbability(TfLiteTensor* tensor, int i) {
+    if (tensor->type == kTfLiteInt8) {
+        return (tensor->data.int8[i] - tensor->params.zero_point) * tensor->params.scale;
+    }
+    return tensor->data.f[i];
+}
+
 // Function to convert pixel value to ASCII character
 char pixelToAscii(uint8_t pixelValue) {
   // ASCII characters arranged from darkest to lightest
@@ -187,7 +209,7 @@ void printResult() {
   int predictedClass = -1;
   float maxProbability = 0.0;
   for (int i = 0; i < outputTensor->dims->data[1]; ++i) {
-    float probability = outputTensor->data.f[i];
+    float probability = outputProbability(outputTensor, i);
     if (probability > maxProbability) {
       maxProbability = probability;
       predictedClass = i;
@@ -286,7 +308,11 @@ void loop() {
 
 
    // Preprocess image data
-  preprocess_image(image_data, model_input->data.f, kImageWidth, kImageHeight);
+  if (model_input->type == kTfLiteInt8) {
+    preprocess_image_int8(image_data, model_input, kImageWidth, kImageHeight);
+  } else {
+    preprocess_image(image_data, model_input->data.f, kImageWidth, kImageHeight);
+  }
 
 
   // Invoke interpreter
@@ -301,13 +327,13 @@ void loop() {
 
   // Print the results directly
     Serial.print("Prediction for class 1(ghtd 30k/h): ");
-    Serial.println(model_output->data.f[0]);
+    Serial.println(outputProbability(model_output, 0));
 
     Serial.print("Prediction for class 2(giao duong uu tien): ");
-    Serial.println(model_output->data.f[1]);
+    Serial.println(outputProbability(model_output, 1));
 
     Serial.print("Prediction for class 3(ct dang thi cong): ");
-    Serial.println(model_output->data.f[2]);
+    Serial.println(outputProbability(model_output, 2));
 
 
   // Print prediction result
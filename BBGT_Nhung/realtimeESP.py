@@ -1,8 +1,13 @@
+import os
+import sys
 import numpy as np
 import cv2
 import pickle
-import urllib.request
-from keras.models import load_model
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from mjpeg import MJPEGStream
+from regions import best_detection, detect, draw_detections
+from registry import registry_from_env
 
 # CAMERA RESOLUTION
 frameWidth = 640
@@ -16,6 +21,10 @@ font = cv2.FONT_HERSHEY_SIMPLEX
 # cap = cv2.VideoCapture(0)
 
 url = 'http://192.168.137.227/cam.jpg'
+# Stream MJPEG (CameraWebServer phat o cong 81); neu loi thi quay ve lay tung anh tu `url`
+stream_url = os.environ.get('ESP_STREAM_URL', 'http://192.168.137.227:81/stream')
+snapshot_url = os.environ.get('ESP_SNAPSHOT_URL', url)
+cam = MJPEGStream(stream_url, snapshot_url)
 # cv2.namedWindow("live Cam Testing", cv2.WINDOW_AUTOSIZE)
 # Create a VideoCapture object
 # cap = cv2.VideoCapture(url)
@@ -24,57 +33,32 @@ url = 'http://192.168.137.227/cam.jpg'
 # cap.set(4, frameHeight)
 # cap.set(10, brightness)
 
-# Load model
-model = load_model("model.h5")
-
-
-def grayscale(img):
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    return img
-
-
-def equalize(img):
-    img = cv2.equalizeHist(img)
-    return img
-
-
-def preprocessing(img):
-    img = grayscale(img)
-    img = equalize(img)
-    img = img / 255
-    return img
-
-
-def getClassName(classNo):
-    if classNo == 0:
-        return 'Gioi han toc do (30km/h)'
-    elif classNo == 1:
-        return 'Giao nhau voi duong uu tien'
-    elif classNo == 2:
-        return 'Cong trinh dang thi cong'
+# Load model: model.h5 + labelsnew.csv (3 lop, khai bao trong models.json), tu nap lai khi file thay doi
+models = registry_from_env('esp32')
+models.get()
+models.watch(2.0)
 
-    
 
 while True:
     # READ IMAGE
-    imgResp = urllib.request.urlopen(url)
-    imgNp = np.array(bytearray(imgResp.read()), dtype=np.uint8)
-    imgOrignal = cv2.imdecode(imgNp, -1)
+    success, imgOrignal = cam.read()
+    if not success:
+        continue
 
     # PROCESS IMAGE
-    img = cv2.resize(imgOrignal, (32, 32))
-    img = preprocessing(img)
+    # img = preprocess_image(imgOrignal)
     # cv2.imshow("Processed Image", img)
 
-    img = img.reshape(1, 32, 32, 1)
     cv2.putText(imgOrignal, "CLASS: " , (20, 35), font, 0.75, (0, 0, 255), 2, cv2.LINE_AA)
     cv2.putText(imgOrignal, "PROBABILITY: ", (20, 75), font, 0.75, (0, 0, 255), 2, cv2.LINE_AA)
 
-    # PREDICT IMAGE
-    predictions = model.predict(img)
-    classIndex = np.argmax(predictions)
-    probabilityValue = np.amax(predictions)
-    cv2.putText(imgOrignal, str(classIndex)+" "+str(getClassName(classIndex)), (120, 35), font, 0.75, (0, 0, 255), 2, cv2.LINE_AA)
+    # PREDICT IMAGE: tim cac vung bien bao, phan loai tat ca trong mot lan predict
+    detections = detect(models.get(), imgOrignal)
+    region, entry = best_detection(detections)
+    classIndex = entry.class_index
+    probabilityValue = entry.probabilities[classIndex]
+    draw_detections(imgOrignal, detections, threshold)
+    cv2.putText(imgOrignal, str(classIndex)+" "+entry.label, (120, 35), font, 0.75, (0, 0, 255), 2, cv2.LINE_AA)
     cv2.putText(imgOrignal, str(round(probabilityValue*100, 2)) + "%", (180, 75), font, 0.75, (0, 0, 255), 2, cv2.LINE_AA)
 
     cv2.imshow("Result", imgOrignal)
@@ -83,4 +67,5 @@ while True:
     if k == ord('q'):
         break
 
+cam.release()
 cv2.destroyAllWindows()
\ No newline at end of file
@@ -0,0 +1,89 @@
+"""Gioi han so request xu ly dong thoi, hang doi co gioi han va han chot.
+
+Toi da `max_concurrent` request duoc xu ly cung luc; toi da `max_queue`
+request khac duoc cho. Hang doi day thi tu choi ngay (429); cho qua han
+chot cua request thi bo (503). Ca hai kem Retry-After uoc tinh tu thoi
+gian xu ly trung binh, de client lui lai thay vi gui don them.
+"""
+import math
+import threading
+import time
+
+
+class Overloaded(Exception):
+    def __init__(self, status, retry_after, reason):
+        super(Overloaded, self).__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController(object):
+    """max_concurrent=0: khong gioi han (chi dem)."""
+
+    def __init__(self, max_concurrent=0, max_queue=0, alpha=0.1):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.alpha = alpha
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        # thoi gian xu ly trung binh (EMA, giay), dung de uoc tinh Retry-After
+        self.service_time = None
+
+    def retry_after(self):
+        per = self.service_time or 1.0
+        slots = self.max_concurrent or 1
+        return max(1, int(math.ceil(per * (self.waiting + 1) / slots)))
+
+    def acquire(self, timeout=None):
+        """Cho mot cho trong toi da `timeout` giay; tra ve thoi diem bat dau (de release)."""
+        with self._cond:
+            if self.max_concurrent > 0 and self.active >= self.max_concurrent:
+                if self.waiting >= self.max_queue:
+                    self.rejected += 1
+                    raise Overloaded(429, self.retry_after(), 'Hang doi day')
+                if timeout is not None and timeout <= 0:
+                    self.timed_out += 1
+                    raise Overloaded(503, self.retry_after(), 'Het han truoc khi duoc xu ly')
+                self.waiting += 1
+                try:
+                    ok = self._cond.wait_for(lambda: self.active < self.max_concurrent, timeout)
+                finally:
+                    self.waiting -= 1
+                if not ok:
+                    self.timed_out += 1
+                    raise Overloaded(503, self.retry_after(), 'Het han trong hang doi')
+            self.active += 1
+            self.admitted += 1
+        return time.perf_counter()
+
+    def release(self, started=None):
+        with self._cond:
+            self.active -= 1
+            if started is not None:
+                elapsed = time.perf_counter() - started
+                self.service_time = elapsed if self.service_time is None else \
+                    self.service_time + self.alpha * (elapsed - self.service_time)
+            self._cond.notify()
+
+    def after_fork(self):
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+
+    def stats(self):
+        with self._cond:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'active': self.active,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'service_ms': round(self.service_time * 1000, 2) if self.service_time is not None else None,
+            }
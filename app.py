@@ -1,161 +1,406 @@
 from __future__ import division, print_function
-import sys
+import time
+_started = time.perf_counter()
 import os
-import glob
-import re
+import threading
 import numpy as np
-import tensorflow as tf
-import tensorflow as tf
-import cv2
+import json
+import functools
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
+from flask import Flask, redirect, url_for, request, render_template, jsonify, Response, stream_with_context, g
 
-from flask import Flask, redirect, url_for, request, render_template
-from werkzeug.utils import secure_filename
+from admission import AdmissionController, Overloaded
+from batcher import MicroBatcher
+from bulk import Failed, chunked, detach, iter_files
+from cache import PredictionCache, content_key
+from decoding import INPUT_SIZE, decode_image
+from metrics import Metrics
+from preprocess import preprocess_batch
+from registry import registry_from_env
+from upload_store import UploadStore
 
 app = Flask(__name__)
 
-MODEL_PATH ='model.h5'
-
-model = load_model(MODEL_PATH)
-
-def grayscale(img):
-    img = cv2.cvtColor(img,cv2.COLOR_BGR2GRAY)
-    return img
-def equalize(img):
-    img =cv2.equalizeHist(img)
-    return img
-def preprocessing(img):
-    img = grayscale(img)
-    img = equalize(img)
-    img = img/255
-    return img
-def getClassName(classNo):
-    if classNo == 0:
-        return 'Gioi han toc do (20km/h)'
-    elif classNo == 1:
-        return 'Gioi han toc do (30km/h)'
-    elif classNo == 2:
-        return 'Gioi han toc do (50km/h)'
-    elif classNo == 3:
-        return 'Gioi han toc do (60km/h)'
-    elif classNo == 4:
-        return 'Gioi han toc do (70km/h)'
-    elif classNo == 5:
-        return 'Gioi han toc do (80km/h)'
-    elif classNo == 6:
-        return 'Het gioi han toc do (80km/h)'
-    elif classNo == 7:
-        return 'Gioi han toc do (100km/h)'
-    elif classNo == 8:
-        return 'Gioi han toc do (120km/h)'
-    elif classNo == 9:
-        return 'Cam vuot'
-    elif classNo == 10:
-        return 'Cam vuot cho xe co trong luong tren 3.5 tan'
-    elif classNo == 11:
-        return 'Uu tien tai giao lo ke tiep'
-    elif classNo == 12:
-        return 'Duong uu tien'
-    elif classNo == 13:
-        return 'Nhuong duong'
-    elif classNo == 14:
-        return 'Dung lai'
-    elif classNo == 15:
-        return 'Cam xe co gioi'
-    elif classNo == 16:
-        return 'Cam xe co trong luong tren 3.5 tan'
-    elif classNo == 17:
-        return 'Cam di nguoc chieu'
-    elif classNo == 18:
-        return 'Canh bao nguy hiem'
-    elif classNo == 19:
-        return 'Duong cong nguy hiem ben trai'
-    elif classNo == 20:
-        return 'Duong cong nguy hiem ben phai'
-    elif classNo == 21:
-        return 'Duong cong kep'
-    elif classNo == 22:
-        return 'Duong gap ghenh'
-    elif classNo == 23:
-        return 'Duong tron truot'
-    elif classNo == 24:
-        return 'Duong hep ben phai'
-    elif classNo == 25:
-        return 'Cong truong dang thi cong'
-    elif classNo == 26:
-        return 'Den tin hieu giao thong'
-    elif classNo == 27:
-        return 'Nguoi di bo'
-    elif classNo == 28:
-        return 'Tre em qua duong'
-    elif classNo == 29:
-        return 'Giao nhau voi xe dap'
-    elif classNo == 30:
-        return 'Canh bao bang tuyet/da'
-    elif classNo == 31:
-        return 'Gap dong vat hoang da bang qua'
-    elif classNo == 32:
-        return 'Het moi gioi han toc do va cam vuot'
-    elif classNo == 33:
-        return 'Re phai phia truoc'
-    elif classNo == 34:
-        return 'Re trai phia truoc'
-    elif classNo == 35:
-        return 'Chi di thang'
-    elif classNo == 36:
-        return 'Di thang hoac re phai'
-    elif classNo == 37:
-        return 'Di thang hoac re trai'
-    elif classNo == 38:
-        return 'Giu ben phai'
-    elif classNo == 39:
-        return 'Giu ben trai'
-    elif classNo == 40:
-        return 'Bat buoc vong xuyen'
-    elif classNo == 41:
-        return 'Het cam vuot'
-    elif classNo == 42:
-        return 'Het cam vuot cho xe co trong luong tren 3.5 tan'
-
-
-
-def model_predict(img_path, model):
-    print(img_path)
-    img = image.load_img(img_path, target_size=(224, 224))
-    img = np.asarray(img)
-    img = cv2.resize(img, (32, 32))
-    img = preprocessing(img)
-    cv2.imshow("Processed Image", img)
-    img = img.reshape(1, 32, 32, 1)
+# Model lay tu models.json: MODEL_NAME (mac dinh theo INFERENCE_BACKEND = keras | tflite | tflite-int8),
+# MODEL_PATH / MODEL_LABELS de ghi de. Kiem tra file model moi moi n giay de nap lai (0 = tat)
+MODEL_WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_INTERVAL', 2))
+# So anh toi da trong mot batch va thoi gian cho toi da (ms) de gom batch
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 32))
+MAX_BATCH_WAIT_MS = float(os.environ.get('MAX_BATCH_WAIT_MS', 5))
+# Luu anh goc vao uploads/ theo hash noi dung (ghi o thread nen, khong nam tren duong xu ly request).
+# Tong dung luong toi da (MB, 0 = khong gioi han) va tuoi toi da (giay, 0 = khong het han), xoa file
+# dung lau nhat truoc; hang doi ghi day thi bo anh chu khong bat request cho
+SAVE_UPLOADS = os.environ.get('SAVE_UPLOADS', '0') == '1'
+UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
+UPLOAD_MAX_MB = float(os.environ.get('UPLOAD_MAX_MB', 512))
+UPLOAD_MAX_AGE_S = float(os.environ.get('UPLOAD_MAX_AGE_S', 0)) or None
+UPLOAD_QUEUE = int(os.environ.get('UPLOAD_QUEUE', 64))
+# Cache ket qua theo hash noi dung anh (0 = tat), TTL tinh bang giay (0 = khong het han)
+CACHE_SIZE = int(os.environ.get('CACHE_SIZE', 10000))
+CACHE_TTL = float(os.environ.get('CACHE_TTL', 0)) or None
+# /predict_batch: so anh moi lan predict va so thread giai ma
+BULK_BATCH_SIZE = int(os.environ.get('BULK_BATCH_SIZE', 256))
+DECODE_WORKERS = int(os.environ.get('DECODE_WORKERS', os.cpu_count() or 4))
+# Thoi gian toi da (giay) tu luc import den khi san sang nhan request; vuot qua thi in canh bao
+STARTUP_BUDGET_S = float(os.environ.get('STARTUP_BUDGET_S', 10))
+# FLASK_DEBUG=1: bat debug + reloader (chi de phat trien)
+DEBUG = os.environ.get('FLASK_DEBUG', '0') == '1'
+# Do thoi gian tung buoc + dem request cho /metrics (METRICS=0 de tat)
+METRICS = os.environ.get('METRICS', '1') == '1'
+# So request /predict, /predict_batch xu ly cung luc (0 = khong gioi han) va so request duoc xep hang cho;
+# hang doi day -> 429, cho qua han chot -> 503 (ca hai kem Retry-After).
+# Mac dinh bang MAX_BATCH_SIZE: it hon thi batcher khong gom du batch
+MAX_CONCURRENT = int(os.environ.get('MAX_CONCURRENT', MAX_BATCH_SIZE))
+MAX_QUEUE = int(os.environ.get('MAX_QUEUE', 64))
+# Han chot moi request (giay); client dat ngan hon bang header X-Request-Timeout
+REQUEST_TIMEOUT_S = float(os.environ.get('REQUEST_TIMEOUT_S', 10))
+# Trang web thu nho anh ve CLIENT_IMAGE_SIZE x CLIENT_IMAGE_SIZE (0 = gui anh goc) va nen JPEG
+# chat luong CLIENT_JPEG_QUALITY truoc khi upload; /predict tra ve TOP_K lop khi client xin JSON
+CLIENT_IMAGE_SIZE = int(os.environ.get('CLIENT_IMAGE_SIZE', 64))
+CLIENT_JPEG_QUALITY = float(os.environ.get('CLIENT_JPEG_QUALITY', 0.9))
+TOP_K = int(os.environ.get('TOP_K', 3))
+
+# model chi duoc nap o request dau tien, sau do tu thay khi file model thay doi
+models = registry_from_env()
+metrics = Metrics(METRICS)
+metrics.describe('stage_seconds', 'Thoi gian tung buoc xu ly (giay)')
+metrics.describe('request_seconds', 'Thoi gian xu ly request (giay)')
+metrics.describe('requests_total', 'So request theo endpoint va ma trang thai')
+metrics.describe('requests_in_flight', 'So request dang xu ly')
+
+
+def predict_images(images):
+    # images: (N,32,32,3) BGR uint8 -> CacheEntry cho tung anh, xac suat va nhan cung mot phien ban model
+    current = models.get()
+    with metrics.stage('preprocess'):
+        batch = preprocess_batch(images, current.input_size)
+    with metrics.stage('inference'):
+        predictions = current.predict(batch)
+    with metrics.stage('labels'):
+        entries = current.entries(predictions)
+    return entries
+
+
+batcher = MicroBatcher(predict_images, MAX_BATCH_SIZE, MAX_BATCH_WAIT_MS)
+
+
+def new_upload_store():
+    return UploadStore(UPLOAD_FOLDER, UPLOAD_MAX_MB * 1024 * 1024, UPLOAD_MAX_AGE_S, UPLOAD_QUEUE) \
+        if SAVE_UPLOADS else None
+
+
+upload_store = new_upload_store()
+cache = PredictionCache(CACHE_SIZE, CACHE_TTL)
+admission = AdmissionController(MAX_CONCURRENT, MAX_QUEUE)
+decode_executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS)
+# ket qua cu khong con dung khi da doi model (ket qua model cu put muon bi cache.get bo qua theo tag)
+models.on_swap(lambda name, new, old: cache.clear())
+models.watch(MODEL_WATCH_INTERVAL)
+ready = threading.Event()
+startup = {'import_s': round(time.perf_counter() - _started, 3), 'budget_s': STARTUP_BUDGET_S}
+
+
+def warm_up():
+    """Nap model va chay thu mot anh qua batcher truoc khi nhan request."""
+    start = time.perf_counter()
+    current = models.get()
+    batcher.predict(np.zeros(INPUT_SIZE[::-1] + (3,), dtype=np.uint8))
+    ready_s = time.perf_counter() - _started
+    startup.update(pid=os.getpid(), model_load_ms=current.info()['load_ms'],
+                   warmup_ms=round((time.perf_counter() - start) * 1000, 1), ready_s=round(ready_s, 3))
+    ready.set()
+    print('[%d] San sang sau %.2fs (import %.2fs, nap model %.0f ms, warm-up %.0f ms)' % (
+        os.getpid(), ready_s, startup['import_s'], startup['model_load_ms'], startup['warmup_ms']))
+    if ready_s > STARTUP_BUDGET_S:
+        print('Canh bao: khoi dong %.2fs vuot ngan sach %.1fs' % (ready_s, STARTUP_BUDGET_S))
+
+
+def _after_fork():
+    # thread khong song sot qua fork: process con tao lai batcher, cac pool va watcher.
+    # Worker khong phai import lai gi nen thoi gian khoi dong tinh tu luc fork
+    global batcher, upload_store, decode_executor, _started
+    _started = time.perf_counter()
+    startup['import_s'] = 0.0
+    batcher = MicroBatcher(predict_images, MAX_BATCH_SIZE, MAX_BATCH_WAIT_MS)
+    upload_store = new_upload_store()
+    decode_executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS)
+    cache.after_fork()
+    admission.after_fork()
+    models.after_fork()
+    metrics.after_fork()
+    ready.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def collect_metrics():
+    # so lieu da co san trong registry/cache/batcher, doc luc /metrics duoc goi
+    rows = [('startup_ready_seconds', 'gauge', {}, startup.get('ready_s', 0.0)),
+            ('model_swaps_total', 'counter', {}, models.swaps),
+            ('batch_queue_depth', 'gauge', {}, batcher.stats()['queue_depth']),
+            ('batch_avg_size', 'gauge', {}, batcher.stats()['avg_batch_size'])]
+    for name, info in models.stats()['loaded'].items():
+        labels = {'model': name, 'version': info['version']}
+        rows.append(('model_load_seconds', 'gauge', labels, info['load_ms'] / 1000.0))
+        rows.append(('model_warmup_seconds', 'gauge', labels, (info['warmup_ms'] or 0.0) / 1000.0))
+    st = cache.stats()
+    for key in ('hits', 'misses', 'evictions', 'expirations', 'invalidations', 'stale'):
+        rows.append(('cache_%s_total' % key, 'counter', {}, st[key]))
+    rows.append(('cache_entries', 'gauge', {}, st['size']))
+    st = admission.stats()
+    rows += [('admission_active', 'gauge', {}, st['active']), ('admission_waiting', 'gauge', {}, st['waiting']),
+             ('admission_rejected_total', 'counter', {}, st['rejected']),
+             ('admission_timed_out_total', 'counter', {}, st['timed_out'])]
+    if upload_store is not None:
+        st = upload_store.stats()
+        rows += [('uploads_bytes', 'gauge', {}, st['bytes']), ('uploads_files', 'gauge', {}, st['files']),
+                 ('uploads_queued', 'gauge', {}, st['queued'])]
+        for key in ('written', 'deduplicated', 'dropped', 'evicted', 'errors'):
+            rows.append(('uploads_%s_total' % key, 'counter', {}, st[key]))
+    return rows
+
+
+metrics.collect(collect_metrics)
+
+
+def _endpoint():
+    # theo route chu khong theo URL, de duong dan la (404) khong tao them nhan moi
+    return request.url_rule.rule if request.url_rule is not None else 'other'
+
+
+@app.before_request
+def _request_started():
+    if metrics.enabled:
+        g.metrics_start = time.perf_counter()
+        metrics.add('requests_in_flight', 1, endpoint=_endpoint())
+
+
+@app.teardown_request
+def _request_finished(exc):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+    metrics.add('requests_in_flight', -1, endpoint=_endpoint())
+    metrics.observe('request_seconds', time.perf_counter() - start, endpoint=_endpoint())
+
+
+@app.after_request
+def _count_request(response):
+    metrics.inc('requests_total', endpoint=_endpoint(), status=response.status_code)
+    return response
+
+
+def request_deadline():
+    # serve_async.py dat san han chot (tinh tu luc nhan request); neu khong thi tinh tu bay gio
+    deadline = request.environ.get('bbgt.deadline')
+    if deadline is not None:
+        return deadline
+    timeout = REQUEST_TIMEOUT_S
+    try:
+        timeout = min(timeout, float(request.headers.get('X-Request-Timeout', timeout)))
+    except ValueError:
+        pass
+    return time.monotonic() + timeout
+
+
+def admitted(view):
+    """Chi chay view khi con cho (AdmissionController), cho toi da den han chot cua request."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.deadline = request_deadline()
+        started = admission.acquire(g.deadline - time.monotonic())
+        released = []
+
+        def release():
+            if not released:
+                released.append(True)
+                admission.release(started)
+        g.release_slot = release
+        try:
+            return view(*args, **kwargs)
+        finally:
+            # response dang stream tu tra cho khi stream xong (xem upload_batch)
+            if not g.get('streaming'):
+                release()
+    return wrapper
+
+
+@app.errorhandler(Overloaded)
+def overloaded(e):
+    return e.reason, e.status, {'Retry-After': str(e.retry_after)}
+
+
+def model_predict(img, batcher, deadline=None):
+    # img: anh BGR 32x32 da giai ma tu bo nho, tien xu ly theo batch trong batcher
     # PREDICT IMAGE
-    predictions = model.predict(img)
-    classIndex = np.argmax(predictions, axis=-1)
-    # probabilityValue =np.amax(predictions)
-    preds = getClassName(classIndex)
-    return preds
+    future = batcher.submit(img)
+    try:
+        return future.result(None if deadline is None else max(0.0, deadline - time.monotonic()))
+    except FutureTimeout:
+        # con nam trong hang doi cua batcher thi bo luon, khong ton cong predict
+        future.cancel()
+        raise Overloaded(503, admission.retry_after(), 'Het han cho ket qua')
 
 
 @app.route('/', methods=['GET'])
 def index():
     # Main page
-    return render_template('index.html')
+    return render_template('index.html', image_size=CLIENT_IMAGE_SIZE, jpeg_quality=CLIENT_JPEG_QUALITY,
+                           top_k=TOP_K)
+
+
+def wants_json():
+    # trang web (jQuery dataType json) xin JSON; curl/form cu (Accept */*) van nhan chuoi nhan nhu truoc
+    return request.accept_mimetypes.best_match(['text/plain', 'application/json']) == 'application/json'
+
+
+def read_upload():
+    # multipart (truong 'file') hoac than request la anh (Content-Type image/*, anh da thu nho o client)
+    f = request.files.get('file')
+    if f is not None:
+        return f.read()
+    if request.mimetype.startswith('image/'):
+        return request.get_data()
+    return None
+
+
+def prediction_json(entry, k):
+    top = [{'class_id': c, 'label': label, 'probability': round(p, 4)}
+           for c, label, p in models.get().top(entry.probabilities, k)]
+    return jsonify(class_id=entry.class_index, label=entry.label, probability=top[0]['probability'], top=top)
 
 
 @app.route('/predict', methods=['GET', 'POST'])
+@admitted
 def upload():
     if request.method == 'POST':
-        f = request.files['file']
-        basepath = os.path.dirname(__file__)
-        file_path = os.path.join(
-            basepath, 'uploads', secure_filename(f.filename))
-        f.save(file_path)
-        preds = model_predict(file_path, model)
-        result=preds
+        with metrics.stage('read'):
+            data = read_upload()
+        if not data:
+            return 'Khong co anh', 400
+        with metrics.stage('cache'):
+            key = content_key(data)
+            # ca khi trung cache: put khong chan va danh dau anh vua dung (hoac ghi lai neu file da bi xoa)
+            if upload_store is not None:
+                upload_store.put(data, key)
+            entry = cache.get(key, models.get().tag)
+        if entry is None:
+            with metrics.stage('decode'):
+                img = decode_image(data)
+            if img is None:
+                return 'Khong doc duoc anh', 400
+            # gom ca thoi gian cho trong hang doi cua batcher
+            with metrics.stage('predict'):
+                entry = model_predict(img, batcher, g.deadline)
+            cache.put(key, entry)
+        if wants_json():
+            return prediction_json(entry, request.args.get('top', TOP_K, type=int))
+        result=entry.label
         return result
     return None
 
 
+def readable(data):
+    return data is not None and not isinstance(data, Failed)
+
+
+def decode(data):
+    return decode_image(data) if readable(data) else None
+
+
+def predict_chunk(items):
+    # items: danh sach (ten file, bytes); tra ve tung dong ket qua JSON
+    keys = [content_key(data) if readable(data) else None for _, data in items]
+    tag = models.get().tag
+    entries = [cache.get(key, tag) if key is not None else None for key in keys]
+    todo = [i for i, entry in enumerate(entries) if entry is None and keys[i] is not None]
+    with metrics.stage('batch_decode'):
+        imgs = list(decode_executor.map(decode, [items[i][1] for i in todo]))
+    ok = [i for i, img in zip(todo, imgs) if img is not None]
+    if ok:
+        predicted = predict_images(np.stack([img for img in imgs if img is not None]))
+        for i, entry in zip(ok, predicted):
+            entries[i] = entry
+            cache.put(keys[i], entry)
+    for (name, data), entry in zip(items, entries):
+        if entry is None:
+            line = {'filename': name, 'error': data.error if isinstance(data, Failed) else 'Khong doc duoc anh'}
+        else:
+            line = {'filename': name, 'class_id': entry.class_index, 'label': entry.label,
+                    'probability': float(entry.probabilities[entry.class_index])}
+        yield json.dumps(line, ensure_ascii=False) + '\n'
+
+
+@app.route('/predict_batch', methods=['POST'])
+@admitted
+def upload_batch():
+    uploads = detach(request.files.getlist('files') + request.files.getlist('file'))
+    if not uploads:
+        return 'Khong co file', 400
+
+    release = g.release_slot
+    # chi serve_async.py dat han chot cho stream: qua han thi dung, tra thread cho request khac
+    deadline = request.environ.get('bbgt.deadline')
+
+    def generate():
+        try:
+            for items in chunked(iter_files(uploads), BULK_BATCH_SIZE):
+                if deadline is not None and time.monotonic() >= deadline:
+                    yield json.dumps({'error': 'Het han, dung o file %s' % items[0][0]}, ensure_ascii=False) + '\n'
+                    return
+                for line in predict_chunk(items):
+                    yield line
+        finally:
+            release()
+
+    g.streaming = True
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # client ngat truoc khi stream bat dau: generator khong chay, van phai tra cho
+    response.call_on_close(release)
+    return response
+
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify(models=models.stats(), batcher=batcher.stats(), cache=cache.stats(), admission=admission.stats(),
+                   uploads=upload_store.stats() if upload_store is not None else None)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_text():
+    # Prometheus text; voi serve.py moi worker co so lieu rieng cua minh
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # liveness: process con tra loi la duoc
+    return jsonify(status='ok', pid=os.getpid(), uptime_s=round(time.perf_counter() - _started, 1))
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    # readiness: model da nap va warm-up xong
+    if not ready.is_set():
+        return jsonify(ready=False, startup=startup), 503
+    return jsonify(ready=True, startup=startup, model=models.get().info())
+
+
+@app.route('/models/reload', methods=['POST'])
+def reload_model():
+    # nap lai model ngay (vd. sau khi copy model moi), khong can doi watcher
+    try:
+        current = models.reload(request.args.get('name'))
+    except Exception as e:
+        return jsonify(error=str(e)), 500
+    return jsonify(current.info())
+
+
 if __name__ == '__main__':
-    app.run(port=5001,debug=True)
+    # voi reloader, process cha chi theo doi file: khong nap model o do
+    if not DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        warm_up()
+    app.run(port=5001, debug=DEBUG, threaded=True)
@@ -0,0 +1,117 @@
+import threading
+
+import numpy as np
+
+# Duong dan model mac dinh cho tung backend
+DEFAULT_MODEL_PATHS = {
+    'keras': 'model.h5',
+    'tflite': 'model.tflite',
+    'tflite-int8': 'model_int8.tflite',
+}
+
+
+def _tflite_interpreter():
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from tensorflow.lite import Interpreter
+    return Interpreter
+
+
+class KerasBackend(object):
+    name = 'keras'
+
+    def __init__(self, model_path):
+        from tensorflow.keras.models import load_model
+        self.model_path = model_path
+        self.model = load_model(model_path)
+
+    def predict(self, batch):
+        # predict_on_batch khong tao tf.data/progress bar nhu predict()
+        return np.asarray(self.model.predict_on_batch(np.asarray(batch, dtype=np.float32)))
+
+
+class TFLiteBackend(object):
+    """Chay model .tflite (float hoac int8), moi thread mot interpreter.
+
+    Batch duoc lam tron len luy thua cua 2 (pad them) de moi thread chi
+    phai cap phat tensor cho mot so it kich thuoc batch.
+    """
+    name = 'tflite'
+
+    def __init__(self, model_path, num_threads=1):
+        self.model_path = model_path
+        self.num_threads = num_threads
+        with open(model_path, 'rb') as f:
+            self.model_content = f.read()
+        self._Interpreter = _tflite_interpreter()
+        self._local = threading.local()
+        # doc thong tin input/output tu mot interpreter mau
+        probe = self._Interpreter(model_content=self.model_content)
+        inp = probe.get_input_details()[0]
+        out = probe.get_output_details()[0]
+        self.input_dtype = inp['dtype']
+        self.input_quant = inp['quantization']
+        self.output_dtype = out['dtype']
+        self.output_quant = out['quantization']
+
+    def _interpreter(self, batch_size):
+        cache = getattr(self._local, 'interpreters', None)
+        if cache is None:
+            cache = self._local.interpreters = {}
+        interpreter = cache.get(batch_size)
+        if interpreter is None:
+            interpreter = self._Interpreter(model_content=self.model_content, num_threads=self.num_threads)
+            inp = interpreter.get_input_details()[0]
+            shape = list(inp['shape'])
+            if shape[0] != batch_size:
+                shape[0] = batch_size
+                interpreter.resize_tensor_input(inp['index'], shape)
+            interpreter.allocate_tensors()
+            cache[batch_size] = interpreter
+        return interpreter
+
+    def _quantize(self, batch):
+        if self.input_dtype == np.float32:
+            return batch.astype(np.float32, copy=False)
+        scale, zero_point = self.input_quant
+        info = np.iinfo(self.input_dtype)
+        q = np.round(batch / scale + zero_point)
+        return np.clip(q, info.min, info.max).astype(self.input_dtype)
+
+    def _dequantize(self, out):
+        if self.output_dtype == np.float32:
+            return out
+        scale, zero_point = self.output_quant
+        return (out.astype(np.float32) - zero_point) * scale
+
+    def predict(self, batch):
+        batch = np.asarray(batch)
+        n = len(batch)
+        size = 1 << max(0, n - 1).bit_length()
+        if size != n:
+            pad = np.zeros((size - n,) + batch.shape[1:], dtype=batch.dtype)
+            batch = np.concatenate([batch, pad])
+        interpreter = self._interpreter(size)
+        inp = interpreter.get_input_details()[0]
+        out = interpreter.get_output_details()[0]
+        interpreter.set_tensor(inp['index'], self._quantize(batch))
+        interpreter.invoke()
+        return self._dequantize(interpreter.get_tensor(out['index']))[:n]
+
+
+class TFLiteInt8Backend(TFLiteBackend):
+    name = 'tflite-int8'
+
+
+BACKENDS = {
+    'keras': KerasBackend,
+    'tflite': TFLiteBackend,
+    'tflite-int8': TFLiteInt8Backend,
+}
+
+
+def load_backend(name='keras', model_path=None):
+    if name not in BACKENDS:
+        raise ValueError('Backend khong hop le: %s (chon mot trong %s)' % (name, ', '.join(BACKENDS)))
+    return BACKENDS[name](model_path or DEFAULT_MODEL_PATHS[name])
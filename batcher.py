@@ -0,0 +1,93 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher(object):
+    """Gom cac request don le thanh mot batch roi goi predict mot lan.
+
+    Worker lay toi da `max_batch_size` anh, hoac cho toi da `max_wait_ms`
+    sau anh dau tien, roi chay `predict_fn` tren mang (N,32,32,1) va tra
+    ket qua tung dong ve cho tung nguoi goi.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=5.0, max_queue_size=0):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.queue = queue.Queue(max_queue_size)
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._last_batch_size = 0
+        self._max_seen = 0
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, x):
+        fut = Future()
+        self.queue.put((np.asarray(x), fut))
+        return fut
+
+    def predict(self, x, timeout=None):
+        return self.submit(x).result(timeout)
+
+    def close(self):
+        self.queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'batches': self._batches,
+                'items': self._items,
+                'last_batch_size': self._last_batch_size,
+                'max_batch_size_seen': self._max_seen,
+                'avg_batch_size': round(self._items / self._batches, 2) if self._batches else 0.0,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+            }
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                # con hang san trong queue thi lay luon, khong cho
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            live = [(x, fut) for x, fut in batch if fut.set_running_or_notify_cancel()]
+            if not live:
+                continue
+            futures = [fut for _, fut in live]
+            try:
+                preds = self.predict_fn(np.stack([x for x, _ in live]))
+            except Exception as e:
+                for fut in futures:
+                    fut.set_exception(e)
+                continue
+            for fut, row in zip(futures, preds):
+                fut.set_result(row)
+            with self._lock:
+                self._batches += 1
+                self._items += len(futures)
+                self._last_batch_size = len(futures)
+                self._max_seen = max(self._max_seen, len(futures))
@@ -0,0 +1,273 @@
+"""Do hieu nang tung buoc, ghi JSON va so sanh voi baseline.
+
+Cac buoc: giai ma anh (uploads/), tien xu ly, tim vung tren frame tong
+hop 640x480, predict batch 1 va batch 32 cho moi model trong models.json
+co file tren dia, tra nhan, va /predict qua Flask test client voi nhieu
+muc dong thoi. Moi buoc bao p50/p95/p99 (ms) va thong luong (anh/s).
+
+    python bench.py --output bench.json              # chay va ghi ket qua
+    python bench.py --save-baseline bench_baseline.json
+    python bench.py --compare bench_baseline.json    # exit 1 neu cham hon nguong
+    python bench.py --compare bench_baseline.json --current bench.json
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from io import BytesIO
+
+import cv2
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BATCH = 32
+
+
+def summarize(samples, items=1):
+    """samples: thoi gian (giay) moi lan goi, moi lan xu ly `items` anh."""
+    ms = np.asarray(samples, dtype=np.float64) * 1000.0
+    total = float(np.sum(samples))
+    return {
+        'n': int(len(ms)),
+        'items_per_call': items,
+        'p50_ms': round(float(np.percentile(ms, 50)), 4),
+        'p95_ms': round(float(np.percentile(ms, 95)), 4),
+        'p99_ms': round(float(np.percentile(ms, 99)), 4),
+        'mean_ms': round(float(ms.mean()), 4),
+        'throughput': round(len(ms) * items / total, 2) if total > 0 else None,
+    }
+
+
+def measure(fn, items=1, warmup=3, min_iters=30, min_time=0.5, max_iters=100000):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    start = time.perf_counter()
+    while len(samples) < max_iters and (len(samples) < min_iters or time.perf_counter() - start < min_time):
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    return summarize(samples, items)
+
+
+def sample_images(folder=os.path.join(HERE, 'uploads')):
+    data = []
+    for path in sorted(glob.glob(os.path.join(folder, '*'))):
+        with open(path, 'rb') as f:
+            data.append((os.path.basename(path), f.read()))
+    return data
+
+
+def synthetic_frames(n=8, seed=0):
+    from regions import synthetic_scene
+    rng = np.random.default_rng(seed)
+    return [synthetic_scene(rng)[0] for _ in range(n)]
+
+
+def bench_decode(images, results):
+    from decoding import decode_image
+    blobs = [data for _, data in images]
+    i = [0]
+
+    def one():
+        decode_image(blobs[i[0] % len(blobs)])
+        i[0] += 1
+    results['decode/decode_image'] = measure(one)
+
+    def full():
+        # so sanh: giai ma day du roi moi resize
+        cv2.imdecode(np.frombuffer(blobs[i[0] % len(blobs)], np.uint8), cv2.IMREAD_COLOR)
+        i[0] += 1
+    results['decode/imdecode_full'] = measure(full)
+
+
+def bench_preprocess(frames, results):
+    from preprocess import preprocess_batch, preprocess_image
+    rng = np.random.default_rng(0)
+    small = rng.integers(0, 256, (BATCH, 32, 32, 3), dtype=np.uint8)
+    results['preprocess/single_32x32'] = measure(lambda: preprocess_batch(small[:1]))
+    results['preprocess/batch%d_32x32' % BATCH] = measure(lambda: preprocess_batch(small), items=BATCH)
+    results['preprocess/frame_640x480'] = measure(lambda: preprocess_image(frames[0]))
+
+
+def bench_regions(frames, results):
+    from regions import propose_regions
+    i = [0]
+
+    def one():
+        propose_regions(frames[i[0] % len(frames)])
+        i[0] += 1
+    results['regions/propose_640x480'] = measure(one)
+
+
+def available_models(names=None):
+    from registry import ModelRegistry
+    registry = ModelRegistry()
+    names = names or [n for n, spec in registry.specs.items() if os.path.exists(spec.model_path)]
+    return registry, names
+
+
+def bench_models(registry, names, results):
+    rng = np.random.default_rng(0)
+    for name in names:
+        try:
+            model = registry.get(name)
+        except Exception as e:
+            print('Bo qua model %s: %s' % (name, e))
+            continue
+        w, h = model.input_size
+        batch = rng.random((BATCH, h, w, 1), dtype=np.float32)
+        # batch 1 dung cung luong lam batcher khi chi co mot request
+        results['infer/%s/batch1' % name] = measure(lambda: model.predict(batch[:1]))
+        results['infer/%s/batch%d' % (name, BATCH)] = measure(lambda: model.predict(batch), items=BATCH)
+        probs = model.predict(batch)
+        results['labels/%s/entries%d' % (name, BATCH)] = measure(lambda: model.entries(probs), items=BATCH)
+        results['labels/%s/label' % name] = measure(lambda: model.label(0), min_iters=1000)
+
+
+def bench_app(images, results, concurrency=(1, 4, 16), requests_per_level=200, model_name=None):
+    # cache tat de moi request deu di het duong decode -> preprocess -> predict
+    os.environ['CACHE_SIZE'] = '0'
+    os.environ['MODEL_WATCH_INTERVAL'] = '0'
+    if model_name:
+        os.environ['MODEL_NAME'] = model_name
+    sys.path.insert(0, HERE)
+    import app as service
+    service.warm_up()
+    for level in concurrency:
+        latencies = []
+        lock = threading.Lock()
+        per_thread = max(1, requests_per_level // level)
+
+        def client(offset):
+            c = service.app.test_client()
+            local = []
+            for i in range(per_thread):
+                name, data = images[(offset + i) % len(images)]
+                t = time.perf_counter()
+                r = c.post('/predict', data={'file': (BytesIO(data), name)})
+                local.append(time.perf_counter() - t)
+                if r.status_code != 200:
+                    raise RuntimeError('/predict tra ve %d' % r.status_code)
+            with lock:
+                latencies.extend(local)
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(level)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - start
+        stats = summarize(latencies)
+        # nhieu request chay song song: thong luong tinh theo thoi gian thuc, khong phai tong latency
+        stats['throughput'] = round(len(latencies) / wall, 2)
+        stats['concurrency'] = level
+        results['app/predict/c%d' % level] = stats
+
+
+def environment():
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                             text=True).stdout.strip()
+    except OSError:
+        rev = None
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git': rev,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+    }
+
+
+def run(stages, model_names=None, app_model=None, concurrency=(1, 4, 16), requests=200):
+    images = sample_images()
+    frames = synthetic_frames()
+    results = {}
+    if 'decode' in stages:
+        bench_decode(images, results)
+    if 'preprocess' in stages:
+        bench_preprocess(frames, results)
+    if 'regions' in stages:
+        bench_regions(frames, results)
+    if 'infer' in stages:
+        registry, names = available_models(model_names)
+        bench_models(registry, names, results)
+    if 'app' in stages:
+        if not app_model and not os.environ.get('MODEL_NAME'):
+            # khong chi dinh: dung model dau tien co file (model.h5 goc co the chua duoc train)
+            app_model = (model_names or available_models()[1] or [None])[0]
+        bench_app(images, results, concurrency, requests, app_model)
+    return {'env': environment(), 'results': results}
+
+
+def compare(baseline, current, threshold=0.10):
+    """Tra ve list (ten, chi so, cu, moi, ti le) cac buoc cham hon nguong."""
+    regressions = []
+    for name, new in sorted(current['results'].items()):
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        for key in ('p50_ms', 'p95_ms'):
+            if old[key] and new[key] > old[key] * (1 + threshold):
+                regressions.append((name, key, old[key], new[key], new[key] / old[key]))
+        if old.get('throughput') and new.get('throughput') and \
+                new['throughput'] < old['throughput'] * (1 - threshold):
+            regressions.append((name, 'throughput', old['throughput'], new['throughput'],
+                                new['throughput'] / old['throughput']))
+    return regressions
+
+
+def print_report(report):
+    print('%-34s %7s %10s %10s %10s %12s' % ('buoc', 'n', 'p50 ms', 'p95 ms', 'p99 ms', 'anh/s'))
+    for name, r in sorted(report['results'].items()):
+        print('%-34s %7d %10.3f %10.3f %10.3f %12s' % (
+            name, r['n'], r['p50_ms'], r['p95_ms'], r['p99_ms'], r['throughput']))
+
+
+STAGES = ('decode', 'preprocess', 'regions', 'infer', 'app')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Do hieu nang tung buoc nhan dien bien bao')
+    parser.add_argument('--stages', default=','.join(STAGES), help='cac buoc can do, cach nhau dau phay')
+    parser.add_argument('--models', help='ten model trong models.json (mac dinh: moi model co file)')
+    parser.add_argument('--app-model', help='MODEL_NAME cho buoc app (mac dinh theo bien moi truong)')
+    parser.add_argument('--concurrency', default='1,4,16')
+    parser.add_argument('--requests', type=int, default=200, help='so request /predict moi muc dong thoi')
+    parser.add_argument('--output', help='ghi ket qua JSON')
+    parser.add_argument('--save-baseline', help='ghi ket qua lam baseline')
+    parser.add_argument('--compare', help='file baseline de so sanh')
+    parser.add_argument('--current', help='dung ket qua co san thay vi chay lai')
+    parser.add_argument('--threshold', type=float, default=0.10, help='cham hon bao nhieu thi bao (0.10 = 10%%)')
+    args = parser.parse_args()
+
+    if args.current:
+        with open(args.current) as f:
+            report = json.load(f)
+    else:
+        report = run([s.strip() for s in args.stages.split(',') if s.strip()],
+                     args.models.split(',') if args.models else None, args.app_model,
+                     tuple(int(c) for c in args.concurrency.split(',')), args.requests)
+    print_report(report)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=1)
+            print('Da ghi %s' % path)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        for name, key, old, new, ratio in regressions:
+            print('CHAM HON: %-30s %-10s %10.3f -> %10.3f (x%.2f)' % (name, key, old, new, ratio))
+        if regressions:
+            sys.exit(1)
+        print('Khong co buoc nao cham hon %.0f%% so voi %s' % (args.threshold * 100, args.compare))
@@ -0,0 +1,78 @@
+import io
+import itertools
+import zipfile
+import zlib
+from collections import namedtuple
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.ppm', '.webp')
+# Bo qua file qua lon trong archive (chong zip bomb)
+MAX_ENTRY_BYTES = 20 * 1024 * 1024
+
+Upload = namedtuple('Upload', ['filename', 'mimetype', 'stream'])
+# Thay cho bytes khi mot file/archive hong: chi dong ket qua cua no bao loi, cac file khac van chay
+Failed = namedtuple('Failed', ['error'])
+
+# zip hong / sai CRC / loi giai nen / entry ma hoa (RuntimeError) / kieu nen khong ho tro / cat cut
+ZIP_ERRORS = (zipfile.BadZipFile, zlib.error, RuntimeError, NotImplementedError, EOFError)
+
+
+def detach(storages):
+    """Tach stream ra khoi FileStorage.
+
+    Flask dong cac file cua request khi view tra ve, truoc khi response dang
+    stream doc xong, nen generator giu stream va tu dong khi doc xong.
+    """
+    uploads = []
+    for storage in storages:
+        uploads.append(Upload(storage.filename, storage.mimetype, storage.stream))
+        storage.stream = io.BytesIO()
+    return uploads
+
+
+def is_zip(upload):
+    name = (upload.filename or '').lower()
+    return name.endswith('.zip') or upload.mimetype in ('application/zip', 'application/x-zip-compressed')
+
+
+def iter_zip(upload):
+    """Doc lan luot tung anh trong file zip, moi lan chi giu mot anh trong RAM."""
+    try:
+        zf = zipfile.ZipFile(upload.stream)
+    except ZIP_ERRORS as e:
+        yield upload.filename, Failed('Khong doc duoc file zip: %s' % e)
+        return
+    with zf:
+        for info in zf.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            if info.file_size > MAX_ENTRY_BYTES:
+                yield info.filename, Failed('File qua lon')
+                continue
+            try:
+                data = zf.read(info)
+            except ZIP_ERRORS as e:
+                yield info.filename, Failed('Khong giai nen duoc: %s' % e)
+                continue
+            yield info.filename, data
+
+
+def iter_files(uploads):
+    """Sinh (ten file, bytes hoac Failed) tu danh sach file multipart, tu giai nen file zip."""
+    for upload in uploads:
+        try:
+            if is_zip(upload):
+                for item in iter_zip(upload):
+                    yield item
+            else:
+                yield upload.filename, upload.stream.read()
+        finally:
+            upload.stream.close()
+
+
+def chunked(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# model: (ten, phien ban) cua model da tinh ket qua; None khi khong ro (vd. bo phan loai gia)
+CacheEntry = namedtuple('CacheEntry', ['class_index', 'label', 'probabilities', 'model'], defaults=(None,))
+
+
+def content_key(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class PredictionCache(object):
+    """Cache ket qua du doan theo hash noi dung anh, LRU + TTL tuy chon.
+
+    Khi file model thay doi (mtime/size), toan bo cache bi xoa. get(key, model)
+    chi tra ve ket qua cua dung phien ban `model`: request con chay tren model
+    cu co the put sau khi cache da bi xoa luc thay model, ket qua do bi bo qua.
+    """
+
+    def __init__(self, max_entries=10000, ttl=None, model_path=None, check_interval=1.0):
+        self.max_entries = int(max_entries)
+        self.ttl = ttl
+        self.model_path = model_path
+        self.check_interval = check_interval
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._signature = file_signature(model_path) if model_path else None
+        self._last_check = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    def _check_model(self, now):
+        if self.model_path is None or now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        sig = file_signature(self.model_path)
+        if sig != self._signature:
+            self._signature = sig
+            self._data.clear()
+            self.invalidations += 1
+
+    def get(self, key, model=None):
+        if self.max_entries <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._check_model(now)
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            stored_at, entry = item
+            if model is not None and entry.model != model:
+                del self._data[key]
+                self.stale += 1
+                self.misses += 1
+                return None
+            if self.ttl is not None and now - stored_at > self.ttl:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), entry)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def after_fork(self):
+        # lock co the dang bi thread khac giu dung luc fork
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'stale': self.stale,
+            }
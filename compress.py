@@ -0,0 +1,316 @@
+"""Nen model sau khi train: tia (pruning) + luong tu hoa int8 + xuat mang C.
+
+Cac buoc:
+  1. Tia theo do lon trong so: --keep-channels bo bot filter/neuron co
+     tong |w| nho nhat (model nho that su: it flash, it RAM, nhanh hon tren
+     ESP32); --sparsity dat ve 0 cac trong so nho nhat trong moi lop (file
+     .tflite khong nho di nhung nen gzip tot hon). Co du lieu co nhan thi
+     train lai vai epoch sau khi tia.
+  2. Luong tu hoa int8 toan phan (vao/ra int8) voi tap anh dai dien.
+  3. Ghi .tflite; voi --header ghi them mang C (bbgt_model.h) cho
+     BBGTNhungModel.ino.
+  4. So sanh voi model float: kich thuoc, do chinh xac (hoac ti le trung
+     voi float khi khong co nhan), thoi gian moi anh, tensor arena can.
+
+    python compress.py                                  # model ESP32 (BBGT_Nhung/model.h5)
+    python compress.py --dataset Dataset3 --keep-channels 0.5 --finetune-epochs 3
+    python compress.py --header BBGT_Nhung/code_aduino/BBGTNhungModel/bbgt_model.h   # thay model tren chip
+    COMPRESS=1 python main.py                           # chay ngay sau khi train
+
+Arena la uoc tinh: dinh tong kich thuoc tensor trung gian dang song theo
+thu tu chay op; TFLite Micro can them vai KB cho cau truc noi bo.
+"""
+import argparse
+import gzip
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from convert_tflite import representative_images
+
+ESP32_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'BBGT_Nhung')
+FIRMWARE_HEADER = os.path.join(ESP32_DIR, 'code_aduino', 'BBGTNhungModel', 'bbgt_model.h')
+
+
+def load_data(dataset_path, samples=2000, seed=0):
+    """(X float (N,32,32,1) trong [0,1], y int hoac None). Khong co Dataset thi lay anh trong uploads/."""
+    if dataset_path and os.path.isdir(dataset_path):
+        from dataset import load_dataset
+        images, labels, _ = load_dataset(dataset_path)
+        rng = np.random.default_rng(seed)
+        idx = np.sort(rng.permutation(len(images))[:samples])
+        # doc memmap theo chi so tang dan roi moi tron: images.npy xep theo lop, khong tron thi
+        # nua dau/nua sau cua mau chi gom cac lop dau/cuoi
+        order = rng.permutation(len(idx))
+        return images[idx].astype(np.float32)[..., None][order] / 255.0, labels[idx][order]
+    X = np.concatenate(list(representative_images(dataset_path or 'Dataset', samples)))
+    return X, None
+
+
+def split_stratified(y, test_ratio=0.5, seed=0):
+    """Chia chi so (train, test) theo tung lop de ca hai phan deu co du cac lop, da tron."""
+    rng = np.random.default_rng(seed)
+    train, test = [], []
+    for c in np.unique(y):
+        idx = rng.permutation(np.flatnonzero(y == c))
+        n_test = int(round(len(idx) * test_ratio))
+        test.append(idx[:n_test])
+        train.append(idx[n_test:])
+    return rng.permutation(np.concatenate(train)), rng.permutation(np.concatenate(test))
+
+
+def weighted_layers(model):
+    return [layer for layer in model.layers if isinstance(layer, (tf.keras.layers.Conv2D, tf.keras.layers.Dense))]
+
+
+def prune_weights(model, sparsity):
+    """Dat ve 0 ti le `sparsity` trong so co |w| nho nhat cua moi lop; tra ve mask de giu 0 khi train lai."""
+    masks = {}
+    for layer in weighted_layers(model):
+        weights = layer.get_weights()
+        kernel = weights[0]
+        threshold = np.quantile(np.abs(kernel), sparsity)
+        masks[layer.name] = (np.abs(kernel) > threshold).astype(kernel.dtype)
+        layer.set_weights([kernel * masks[layer.name]] + weights[1:])
+    return masks
+
+
+def prune_channels(model, keep):
+    """Model Sequential moi chi giu ti le `keep` filter (Conv2D) / neuron (Dense) co tong |w| lon nhat.
+
+    Lop Dense cuoi (so lop) giu nguyen; lop sau moi lop bi tia bo cac dau vao tuong ung,
+    ke ca qua Flatten (trong so Dense duoc cat theo kenh cua (h, w, c)).
+    """
+    last = weighted_layers(model)[-1]
+    layers = [tf.keras.Input(shape=model.input_shape[1:])]
+    new_weights = []
+    kept = None
+    flatten_shape = None
+    for layer in model.layers:
+        config = layer.get_config()
+        config.pop('batch_input_shape', None)
+        if isinstance(layer, (tf.keras.layers.Conv2D, tf.keras.layers.Dense)):
+            w, b = layer.get_weights()
+            if kept is not None:
+                if flatten_shape is not None:
+                    h, wd, c = flatten_shape
+                    w = w.reshape(h, wd, c, -1)[:, :, kept, :].reshape(h * wd * len(kept), -1)
+                    flatten_shape = None
+                else:
+                    w = w[..., kept, :]
+            kept = None
+            if layer is not last:
+                n = w.shape[-1]
+                score = np.abs(w).reshape(-1, n).sum(axis=0)
+                kept = np.sort(np.argsort(score)[::-1][:max(1, int(round(n * keep)))])
+                w, b = w[..., kept], b[kept]
+                config['filters' if 'filters' in config else 'units'] = len(kept)
+            new_weights.append((len(layers), [w, b]))
+        elif isinstance(layer, tf.keras.layers.Flatten):
+            flatten_shape = layer.input_shape[1:]
+        layers.append(layer.__class__.from_config(config))
+    pruned = tf.keras.Sequential(layers)
+    for i, weights in new_weights:
+        # layers[0] la Input, khong nam trong pruned.layers
+        pruned.layers[i - 1].set_weights(weights)
+    return pruned
+
+
+class _KeepMasks(tf.keras.callbacks.Callback):
+    # giu cac trong so da tia bang 0 trong luc train lai
+    def __init__(self, masks):
+        super(_KeepMasks, self).__init__()
+        self.masks = masks
+
+    def on_train_batch_end(self, batch, logs=None):
+        for layer in weighted_layers(self.model):
+            mask = self.masks.get(layer.name)
+            if mask is not None:
+                weights = layer.get_weights()
+                layer.set_weights([weights[0] * mask] + weights[1:])
+
+
+def finetune(model, X, y, epochs, masks=None, batch_size=32):
+    model.compile(tf.keras.optimizers.Adam(1e-4), loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    model.fit(X, y, batch_size=batch_size, epochs=epochs, validation_split=0.1, verbose=2,
+              callbacks=[_KeepMasks(masks)] if masks else [])
+    return model
+
+
+def to_tflite(model, calibration=None):
+    """calibration=None: TFLite float; co anh: int8 toan phan (vao/ra int8)."""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if calibration is not None:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([x[None]] for x in calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    return converter.convert()
+
+
+def _interpreter(tflite_model):
+    # khong dung XNNPACK: giu dung tung op nhu tren TFLite Micro de tinh arena va do thoi gian
+    return tf.lite.Interpreter(model_content=tflite_model, num_threads=1,
+                               experimental_op_resolver_type=tf.lite.experimental.OpResolverType.
+                               BUILTIN_WITHOUT_DEFAULT_DELEGATES)
+
+
+def arena_estimate(tflite_model):
+    """Dinh tong byte cua cac tensor khong phai hang so dang song, theo thu tu chay op."""
+    interpreter = _interpreter(tflite_model)
+    interpreter.allocate_tensors()
+    tensors = dict((t['index'], t) for t in interpreter.get_tensor_details())
+    ops = interpreter._get_ops_details()
+    produced = dict((i, -1) for i in (d['index'] for d in interpreter.get_input_details()))
+    last_use = {}
+    for n, op in enumerate(ops):
+        for i in op['outputs']:
+            produced.setdefault(i, n)
+        for i in op['inputs']:
+            if i >= 0:
+                last_use[i] = n
+    for d in interpreter.get_output_details():
+        last_use[d['index']] = len(ops)
+    nbytes = dict((i, int(np.prod(tensors[i]['shape'])) * np.dtype(tensors[i]['dtype']).itemsize)
+                  for i in produced)
+    peak = 0
+    for n in range(len(ops)):
+        live = sum(nbytes[i] for i, start in produced.items() if start <= n <= last_use.get(i, start))
+        peak = max(peak, live)
+    return {'peak_bytes': peak, 'ops': len(ops), 'tensors': len(tensors)}
+
+
+def run_tflite(tflite_model, X):
+    """Chay tung anh (batch 1, nhu tren ESP32) -> (xac suat float (N, so lop), ms moi anh)."""
+    interpreter = _interpreter(tflite_model)
+    interpreter.allocate_tensors()
+    inp = interpreter.get_input_details()[0]
+    out = interpreter.get_output_details()[0]
+    in_scale, in_zero = inp['quantization']
+    out_scale, out_zero = out['quantization']
+    probs = []
+    elapsed = []
+    for x in X:
+        if inp['dtype'] == np.int8:
+            x = np.clip(np.round(x / in_scale + in_zero), -128, 127).astype(np.int8)
+        start = time.perf_counter()
+        interpreter.set_tensor(inp['index'], x[None].astype(inp['dtype']))
+        interpreter.invoke()
+        y = interpreter.get_tensor(out['index'])[0]
+        elapsed.append(time.perf_counter() - start)
+        if out['dtype'] == np.int8:
+            y = (y.astype(np.float32) - out_zero) * out_scale
+        probs.append(y)
+    return np.array(probs), 1000.0 * float(np.median(elapsed))
+
+
+def write_c_array(tflite_model, path, name='bbgt_model'):
+    """Ghi mang C giong bbgt_model.h (const + alignas(16): nam trong flash, khong ton RAM cua ESP32)."""
+    guard = name.upper() + '_H'
+    lines = ['#ifndef %s' % guard, '#define %s' % guard, '', '',
+             'const unsigned int %s_len = %d;' % (name, len(tflite_model)),
+             'alignas(16) const unsigned char %s[] = {' % name]
+    data = bytearray(tflite_model)
+    for i in range(0, len(data), 12):
+        lines.append('  ' + ', '.join('0x%02x' % b for b in data[i:i + 12]) + (',' if i + 12 < len(data) else ''))
+    lines += ['};', '', '#endif //%s' % guard, '']
+    with open(path + '.tmp', 'w') as f:
+        f.write('\n'.join(lines))
+    os.replace(path + '.tmp', path)
+
+
+def describe(name, tflite_model, X, y, reference):
+    probs, latency = run_tflite(tflite_model, X)
+    pred = probs.argmax(axis=1)
+    arena = arena_estimate(tflite_model)
+    return {
+        'model': name,
+        'size_kb': round(len(tflite_model) / 1024.0, 1),
+        'gzip_kb': round(len(gzip.compress(bytes(tflite_model))) / 1024.0, 1),
+        'accuracy': round(float(np.mean(pred == y)), 4) if y is not None else None,
+        'agree_float': round(float(np.mean(pred == reference)), 4) if reference is not None else 1.0,
+        'latency_ms': round(latency, 3),
+        'arena_kb': round(arena['peak_bytes'] / 1024.0, 1),
+    }, pred
+
+
+def compress(model, X_train, y_train, X_test, y_test, output='bbgt_model_int8.tflite', header=None,
+             keep_channels=1.0, sparsity=0.0, finetune_epochs=0, calibration_samples=300, arena_kb=32,
+             report=None):
+    """model: Keras da train; X: float (N,32,32,1) trong [0,1]; y: chi so lop (int) hoac None."""
+    rows = []
+    reference_tflite = to_tflite(model)
+    row, reference = describe('float', reference_tflite, X_test, y_test, None)
+    rows.append(row)
+
+    pruned = model
+    masks = None
+    if keep_channels < 1.0:
+        pruned = prune_channels(pruned, keep_channels)
+    if sparsity > 0:
+        if pruned is model:
+            pruned = tf.keras.models.clone_model(model)
+            pruned.set_weights(model.get_weights())
+        masks = prune_weights(pruned, sparsity)
+    if pruned is not model:
+        if finetune_epochs and y_train is not None:
+            finetune(pruned, X_train, y_train, finetune_epochs, masks)
+        rows.append(describe('pruned float', to_tflite(pruned), X_test, y_test, reference)[0])
+
+    quantized = to_tflite(pruned, X_train[:calibration_samples])
+    rows.append(describe('pruned int8' if pruned is not model else 'int8', quantized, X_test, y_test, reference)[0])
+    with open(output, 'wb') as f:
+        f.write(quantized)
+    if header:
+        write_c_array(quantized, header)
+
+    print('%-14s %9s %9s %9s %10s %10s %9s' % ('model', 'KB', 'gzip KB', 'acc', 'khop float', 'ms/anh', 'arena KB'))
+    for r in rows:
+        print('%-14s %9.1f %9.1f %9s %10.4f %10.3f %9.1f' % (
+            r['model'], r['size_kb'], r['gzip_kb'], '-' if r['accuracy'] is None else '%.4f' % r['accuracy'],
+            r['agree_float'], r['latency_ms'], r['arena_kb']))
+    final = rows[-1]
+    if final['arena_kb'] > arena_kb:
+        print('Canh bao: arena uoc tinh %.1f KB > kTensorArenaSize %d KB trong BBGTNhungModel.ino' % (
+            final['arena_kb'], arena_kb))
+    print('Da ghi %s%s' % (output, ' va ' + header if header else ''))
+    if report:
+        with open(report, 'w') as f:
+            json.dump({'rows': rows, 'keep_channels': keep_channels, 'sparsity': sparsity,
+                       'finetune_epochs': finetune_epochs, 'test_images': len(X_test),
+                       'labeled': y_test is not None}, f, indent=1)
+    return quantized, rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tia + luong tu hoa int8 + xuat bbgt_model.h')
+    parser.add_argument('--model', default=os.path.join(ESP32_DIR, 'model.h5'))
+    parser.add_argument('--dataset', default='Dataset',
+                        help='thu muc anh theo lop (nhu main.py); khong co thi dung uploads/')
+    parser.add_argument('--samples', type=int, default=2000, help='so anh lay tu dataset')
+    parser.add_argument('--keep-channels', type=float, default=1.0, help='ti le filter/neuron giu lai (1 = khong tia)')
+    parser.add_argument('--sparsity', type=float, default=0.0, help='ti le trong so dat ve 0 trong moi lop')
+    parser.add_argument('--finetune-epochs', type=int, default=2)
+    parser.add_argument('--calibration-samples', type=int, default=300)
+    parser.add_argument('--output', default=os.path.join(ESP32_DIR, 'bbgt_model_int8.tflite'))
+    parser.add_argument('--header', default=None,
+                        help='ghi them mang C cho firmware, vd. %s (mac dinh khong ghi)' % FIRMWARE_HEADER)
+    parser.add_argument('--arena-kb', type=int, default=32)
+    parser.add_argument('--report', help='ghi bang so sanh ra JSON')
+    args = parser.parse_args()
+
+    model = tf.keras.models.load_model(args.model)
+    X, y = load_data(args.dataset, args.samples)
+    if y is not None:
+        # nua de train lai + hieu chinh int8, nua de danh gia, chia deu theo lop
+        train, test = split_stratified(y)
+        X_train, y_train, X_test, y_test = X[train], y[train], X[test], y[test]
+    else:
+        # chi co vai anh khong nhan: dung chung de hieu chinh va so voi float
+        X_train, y_train, X_test, y_test = X, None, X, None
+    compress(model, X_train, y_train, X_test, y_test, args.output, args.header or None, args.keep_channels,
+             args.sparsity, args.finetune_epochs, args.calibration_samples, args.arena_kb, args.report)
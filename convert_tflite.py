@@ -0,0 +1,50 @@
+import argparse
+import glob
+import os
+import random
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from preprocess import preprocess_image
+
+
+def representative_images(dataset_path, samples):
+    # Lay anh mau tu Dataset/ (nhu main.py), neu khong co thi dung uploads/
+    paths = glob.glob(os.path.join(dataset_path, '*', '*'))
+    if not paths:
+        paths = glob.glob(os.path.join('uploads', '*'))
+    random.shuffle(paths)
+    for path in paths[:samples]:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        yield preprocess_image(img)[None]
+
+
+def convert(model_path, output, int8=False, dataset_path='Dataset', samples=300):
+    model = tf.keras.models.load_model(model_path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if int8:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([x] for x in representative_images(dataset_path, samples))
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    tflite_model = converter.convert()
+    with open(output, 'wb') as f:
+        f.write(tflite_model)
+    print('Da ghi %s (%.1f KB)' % (output, len(tflite_model) / 1024.0))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Chuyen model.h5 sang TFLite (float va int8)')
+    parser.add_argument('--model', default='model.h5')
+    parser.add_argument('--output', default='model.tflite')
+    parser.add_argument('--output-int8', default='model_int8.tflite')
+    parser.add_argument('--dataset', default='Dataset')
+    parser.add_argument('--samples', type=int, default=300)
+    args = parser.parse_args()
+    convert(args.model, args.output)
+    convert(args.model, args.output_int8, int8=True, dataset_path=args.dataset, samples=args.samples)
@@ -0,0 +1,141 @@
+"""Doc Dataset/ song song va cache ket qua tien xu ly ra dia.
+
+Moi lop (thu muc Dataset/<so>) duoc giai ma, chuyen xam va can bang
+histogram tren nhieu process, roi luu thanh mot shard uint8 (N,32,32).
+Lan chay sau chi doc lai cac lop co file thay doi (ten, kich thuoc,
+mtime). Toan bo du lieu duoc ghep thanh images.npy/labels.npy va mo
+bang memmap nen nhieu process co the dung chung ma khong copy.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from preprocess import preprocess_batch
+
+CACHE_DIR = '.dataset_cache'
+IMAGE_SIZE = (32, 32)
+# so file toi da moi task gui sang process pool
+CHUNK_SIZE = 500
+
+
+def _load_chunk(paths):
+    imgs = [img for img in (cv2.imread(path) for path in paths) if img is not None]
+    return preprocess_batch(imgs, IMAGE_SIZE, dtype=np.uint8)[..., 0]
+
+
+def _executor(workers):
+    # main.py la script khong co `if __name__ == '__main__'`: voi 'spawn' (Windows)
+    # process con se chay lai ca script, nen chi dung process khi co 'fork'.
+    # cv2.imread/equalizeHist nha GIL nen thread van chay song song duoc.
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+    return ThreadPoolExecutor(max_workers=workers or os.cpu_count())
+
+
+def list_classes(path):
+    return sorted((d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d)) and d.isdigit()), key=int)
+
+
+def class_signature(class_dir):
+    files = sorted(os.listdir(class_dir))
+    h = hashlib.sha1()
+    for name in files:
+        st = os.stat(os.path.join(class_dir, name))
+        h.update(('%s|%d|%d\n' % (name, st.st_size, st.st_mtime_ns)).encode())
+    return files, h.hexdigest()
+
+
+def _save(path, arr):
+    tmp = path + '.tmp.npy'
+    np.save(tmp, arr)
+    os.replace(tmp, path)
+
+
+def build_cache(path='Dataset', cache_dir=CACHE_DIR, workers=None, verbose=True):
+    """Cap nhat cache, tra ve duong dan (images.npy, labels.npy)."""
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest_path = os.path.join(cache_dir, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    shards = manifest.get('shards', {})
+
+    classes = list_classes(path)
+    todo = {}
+    signatures = {}
+    for c in classes:
+        class_dir = os.path.join(path, c)
+        files, sig = class_signature(class_dir)
+        signatures[c] = sig
+        shard = os.path.join(cache_dir, 'class_%s.npy' % c)
+        if shards.get(c, {}).get('signature') != sig or not os.path.exists(shard):
+            todo[c] = [os.path.join(class_dir, name) for name in files]
+
+    if todo:
+        if verbose:
+            print('Dang doc lai %d/%d lop: %s' % (len(todo), len(classes), ' '.join(todo)))
+        with _executor(workers) as pool:
+            futures = {}
+            for c, paths in todo.items():
+                futures[c] = [pool.submit(_load_chunk, paths[i:i + CHUNK_SIZE])
+                              for i in range(0, len(paths), CHUNK_SIZE)]
+            for c, parts in futures.items():
+                arrays = [f.result() for f in parts]
+                arr = np.concatenate(arrays) if arrays else np.empty((0,) + IMAGE_SIZE[::-1], np.uint8)
+                _save(os.path.join(cache_dir, 'class_%s.npy' % c), arr)
+                shards[c] = {'signature': signatures[c], 'count': int(len(arr))}
+
+    images_path = os.path.join(cache_dir, 'images.npy')
+    labels_path = os.path.join(cache_dir, 'labels.npy')
+    removed = set(shards) - set(classes)
+    for c in removed:
+        del shards[c]
+    if todo or removed or manifest.get('classes') != classes or not os.path.exists(images_path):
+        # ghep cac shard vao mot file memmap duy nhat, khong can giu tat ca trong RAM
+        total = sum(shards[c]['count'] for c in classes)
+        images = np.lib.format.open_memmap(images_path + '.tmp.npy', mode='w+', dtype=np.uint8,
+                                           shape=(total,) + IMAGE_SIZE[::-1])
+        labels = np.empty(total, dtype=np.int32)
+        pos = 0
+        for c in classes:
+            shard = np.load(os.path.join(cache_dir, 'class_%s.npy' % c), mmap_mode='r')
+            images[pos:pos + len(shard)] = shard
+            labels[pos:pos + len(shard)] = int(c)
+            pos += len(shard)
+        images.flush()
+        del images
+        os.replace(images_path + '.tmp.npy', images_path)
+        _save(labels_path, labels)
+
+    manifest = {'classes': classes, 'shards': shards, 'image_size': list(IMAGE_SIZE)}
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return images_path, labels_path
+
+
+def load_dataset(path='Dataset', cache_dir=CACHE_DIR, workers=None, verbose=True):
+    """Tra ve (images uint8 (N,32,32) dang memmap, labels int32, so lop)."""
+    images_path, labels_path = build_cache(path, cache_dir, workers, verbose)
+    images = np.load(images_path, mmap_mode='r')
+    labels = np.load(labels_path)
+    return images, labels, len(list_classes(path))
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description='Tao/cap nhat cache tien xu ly cho Dataset/')
+    parser.add_argument('--path', default='Dataset')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    start = time.time()
+    images, labels, n = load_dataset(args.path, args.cache_dir, args.workers)
+    print('%d anh, %d lop, %.1fs' % (len(images), n, time.time() - start))
@@ -0,0 +1,76 @@
+import struct
+
+import cv2
+import numpy as np
+
+# Kich thuoc dau vao cua model
+INPUT_SIZE = (32, 32)
+
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# Cac marker SOF cua JPEG (bo qua DHT/JPG/DAC: C4, C8, CC)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def is_jpeg(data):
+    return data[:3] == b'\xff\xd8\xff'
+
+
+def jpeg_size(data):
+    """Doc (width, height) tu header JPEG ma khong can giai ma anh."""
+    if not is_jpeg(data):
+        return None
+    i, n = 2, len(data)
+    while i + 4 <= n:
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        seg_len = struct.unpack('>H', data[i + 2:i + 4])[0]
+        if marker in _SOF_MARKERS:
+            if i + 9 > n:
+                return None
+            h, w = struct.unpack('>HH', data[i + 5:i + 9])
+            return w, h
+        if marker == 0xDA:
+            return None
+        i += 2 + seg_len
+    return None
+
+
+def decode_flag(data, size=INPUT_SIZE):
+    """Chon co giai ma: JPEG lon thi giai ma o do phan giai 1/2, 1/4, 1/8."""
+    dims = jpeg_size(data)
+    if dims is None:
+        return cv2.IMREAD_COLOR
+    w, h = dims
+    for factor, flag in _REDUCED_FLAGS:
+        if w // factor >= size[0] and h // factor >= size[1]:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def decode_image(data, size=INPUT_SIZE):
+    """Giai ma anh (bytes) trong bo nho va resize mot lan ve `size`.
+
+    Tra ve anh BGR uint8, hoac None neu khong doc duoc.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if buf.size == 0:
+        return None
+    img = cv2.imdecode(buf, decode_flag(data, size))
+    if img is None:
+        return None
+    if (img.shape[1], img.shape[0]) != tuple(size):
+        img = cv2.resize(img, tuple(size), interpolation=cv2.INTER_AREA)
+    return img
@@ -0,0 +1,292 @@
+"""Gia lap duong inference cua BBGTNhungModel.ino tren may tinh.
+
+Lam lai tung buoc cua firmware bang numpy, dung tung phep tinh so nguyen/
+float32 nhu code C:
+  1. camera: frame QVGA 320x240 xam (PIXFORMAT_GRAYSCALE);
+  2. resize_image_to_32x32: lay diem gan nhat, ti le float, cat (int);
+  3. grayscale: trung binh cong 3 byte / pixel. Anh da xam (1 byte/pixel)
+     nhung ham van doc 3 byte, tuc doc qua cuoi image_data[1024] toi 3072
+     byte; tren chip la byte cua bien nam sau, o day thay bang `oob_fill`;
+  4. equalize: histogram + round() cua firmware (khong phai cv2.equalizeHist);
+  5. dau vao float (/255.0f) hoac int8 (roundf theo scale/zero_point).
+
+Model lay thang tu mang C trong bbgt_model.h (dung thu duoc nap vao chip).
+Bao cao: arena can (uoc tinh, so voi kTensorArenaSize 32 KB), thoi gian
+tung op tren ESP32 (uoc tinh theo so MAC x chu ky/MAC o 240 MHz, kernel
+tham chieu cua TFLite Micro) va ti le du doan trung voi model.h5 chay nhu
+tren may tinh (preprocess.py). TFLite Micro khong co ban Python nen arena
+khong cap phat that duoc: dinh tensor trung gian (compress.arena_estimate)
++ phan co dinh (tensor, node, tham so luong tu hoa tung kenh).
+
+    python emulate_esp32.py                              # bbgt_model.h + model.h5 voi uploads/
+    python emulate_esp32.py --model BBGT_Nhung/bbgt_model_int8.tflite --images Dataset3 --report esp32.json
+"""
+import argparse
+import glob
+import json
+import os
+import re
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from compress import ESP32_DIR, FIRMWARE_HEADER, _interpreter, arena_estimate, run_tflite
+from preprocess import preprocess_batch
+
+# Tu BBGTNhungModel.ino
+FRAME_SIZE = (320, 240)  # FRAMESIZE_QVGA
+IMAGE_SIZE = (32, 32)
+TENSOR_ARENA_BYTES = 32 * 1024
+DETECTION_THRESHOLD = 0.8
+CPU_MHZ = 240
+# Chu ky / MAC cua kernel tham chieu TFLite Micro tren Xtensa LX6 (khong ESP-NN), uoc luong tho
+CYCLES_PER_MAC = {np.float32: 12.0, np.int8: 6.0}
+CYCLES_PER_ELEMENT = 4.0
+# Phan co dinh trong arena (byte): moi tensor (TfLiteEvalTensor), moi op (node + op data),
+# tensor vao/ra (TfLiteTensor) va moi kenh ra cua conv/dense int8 (multiplier + shift)
+PERSISTENT_PER_TENSOR = 16
+PERSISTENT_PER_OP = 64
+PERSISTENT_IO = 2 * 64
+PERSISTENT_PER_CHANNEL = 8
+
+
+def load_model_bytes(path):
+    """.tflite, hoac mang C (bbgt_model.h) -> bytes cua flatbuffer."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not path.endswith('.h'):
+        return data
+    text = data.decode('latin-1')
+    body = text[text.index('{', text.index('[]')) + 1:text.index('}', text.index('[]'))]
+    return bytes(int(x, 16) for x in re.findall(r'0x([0-9a-fA-F]{2})', body))
+
+
+def camera_frame(img, size=FRAME_SIZE):
+    """Anh BGR -> frame xam nhu camera (Y = 0.299R + 0.587G + 0.114B)."""
+    frame = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+
+def firmware_resize(frame, size=IMAGE_SIZE):
+    """resize_image_to_32x32: srcX = (int)(x * (W / 32.0f)), gioi han W-1."""
+    h, w = frame.shape
+    sx = np.minimum((np.arange(size[0], dtype=np.float32) * np.float32(w / np.float32(size[0]))).astype(int), w - 1)
+    sy = np.minimum((np.arange(size[1], dtype=np.float32) * np.float32(h / np.float32(size[1]))).astype(int), h - 1)
+    return frame[sy][:, sx]
+
+
+def firmware_grayscale(buf, oob_fill=0):
+    """grayscale(): (b[3i] + b[3i+1] + b[3i+2]) / 3 tren bo dem 1 byte/pixel (doc qua cuoi bo dem)."""
+    flat = buf.reshape(-1).astype(np.int32)
+    n = flat.size
+    padded = np.full(3 * n, oob_fill, dtype=np.int32)
+    padded[:n] = flat
+    return (padded.reshape(n, 3).sum(axis=1) // 3).astype(np.uint8).reshape(buf.shape)
+
+
+def firmware_equalize(gray):
+    """equalize(): tra ve (anh, True neu anh mot mau - chia cho 0 tren chip, hanh vi khong xac dinh)."""
+    n = gray.size
+    cum = np.cumsum(np.bincount(gray.reshape(-1), minlength=256))
+    min_cum = int(cum[cum > 0].min())
+    if n == min_cum:
+        return np.zeros_like(gray), True
+    scale = 255.0 / (n - min_cum)
+    # round() cua C: lam tron ra xa 0 (np.round lam tron ve so chan)
+    lut = np.trunc((cum - min_cum) * scale + np.copysign(0.5, cum - min_cum)).astype(np.int32)
+    return lut[gray].astype(np.uint8), False
+
+
+def firmware_input(equalized, detail):
+    """preprocess_image (float) / preprocess_image_int8 -> tensor (1,32,32,1)."""
+    x = equalized.astype(np.float32) / np.float32(255.0)
+    if detail['dtype'] == np.int8:
+        scale, zero = detail['quantization']
+        q = x / np.float32(scale)
+        x = np.clip(np.trunc(q + np.copysign(np.float32(0.5), q)).astype(np.int32) + zero, -128, 127)
+    return x.astype(detail['dtype'])[None, ..., None]
+
+
+def firmware_predict(tflite_model, frames, oob_fill=0, fix_grayscale=False):
+    """Chay loop() cho tung frame -> (xac suat (N, so lop), dau vao 0..255 (N,32,32), so anh mot mau)."""
+    interpreter = _interpreter(tflite_model)
+    interpreter.allocate_tensors()
+    inp = interpreter.get_input_details()[0]
+    out = interpreter.get_output_details()[0]
+    probs, inputs, flat = [], [], 0
+    for frame in frames:
+        small = firmware_resize(frame)
+        gray = small if fix_grayscale else firmware_grayscale(small, oob_fill)
+        equalized, degenerate = firmware_equalize(gray)
+        flat += degenerate
+        interpreter.set_tensor(inp['index'], firmware_input(equalized, inp))
+        interpreter.invoke()
+        y = interpreter.get_tensor(out['index'])[0]
+        if out['dtype'] == np.int8:
+            # outputProbability()
+            scale, zero = out['quantization']
+            y = (y.astype(np.float32) - zero) * scale
+        probs.append(y)
+        inputs.append(equalized)
+    return np.array(probs), np.array(inputs), flat
+
+
+def op_costs(tflite_model, mhz=CPU_MHZ, cycles_per_mac=None):
+    """Tung op: ten, so MAC, kenh ra (cho tham so luong tu hoa) va thoi gian uoc tinh tren ESP32 (ms)."""
+    cycles_per_mac = cycles_per_mac or CYCLES_PER_MAC
+    interpreter = _interpreter(tflite_model)
+    interpreter.allocate_tensors()
+    tensors = dict((t['index'], t) for t in interpreter.get_tensor_details())
+    rows = []
+    for op in interpreter._get_ops_details():
+        name = op['op_name']
+        out = tensors[op['outputs'][0]]
+        out_elems = int(np.prod(out['shape']))
+        inputs = [tensors[i] for i in op['inputs'] if i >= 0]
+        channels = 0
+        if name == 'CONV_2D':
+            # filter (out, kh, kw, in)
+            kernel = inputs[1]['shape']
+            macs = out_elems * int(np.prod(kernel[1:]))
+            channels = int(kernel[0])
+        elif name == 'DEPTHWISE_CONV_2D':
+            kernel = inputs[1]['shape']
+            macs = out_elems * int(kernel[1] * kernel[2])
+            channels = int(kernel[3])
+        elif name == 'FULLY_CONNECTED':
+            weights = inputs[1]['shape']
+            macs = out_elems * int(weights[-1])
+            channels = int(weights[0])
+        elif name in ('MAX_POOL_2D', 'AVERAGE_POOL_2D', 'MEAN'):
+            macs = int(np.prod(inputs[0]['shape']))
+        else:
+            macs = 0
+        dtype = np.int8 if out['dtype'] == np.int8 else np.float32
+        cycles = macs * cycles_per_mac[dtype] + out_elems * CYCLES_PER_ELEMENT
+        rows.append({'op': name, 'output': [int(d) for d in out['shape']], 'macs': macs,
+                     'channels': channels if dtype == np.int8 else 0, 'esp32_ms': cycles / (mhz * 1000.0)})
+    return rows
+
+
+def arena_report(tflite_model, ops, budget=TENSOR_ARENA_BYTES):
+    """Arena can = dinh tensor trung gian + phan co dinh (uoc tinh)."""
+    activations = arena_estimate(tflite_model)
+    persistent = (PERSISTENT_PER_TENSOR * activations['tensors'] + PERSISTENT_PER_OP * activations['ops'] +
+                  PERSISTENT_IO + PERSISTENT_PER_CHANNEL * sum(op['channels'] for op in ops))
+    total = activations['peak_bytes'] + persistent
+    return {'activations_bytes': activations['peak_bytes'], 'persistent_bytes': persistent, 'total_bytes': total,
+            'budget_bytes': budget, 'fits': total <= budget}
+
+
+def find_images(paths):
+    """File anh (thu muc thi lay ca thu muc con). Thu muc cha so (Dataset/<lop>/) -> nhan, khong thi None."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(p for p in glob.glob(os.path.join(path, '**', '*'), recursive=True) if os.path.isfile(p))
+        else:
+            files += sorted(glob.glob(path))
+    images, labels = [], []
+    for path in files:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        parent = os.path.basename(os.path.dirname(path))
+        images.append(img)
+        labels.append(int(parent) if parent.isdigit() else None)
+    if any(label is None for label in labels):
+        labels = None
+    return images, labels
+
+
+def compare(name, probs, reference, labels):
+    pred = probs.argmax(axis=1)
+    return {
+        'path': name,
+        'agree_desktop': round(float(np.mean(pred == reference.argmax(axis=1))), 4),
+        'mean_abs_prob_diff': round(float(np.abs(probs - reference).mean()), 4),
+        'accuracy': round(float(np.mean(pred == np.array(labels))), 4) if labels else None,
+        'detections': round(float(np.mean(probs.max(axis=1) > DETECTION_THRESHOLD)), 4),
+    }
+
+
+def emulate(model_path, keras_path, images, labels=None, oob_fill=0, mhz=CPU_MHZ, budget=TENSOR_ARENA_BYTES):
+    tflite_model = load_model_bytes(model_path)
+    frames = [camera_frame(img) for img in images]
+
+    # may tinh: INTER_AREA + cvtColor + cv2.equalizeHist tren anh mau goc (preprocess.py)
+    X = preprocess_batch(images)
+    reference = tf.keras.models.load_model(keras_path).predict(X, verbose=0)
+    host, host_ms = run_tflite(tflite_model, X)
+    device, device_inputs, flat = firmware_predict(tflite_model, frames, oob_fill)
+    fixed, fixed_inputs, _ = firmware_predict(tflite_model, frames, fix_grayscale=True)
+
+    ops = op_costs(tflite_model, mhz)
+    arena = arena_report(tflite_model, ops, budget)
+    rows = [compare('model.h5, preprocess.py', reference, reference, labels),
+            compare('tflite, preprocess.py', host, reference, labels),
+            compare('firmware', device, reference, labels),
+            compare('firmware, bo grayscale()', fixed, reference, labels)]
+    desktop_inputs = X[..., 0] * 255.0
+    return {
+        'model': model_path,
+        'model_bytes': len(tflite_model),
+        'images': len(images),
+        'arena': arena,
+        'ops': ops,
+        'esp32_ms': sum(op['esp32_ms'] for op in ops),
+        'host_ms': host_ms,
+        'rows': rows,
+        'input_mean_abs_diff': {
+            'firmware': round(float(np.abs(device_inputs - desktop_inputs).mean()), 2),
+            'firmware, bo grayscale()': round(float(np.abs(fixed_inputs - desktop_inputs).mean()), 2),
+        },
+        'flat_images': flat,
+        'oob_fill': oob_fill,
+    }
+
+
+def print_report(report):
+    arena = report['arena']
+    print('%s: %.1f KB flash, %d anh' % (report['model'], report['model_bytes'] / 1024.0, report['images']))
+    print('\n%-20s %14s %12s %10s' % ('op', 'dau ra', 'MAC', 'ESP32 ms'))
+    for op in report['ops']:
+        print('%-20s %14s %12d %10.2f' % (op['op'], 'x'.join(str(d) for d in op['output'][1:]), op['macs'],
+                                           op['esp32_ms']))
+    print('%-20s %14s %12d %10.2f  (may nay %.3f ms)' % ('tong', '', sum(op['macs'] for op in report['ops']),
+                                                         report['esp32_ms'], report['host_ms']))
+    print('\nArena: %.1f KB tensor + %.1f KB co dinh = %.1f KB / %.0f KB -> %s' % (
+        arena['activations_bytes'] / 1024.0, arena['persistent_bytes'] / 1024.0, arena['total_bytes'] / 1024.0,
+        arena['budget_bytes'] / 1024.0, 'vua' if arena['fits'] else 'KHONG DU, AllocateTensors() se loi'))
+    print('\n%-26s %10s %10s %9s %10s' % ('duong chay', 'khop h5', '|dp| TB', 'acc', '>%.1f' % DETECTION_THRESHOLD))
+    for r in report['rows']:
+        print('%-26s %10.4f %10.4f %9s %10.4f' % (r['path'], r['agree_desktop'], r['mean_abs_prob_diff'],
+                                                  '-' if r['accuracy'] is None else '%.4f' % r['accuracy'],
+                                                  r['detections']))
+    for name, diff in report['input_mean_abs_diff'].items():
+        print('Dau vao %s lech TB %.2f/255 so voi preprocess.py' % (name, diff))
+    if report['flat_images']:
+        print('Canh bao: %d anh mot mau sau grayscale(): equalize() chia cho 0 tren chip' % report['flat_images'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gia lap resize/tien xu ly/inference cua BBGTNhungModel.ino')
+    parser.add_argument('--model', default=FIRMWARE_HEADER, help='bbgt_model.h (mang C) hoac .tflite')
+    parser.add_argument('--keras', default=os.path.join(ESP32_DIR, 'model.h5'), help='model tham chieu')
+    parser.add_argument('--images', nargs='+', default=None,
+                        help='file/thu muc anh (Dataset/<lop>/ thi co nhan); mac dinh Dataset hoac uploads/')
+    parser.add_argument('--oob-fill', type=int, default=0,
+                        help='gia tri byte grayscale() doc qua cuoi image_data (khong biet truoc tren chip)')
+    parser.add_argument('--mhz', type=int, default=CPU_MHZ)
+    parser.add_argument('--arena-kb', type=int, default=TENSOR_ARENA_BYTES // 1024)
+    parser.add_argument('--report', help='ghi bao cao ra JSON')
+    args = parser.parse_args()
+    images, labels = find_images(args.images or (['Dataset'] if os.path.isdir('Dataset') else ['uploads']))
+    if not images:
+        parser.error('khong co anh nao')
+    report = emulate(args.model, args.keras, images, labels, args.oob_fill, args.mhz, args.arena_kb * 1024)
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=1)
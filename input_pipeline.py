@@ -0,0 +1,123 @@
+"""Pipeline tf.data thay cho ImageDataGenerator.flow/fit_generator.
+
+Tang cuong du lieu (dich, zoom, shear, xoay - cung tham so voi main.py)
+duoc tinh cho ca batch mot lan bang ImageProjectiveTransformV3, chay song
+song voi buoc train nho num_parallel_calls + prefetch.
+
+Do toc do (chi phan du lieu): python input_pipeline.py --steps 200
+Do ca buoc train voi myModel:   INPUT_PIPELINE=benchmark python main.py
+"""
+import math
+import time
+
+import numpy as np
+import tensorflow as tf
+
+AUTOTUNE = tf.data.AUTOTUNE
+
+# Giong ImageDataGenerator trong main.py (shear_range tinh bang do)
+AUGMENT = dict(width_shift_range=0.1, height_shift_range=0.1, zoom_range=0.2, shear_range=0.1, rotation_range=10)
+
+
+def random_affine(images, width_shift_range=0.1, height_shift_range=0.1, zoom_range=0.2,
+                  shear_range=0.1, rotation_range=10):
+    """Bien doi affine ngau nhien cho ca batch (N,H,W,C), fill_mode='nearest'."""
+    shape = tf.shape(images)
+    n = shape[0]
+    h = tf.cast(shape[1], tf.float32)
+    w = tf.cast(shape[2], tf.float32)
+
+    def uniform(r):
+        return tf.random.uniform([n], -r, r)
+
+    theta = uniform(rotation_range) * (math.pi / 180.0)
+    shear = uniform(shear_range) * (math.pi / 180.0)
+    zx = tf.random.uniform([n], 1.0 - zoom_range, 1.0 + zoom_range)
+    zy = tf.random.uniform([n], 1.0 - zoom_range, 1.0 + zoom_range)
+    tx = uniform(width_shift_range) * w
+    ty = uniform(height_shift_range) * h
+
+    # A = xoay . shear . zoom, anh xa toa do dau ra -> dau vao quanh tam anh
+    cos, sin = tf.cos(theta), tf.sin(theta)
+    a00 = cos * zx
+    a01 = (-cos * tf.sin(shear) - sin * tf.cos(shear)) * zy
+    a10 = sin * zx
+    a11 = (-sin * tf.sin(shear) + cos * tf.cos(shear)) * zy
+    cx = (w - 1.0) / 2.0
+    cy = (h - 1.0) / 2.0
+    a02 = cx - a00 * cx - a01 * cy + tx
+    a12 = cy - a10 * cx - a11 * cy + ty
+    zeros = tf.zeros([n])
+    transforms = tf.stack([a00, a01, a02, a10, a11, a12, zeros, zeros], axis=1)
+    return tf.raw_ops.ImageProjectiveTransformV3(
+        images=images, transforms=transforms, output_shape=shape[1:3],
+        fill_value=0.0, interpolation='BILINEAR', fill_mode='NEAREST')
+
+
+def _normalize(images):
+    if images.dtype == tf.uint8:
+        return tf.cast(images, tf.float32) / 255.0
+    return tf.cast(images, tf.float32)
+
+
+def make_dataset(X, y, batch_size=32, augment=True, shuffle=True, cache=True, repeat=True, seed=None):
+    """Tao tf.data.Dataset tu mang numpy (uint8 hoac float, shape (N,32,32,1))."""
+    ds = tf.data.Dataset.from_tensor_slices((X, y))
+    if cache:
+        ds = ds.cache()
+    if shuffle:
+        ds = ds.shuffle(min(len(X), 10000), seed=seed, reshuffle_each_iteration=True)
+    if repeat:
+        ds = ds.repeat()
+    ds = ds.batch(batch_size, drop_remainder=repeat)
+    if augment:
+        ds = ds.map(lambda images, labels: (random_affine(_normalize(images), **AUGMENT), labels),
+                    num_parallel_calls=AUTOTUNE, deterministic=False)
+    else:
+        ds = ds.map(lambda images, labels: (_normalize(images), labels), num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE)
+
+
+def _rate(iterator, steps, step_fn=None):
+    next(iterator)
+    start = time.perf_counter()
+    for _ in range(steps):
+        batch = next(iterator)
+        if step_fn is not None:
+            step_fn(*batch)
+    return steps / (time.perf_counter() - start)
+
+
+def benchmark(X, y, batch_size=32, steps=200, model=None):
+    """So sanh so buoc/giay giua ImageDataGenerator.flow va tf.data.
+
+    Neu co `model`, moi buoc con chay them train_on_batch (giong luc train that).
+    """
+    from keras.preprocessing.image import ImageDataGenerator
+    dataGen = ImageDataGenerator(**AUGMENT)
+    step_fn = None
+    if model is not None:
+        def step_fn(images, labels):
+            model.train_on_batch(images, labels)
+    results = {}
+    results['generator'] = _rate(iter(dataGen.flow(X, y, batch_size=batch_size)), steps, step_fn)
+    results['tfdata'] = _rate(iter(make_dataset(X, y, batch_size)), steps, step_fn)
+    for name, rate in results.items():
+        print('%-10s %8.1f buoc/s' % (name, rate))
+    print('tf.data nhanh hon %.1f lan' % (results['tfdata'] / results['generator']))
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+    from keras.utils import to_categorical
+    from dataset import load_dataset
+    parser = argparse.ArgumentParser(description='Do toc do pipeline du lieu: ImageDataGenerator vs tf.data')
+    parser.add_argument('--path', default='Dataset')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--steps', type=int, default=200)
+    args = parser.parse_args()
+    images, classNo, noOfClasses = load_dataset(args.path)
+    X = (np.asarray(images, dtype=np.float32) / 255).reshape(-1, 32, 32, 1)
+    y = to_categorical(classNo, noOfClasses)
+    benchmark(X, y, args.batch_size, args.steps)
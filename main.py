@@ -6,12 +6,15 @@ from keras.optimizers import Adam
 from keras.utils import to_categorical
 from keras.layers import Dropout, Flatten
 from keras.layers import Conv2D, MaxPooling2D
-import cv2
 from sklearn.model_selection import train_test_split
 import os
 import pandas as pd
 from keras.preprocessing.image import ImageDataGenerator
+from dataset import load_dataset
  
+# generator: ImageDataGenerator + fit_generator (cu) | tfdata: input_pipeline.py
+# benchmark: chi do so buoc/giay cua hai cach roi thoat
+INPUT_PIPELINE = os.environ.get('INPUT_PIPELINE', 'generator')
 path = "Dataset" 
 labelFile = 'labels.csv' 
 batch_size_val=32 
@@ -20,24 +23,10 @@ imageDimesions = (32,32,3)
 testRatio = 0.2    
 validationRatio = 0.2 
 
-count = 0
-images = []
-classNo = []
-myList = os.listdir(path)
-print("Tổng số nhãn được phát hiện:",len(myList))
-noOfClasses=len(myList)
 print("Đang khởi tạo.....")
-for x in range (0,len(myList)):
-    myPicList = os.listdir(path+"/"+str(count))
-    for y in myPicList:
-        curImg = cv2.imread(path+"/"+str(count)+"/"+y)
-        images.append(curImg)
-        classNo.append(count)
-    print(count, end =" ")
-    count +=1
-print(" ")
-images = np.array(images)
-classNo = np.array(classNo)
+# Doc song song + cache uint8 (xam, can bang histogram) trong .dataset_cache/
+images, classNo, noOfClasses = load_dataset(path)
+print("Tổng số nhãn được phát hiện:",noOfClasses)
  
 X_train, X_test, y_train, y_test = train_test_split(images, classNo, test_size=testRatio)
 X_train, X_validation, y_train, y_validation = train_test_split(X_train, y_train, test_size=validationRatio)
@@ -53,21 +42,10 @@ data=pd.read_csv(labelFile)
 print("data shape ",data.shape,type(data))
 
 
-def grayscale(img):
-    img = cv2.cvtColor(img,cv2.COLOR_BGR2GRAY)
-    return img
-def equalize(img):
-    img =cv2.equalizeHist(img)
-    return img
-def preprocessing(img):
-    img = grayscale(img)     
-    img = equalize(img)      
-    img = img/255            
-    return img
- 
-X_train=np.array(list(map(preprocessing,X_train)))  
-X_validation=np.array(list(map(preprocessing,X_validation)))
-X_test=np.array(list(map(preprocessing,X_test)))
+# Anh trong cache da duoc chuyen xam + can bang histogram, chi con chuan hoa ve [0,1]
+X_train=X_train.astype(np.float32)/255
+X_validation=X_validation.astype(np.float32)/255
+X_test=X_test.astype(np.float32)/255
 
 
 X_train=X_train.reshape(X_train.shape[0],X_train.shape[1],X_train.shape[2],1)
@@ -110,7 +88,15 @@ def myModel():
  
 model = myModel()
 print(model.summary())
-history=model.fit_generator(dataGen.flow(X_train,y_train,batch_size=32),steps_per_epoch=len(X_train)//32,epochs=epochs_val,validation_data=(X_validation,y_validation),shuffle=1)
+if INPUT_PIPELINE == 'benchmark':
+    from input_pipeline import benchmark
+    benchmark(X_train,y_train,batch_size_val,model=model)
+    raise SystemExit
+if INPUT_PIPELINE == 'tfdata':
+    from input_pipeline import make_dataset
+    history=model.fit(make_dataset(X_train,y_train,batch_size_val),steps_per_epoch=len(X_train)//batch_size_val,epochs=epochs_val,validation_data=(X_validation,y_validation))
+else:
+    history=model.fit_generator(dataGen.flow(X_train,y_train,batch_size=32),steps_per_epoch=len(X_train)//32,epochs=epochs_val,validation_data=(X_validation,y_validation),shuffle=1)
  
 plt.figure(1)
 plt.plot(history.history['loss'])
@@ -129,4 +115,13 @@ score =model.evaluate(X_test,y_test,verbose=0)
 print('Test Score:',score[0])
 print('Test Accuracy:',score[1])
  
-model.save("model.h5")
\ No newline at end of file
+model.save("model.h5")
+
+# COMPRESS=1: tia + luong tu hoa int8 ngay sau khi train (compress.py), ghi model_int8.tflite + bao cao
+if os.environ.get('COMPRESS', '0') == '1':
+    from compress import compress
+    compress(model, X_train, np.argmax(y_train, axis=1), X_test, np.argmax(y_test, axis=1),
+             output='model_int8.tflite', header=os.environ.get('COMPRESS_HEADER') or None,
+             keep_channels=float(os.environ.get('COMPRESS_KEEP_CHANNELS', 1.0)),
+             sparsity=float(os.environ.get('COMPRESS_SPARSITY', 0.0)),
+             finetune_epochs=int(os.environ.get('COMPRESS_FINETUNE_EPOCHS', 2)), report='compress_report.json')
@@ -0,0 +1,232 @@
+"""Do thoi gian tung buoc va xuat dang Prometheus text (/metrics).
+
+    metrics = Metrics()
+    with metrics.stage('decode'):
+        img = decode_image(data)
+    metrics.inc('requests_total', endpoint='/predict', status='200')
+    metrics.render()          # text cho /metrics
+    metrics.summary()         # {buoc: ms gan day} cho overlay / log
+
+Metrics(enabled=False) thi moi ham tra ve ngay (stage() va time() tra ve mot context
+manager dung chung, khong goi perf_counter), de co the de san trong code.
+"""
+import bisect
+import threading
+import time
+
+import cv2
+
+# giay; du chi tiet cho buoc < 1 ms (tien xu ly, tra nhan) lan request vai giay
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+
+
+def _labels_text(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                             for k, v in labels)
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Histogram(object):
+    def __init__(self, buckets=DEFAULT_BUCKETS, alpha=0.1):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        # trung binh luy thua (EMA) de hien thi "gan day" tren overlay
+        self.alpha = alpha
+        self.recent = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent = value if self.recent is None else self.recent + self.alpha * (value - self.recent)
+
+
+class _Timer(object):
+    __slots__ = ('metrics', 'key', 'start')
+
+    def __init__(self, metrics, key):
+        self.metrics = metrics
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics._observe(self.key, time.perf_counter() - self.start)
+
+
+class _NoTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+class Metrics(object):
+    """Counter, gauge va histogram co nhan, an toan khi goi tu nhieu thread."""
+
+    def __init__(self, enabled=True, prefix='bbgt', buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[(name, _key(labels))] = value
+
+    def add(self, name, value, **labels):
+        # gauge tang/giam (vd. so request dang xu ly)
+        if not self.enabled:
+            return
+        key = (name, _key(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        if self.enabled:
+            self._observe((name, _key(labels)), seconds)
+
+    def _observe(self, key, seconds):
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram(self.buckets)
+            hist.observe(seconds)
+
+    def time(self, name='stage_seconds', **labels):
+        """Context manager ghi thoi gian vao histogram `name`."""
+        if not self.enabled:
+            return _NO_TIMER
+        return _Timer(self, (name, _key(labels)))
+
+    def stage(self, stage):
+        if not self.enabled:
+            return _NO_TIMER
+        return _Timer(self, ('stage_seconds', (('stage', stage),)))
+
+    def timed(self, stage, fn):
+        """Boc ham `fn` de moi lan goi duoc tinh vao buoc `stage`."""
+        if not self.enabled:
+            return fn
+
+        def wrapper(*args, **kwargs):
+            with self.stage(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def collect(self, fn):
+        # fn() -> list (ten, 'gauge' | 'counter', {nhan}, gia tri), goi luc render
+        self._collectors.append(fn)
+
+    def summary(self, name='stage_seconds', label='stage'):
+        """{gia tri nhan: ms trung binh gan day} cua mot histogram, theo thu tu ghi lan dau."""
+        with self._lock:
+            return dict((dict(labels).get(label), hist.recent * 1000.0)
+                        for (n, labels), hist in self._histograms.items() if n == name and hist.count)
+
+    def summary_text(self, name='stage_seconds', label='stage'):
+        return '  '.join('%s %.1f' % (stage, ms) for stage, ms in self.summary(name, label).items())
+
+    def render(self):
+        """Noi dung /metrics theo dinh dang Prometheus text 0.0.4."""
+        if not self.enabled:
+            return '# metrics disabled\n'
+        lines = []
+        extra = []
+        for fn in self._collectors:
+            extra.extend(fn())
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted((k, (list(h.counts), h.sum, h.count)) for k, h in self._histograms.items())
+        for kind, rows in (('counter', counters), ('gauge', gauges)):
+            rows = rows + sorted(((name, _key(labels)), value) for name, k, labels, value in extra if k == kind)
+            seen = set()
+            for (name, labels), value in rows:
+                full = '%s_%s' % (self.prefix, name)
+                if name not in seen:
+                    seen.add(name)
+                    if name in self._help:
+                        lines.append('# HELP %s %s' % (full, self._help[name]))
+                    lines.append('# TYPE %s %s' % (full, kind))
+                lines.append('%s%s %s' % (full, _labels_text(labels), repr(float(value))))
+        seen = set()
+        for (name, labels), (counts, total, count) in histograms:
+            full = '%s_%s' % (self.prefix, name)
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append('# HELP %s %s' % (full, self._help[name]))
+                lines.append('# TYPE %s histogram' % full)
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float('inf'),), counts):
+                cumulative += c
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('%s_bucket%s %d' % (full, _labels_text(labels + (('le', le),)), cumulative))
+            lines.append('%s_sum%s %r' % (full, _labels_text(labels), total))
+            lines.append('%s_count%s %d' % (full, _labels_text(labels), count))
+        return '\n'.join(lines) + '\n'
+
+    def after_fork(self):
+        # process con: lock moi, so lieu cua process cha (luc warm-up) khong tinh cho worker
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+
+class PeriodicLog(object):
+    """In mot dong thong ke moi `interval` giay (0 = khong in)."""
+
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self._last = time.monotonic()
+
+    def due(self, now=None):
+        if not self.interval:
+            return False
+        now = time.monotonic() if now is None else now
+        if now - self._last < self.interval:
+            return False
+        self._last = now
+        return True
+
+
+def draw_timings(frame, metrics, origin=(20, 110), font=cv2.FONT_HERSHEY_SIMPLEX, color=(0, 255, 255)):
+    """Ve thoi gian gan day (ms) cua tung buoc len frame, moi buoc mot dong."""
+    x, y = origin
+    for stage, ms in metrics.summary().items():
+        cv2.putText(frame, '%-9s %6.1f ms' % (stage, ms), (x, y), font, 0.45, color, 1, cv2.LINE_AA)
+        y += 16
+    return frame
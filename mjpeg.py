@@ -0,0 +1,226 @@
+import http.client
+import re
+import time
+from urllib.parse import urlsplit
+
+import cv2
+import numpy as np
+
+# Buffer toi da khi chua tim thay ranh gioi frame (tranh tran bo nho khi stream loi)
+MAX_BUFFER = 8 * 1024 * 1024
+
+
+class MJPEGParser(object):
+    """Tach stream multipart/x-mixed-replace thanh tung anh JPEG.
+
+    Dua du lieu vao bang feed() theo tung doan bat ky; moi lan tra ve danh
+    sach cac frame da du. Dung Content-Length cua tung part neu co (nhu
+    firmware CameraWebServer), neu khong thi cat theo boundary ke tiep.
+    """
+
+    def __init__(self, boundary=None):
+        self.boundary = boundary.encode() if isinstance(boundary, str) else boundary
+        self._buf = bytearray()
+        self._length = None
+        self._in_body = False
+
+    def _find_part_start(self):
+        if self.boundary is None:
+            # chua biet boundary: lay dong dau tien bat dau bang "--"
+            m = re.search(rb'(?:^|\r\n)--([^\r\n]+)\r\n', self._buf)
+            if m is None:
+                return False
+            self.boundary = m.group(1).strip()
+        idx = self._buf.find(self.boundary)
+        if idx < 0:
+            # giu lai phan duoi co the la mot phan cua boundary
+            keep = len(self.boundary) + 4
+            if len(self._buf) > keep:
+                del self._buf[:-keep]
+            return False
+        end = self._buf.find(b'\r\n\r\n', idx)
+        if end < 0:
+            return False
+        headers = bytes(self._buf[idx:end]).decode('latin-1').lower()
+        m = re.search(r'content-length:\s*(\d+)', headers)
+        self._length = int(m.group(1)) if m else None
+        del self._buf[:end + 4]
+        self._in_body = True
+        return True
+
+    def _take_body(self):
+        if self._length is not None:
+            if len(self._buf) < self._length:
+                return None
+            frame = bytes(self._buf[:self._length])
+            del self._buf[:self._length]
+        else:
+            idx = self._buf.find(self.boundary)
+            if idx < 0:
+                return None
+            end = self._buf.rfind(b'\r\n', 0, idx)
+            if end < 0:
+                end = max(0, idx - 2)
+            frame = bytes(self._buf[:end])
+            del self._buf[:end]
+        self._in_body = False
+        return frame
+
+    def feed(self, data):
+        self._buf += data
+        frames = []
+        while True:
+            if not self._in_body and not self._find_part_start():
+                break
+            frame = self._take_body()
+            if frame is None:
+                break
+            if frame:
+                frames.append(frame)
+        if len(self._buf) > MAX_BUFFER:
+            self.reset()
+        return frames
+
+    def reset(self):
+        del self._buf[:]
+        self._length = None
+        self._in_body = False
+
+
+def boundary_from(content_type):
+    m = re.search(r'boundary="?([^";]+)"?', content_type or '')
+    return m.group(1).strip() if m else None
+
+
+def _connection(url, timeout):
+    parts = urlsplit(url)
+    cls = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    return cls(parts.hostname, parts.port, timeout=timeout), path
+
+
+class MJPEGStream(object):
+    """Doc anh tu ESP32-CAM qua mot ket noi MJPEG giu mo lien tuc.
+
+    Mat ket noi thi ket noi lai voi backoff tang dan. Neu stream loi
+    `fallback_after` lan lien tiep va co `snapshot_url`, chuyen sang lay
+    tung anh qua mot ket noi keep-alive, va thu lai stream sau
+    `retry_stream_after` giay.
+    """
+
+    def __init__(self, url, snapshot_url=None, timeout=5.0, min_backoff=0.5, max_backoff=10.0,
+                 fallback_after=3, retry_stream_after=30.0, chunk_size=64 * 1024):
+        self.url = url
+        self.snapshot_url = snapshot_url
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.fallback_after = fallback_after
+        self.retry_stream_after = retry_stream_after
+        self.chunk_size = chunk_size
+        self.mode = 'stream' if url else 'snapshot'
+        self.frames_read = 0
+        self.bytes_read = 0
+        self.reconnects = 0
+        self.last_error = None
+        self._conn = None
+        self._closed = False
+        self._iter = None
+
+    def _close_conn(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _stream_frames(self):
+        conn, path = _connection(self.url, self.timeout)
+        self._conn = conn
+        conn.request('GET', path)
+        resp = conn.getresponse()
+        if resp.status != 200:
+            raise IOError('HTTP %d tu %s' % (resp.status, self.url))
+        content_type = resp.getheader('Content-Type', '')
+        if 'multipart' not in content_type:
+            raise IOError('Khong phai stream MJPEG: %s' % content_type)
+        parser = MJPEGParser(boundary_from(content_type))
+        while not self._closed:
+            data = resp.read1(self.chunk_size)
+            if not data:
+                raise IOError('Stream bi dong')
+            self.bytes_read += len(data)
+            for frame in parser.feed(data):
+                yield frame
+
+    def _snapshot_frames(self, until):
+        conn, path = _connection(self.snapshot_url, self.timeout)
+        self._conn = conn
+        while not self._closed and time.monotonic() < until:
+            conn.request('GET', path, headers={'Connection': 'keep-alive'})
+            resp = conn.getresponse()
+            data = resp.read()
+            if resp.status != 200:
+                raise IOError('HTTP %d tu %s' % (resp.status, self.snapshot_url))
+            self.bytes_read += len(data)
+            yield data
+
+    def frames(self):
+        """Sinh lien tuc cac anh JPEG (bytes)."""
+        failures = 0
+        backoff = self.min_backoff
+        while not self._closed:
+            try:
+                if self.mode == 'stream':
+                    source = self._stream_frames()
+                else:
+                    until = time.monotonic() + self.retry_stream_after if self.url else float('inf')
+                    source = self._snapshot_frames(until)
+                for frame in source:
+                    failures = 0
+                    backoff = self.min_backoff
+                    self.frames_read += 1
+                    yield frame
+                # het thoi gian o che do snapshot: thu lai stream
+                if self.mode == 'snapshot' and self.url:
+                    self.mode = 'stream'
+            except (IOError, OSError, http.client.HTTPException) as e:
+                self.last_error = str(e)
+                failures += 1
+                self.reconnects += 1
+                if self.mode == 'stream' and self.snapshot_url and failures >= self.fallback_after:
+                    self.mode = 'snapshot'
+                    failures = 0
+                    backoff = self.min_backoff
+                else:
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+            finally:
+                self._close_conn()
+
+    def read(self):
+        """Giong cv2.VideoCapture.read(): tra ve (success, anh BGR)."""
+        if self._iter is None:
+            self._iter = self.frames()
+        try:
+            data = next(self._iter)
+        except StopIteration:
+            return False, None
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return img is not None, img
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'frames': self.frames_read,
+            'bytes': self.bytes_read,
+            'reconnects': self.reconnects,
+            'last_error': self.last_error,
+        }
+
+    def release(self):
+        self._closed = True
+        self._close_conn()
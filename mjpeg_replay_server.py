@@ -0,0 +1,112 @@
+"""Server HTTP gia lap ESP32-CAM, phat lai cac anh trong uploads/.
+
+    /stream            multipart MJPEG (giong CameraWebServer/app_httpd.cpp)
+    /capture, /cam.jpg tung anh JPEG, ho tro keep-alive
+
+Vi du: python mjpeg_replay_server.py --port 8081 --fps 15
+roi chay realtimeESP.py voi ESP_STREAM_URL=http://127.0.0.1:8081/stream
+"""
+import argparse
+import glob
+import itertools
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+# Cung boundary va dinh dang part voi firmware CameraWebServer
+PART_BOUNDARY = '123456789000000000000987654321'
+STREAM_CONTENT_TYPE = 'multipart/x-mixed-replace;boundary=' + PART_BOUNDARY
+STREAM_BOUNDARY = ('\r\n--' + PART_BOUNDARY + '\r\n').encode()
+STREAM_PART = 'Content-Type: image/jpeg\r\nContent-Length: %u\r\nX-Timestamp: %d.%06d\r\n\r\n'
+
+
+def load_jpegs(folder):
+    frames = []
+    for path in sorted(glob.glob(os.path.join(folder, '*'))):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:3] != b'\xff\xd8\xff':
+            img = cv2.imread(path)
+            if img is None:
+                continue
+            data = cv2.imencode('.jpg', img)[1].tobytes()
+        frames.append(data)
+    return frames
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    frames = []
+    fps = 10.0
+    drop_after = 0
+    _lock = threading.Lock()
+    _index = itertools.count()
+
+    def log_message(self, format, *args):
+        pass
+
+    def next_frame(self):
+        with self._lock:
+            return self.frames[next(self._index) % len(self.frames)]
+
+    def do_GET(self):
+        if self.path.startswith('/stream'):
+            self.send_stream()
+        elif self.path.startswith('/capture') or self.path.startswith('/cam'):
+            data = self.next_frame()
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self.send_error(404)
+
+    def send_stream(self):
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-Type', STREAM_CONTENT_TYPE)
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        sent = 0
+        try:
+            while not self.drop_after or sent < self.drop_after:
+                data = self.next_frame()
+                now = time.time()
+                self.wfile.write(STREAM_BOUNDARY)
+                self.wfile.write((STREAM_PART % (len(data), int(now), int(now % 1 * 1e6))).encode())
+                self.wfile.write(data)
+                self.wfile.flush()
+                sent += 1
+                time.sleep(1.0 / self.fps)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def make_server(folder='uploads', host='127.0.0.1', port=8081, fps=10.0, drop_after=0):
+    handler = type('Handler', (ReplayHandler,), {
+        'frames': load_jpegs(folder),
+        'fps': fps,
+        'drop_after': drop_after,
+        '_index': itertools.count(),
+    })
+    if not handler.frames:
+        raise SystemExit('Khong co anh nao trong %s' % folder)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gia lap ESP32-CAM phat lai anh trong uploads/')
+    parser.add_argument('--folder', default='uploads')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--fps', type=float, default=10.0)
+    parser.add_argument('--drop-after', type=int, default=0,
+                        help='dong stream sau N frame (de thu ket noi lai)')
+    args = parser.parse_args()
+    server = make_server(args.folder, args.host, args.port, args.fps, args.drop_after)
+    print('Dang phat %d anh tai http://%s:%d/stream' % (len(server.RequestHandlerClass.frames), args.host, args.port))
+    server.serve_forever()
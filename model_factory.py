@@ -0,0 +1,201 @@
+"""Tao cac bien the re hon cua myModel(), do chi phi va chon bien the nhanh nhat.
+
+build_model() dung lai dung cau truc cua main.py (2 conv 5x5, pool, 2 conv
+3x3, pool, Dense) nhung cho doi:
+  conv='separable': moi conv sau lop dau thanh depthwise + pointwise
+                    (SeparableConv2D; TFLite: DEPTHWISE_CONV_2D + CONV_2D);
+  conv1/conv2:      so filter (hep hon: it MAC, it arena);
+  head='gap':       GlobalAveragePooling2D thay Flatten + Dense(dense).
+
+Moi bien the duoc do: FLOPs tung lop (2 x MAC), so tham so, thoi gian tren
+CPU nay (Keras batch 32 nhu server, TFLite batch 1 nhu ESP32) va arena
+TFLite float (compress.arena_estimate). Co Dataset/ thi train tung bien the
+bang sweep.py (song song, dataset memmap, dung som, chay tiep duoc) roi
+chon bien the nhanh nhat co test accuracy khong kem baseline qua --max-drop.
+
+    python model_factory.py --no-train                 # chi do chi phi
+    python model_factory.py --epochs 12 --max-drop 0.01
+"""
+import argparse
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from bench import measure
+from compress import arena_estimate, run_tflite, to_tflite
+
+# Bien the mac dinh; khoa bo trong = cau hinh cua main.py
+VARIANTS = {
+    'baseline': {},
+    'narrow': {'conv1': 32, 'conv2': 16, 'dense': 128},
+    'separable': {'conv': 'separable'},
+    'gap': {'head': 'gap'},
+    'separable_gap': {'conv': 'separable', 'head': 'gap'},
+    'narrow_separable_gap': {'conv': 'separable', 'head': 'gap', 'conv1': 32, 'conv2': 16},
+}
+
+
+def build_model(classes, lr=1e-3, conv='standard', conv1=60, conv2=30, dense=500, head='dense', dropout=0.5,
+                input_shape=(32, 32, 1), **_):
+    """myModel() cua main.py voi kieu conv, do rong, dau ra va learning rate thay doi duoc."""
+    layers = tf.keras.layers
+    if conv not in ('standard', 'separable') or head not in ('dense', 'gap'):
+        raise ValueError('conv=%r, head=%r khong hop le' % (conv, head))
+    # lop dau chi co 1 kenh vao: separable khong bot duoc gi, giu Conv2D
+    Conv = layers.SeparableConv2D if conv == 'separable' else layers.Conv2D
+    stack = [
+        layers.Conv2D(conv1, (5, 5), activation='relu', input_shape=input_shape),
+        Conv(conv1, (5, 5), activation='relu'),
+        layers.MaxPooling2D(pool_size=(2, 2)),
+        Conv(conv2, (3, 3), activation='relu'),
+        Conv(conv2, (3, 3), activation='relu'),
+        layers.MaxPooling2D(pool_size=(2, 2)),
+        layers.Dropout(dropout),
+    ]
+    if head == 'gap':
+        stack += [layers.GlobalAveragePooling2D()]
+    else:
+        stack += [layers.Flatten(), layers.Dense(dense, activation='relu'), layers.Dropout(dropout)]
+    stack.append(layers.Dense(classes, activation='softmax'))
+    model = tf.keras.Sequential(stack)
+    model.compile(tf.keras.optimizers.Adam(learning_rate=lr), loss='sparse_categorical_crossentropy',
+                  metrics=['accuracy'])
+    return model
+
+
+def layer_flops(model):
+    """FLOPs (2 x MAC) cua tung lop -> list (ten lop, kieu, shape ra, FLOPs)."""
+    layers = tf.keras.layers
+    rows = []
+    for layer in model.layers:
+        out = layer.output_shape[1:]
+        in_c = layer.input_shape[-1]
+        out_elems = int(np.prod(out))
+        if isinstance(layer, layers.SeparableConv2D):
+            kh, kw = layer.kernel_size
+            spatial = int(np.prod(out[:-1]))
+            macs = spatial * in_c * layer.depth_multiplier * (kh * kw + layer.filters)
+        elif isinstance(layer, layers.DepthwiseConv2D):
+            kh, kw = layer.kernel_size
+            macs = out_elems * kh * kw
+        elif isinstance(layer, layers.Conv2D):
+            kh, kw = layer.kernel_size
+            macs = out_elems * kh * kw * in_c
+        elif isinstance(layer, layers.Dense):
+            macs = out_elems * in_c
+        elif isinstance(layer, (layers.MaxPooling2D, layers.AveragePooling2D, layers.GlobalAveragePooling2D)):
+            # mot phep so sanh / cong cho moi diem vao
+            macs = int(np.prod(layer.input_shape[1:])) // 2
+        else:
+            macs = 0
+        rows.append((layer.name, type(layer).__name__, tuple(out), 2 * macs))
+    return rows
+
+
+def measure_variant(model, batch_size=32, seed=0):
+    """Thoi gian tren CPU nay: Keras predict_on_batch (nhu KerasBackend) va TFLite batch 1, cung arena."""
+    x = np.random.default_rng(seed).random((batch_size, 32, 32, 1), dtype=np.float32)
+    keras = measure(lambda: model.predict_on_batch(x), items=batch_size, min_iters=20)
+    tflite_model = to_tflite(model)
+    _, tflite_ms = run_tflite(tflite_model, x)
+    return {
+        'keras_ms_per_image': round(keras['p50_ms'] / batch_size, 4),
+        'keras_images_per_s': keras['throughput'],
+        'tflite_ms': round(tflite_ms, 4),
+        'tflite_kb': round(len(tflite_model) / 1024.0, 1),
+        'arena_kb': round(arena_estimate(tflite_model)['peak_bytes'] / 1024.0, 1),
+    }
+
+
+def profile(variants, classes=43):
+    """Chi phi tung bien the (chua train) -> {ten: dict}."""
+    rows = {}
+    for name, params in variants.items():
+        model = build_model(classes, **params)
+        flops = layer_flops(model)
+        rows[name] = dict(measure_variant(model), params=model.count_params(),
+                          mflops=round(sum(f for _, _, _, f in flops) / 1e6, 2), layers=flops)
+    return rows
+
+
+def select(rows, max_drop, baseline='baseline', key='keras_ms_per_image'):
+    """Bien the nhanh nhat (theo `key`) co test_accuracy >= baseline - max_drop; None neu khong co."""
+    reference = rows[baseline].get('test_accuracy')
+    if reference is None:
+        return None
+    ok = [name for name, r in rows.items() if r.get('test_accuracy') is not None
+          and r['test_accuracy'] >= reference - max_drop]
+    return min(ok, key=lambda name: rows[name][key]) if ok else None
+
+
+def train_variants(variants, path, out_dir, workers=None, epochs=12, patience=3):
+    """Train qua sweep.py (khong cat trial: bien the yeu van can so do chinh xac) -> {ten: test_accuracy}."""
+    import sweep
+    base = dict((k, values[0]) for k, values in sweep.SPACE.items())
+    trials = dict((name, sweep.Trial(sweep.trial_id(dict(base, **params)), dict(base, **params)))
+                  for name, params in variants.items())
+    results = sweep.run(list(trials.values()), path, out_dir, workers, epochs, patience, prune_after=epochs + 1)
+    by_id = dict((r['trial'], r) for r in results if r['status'] != 'failed')
+    accuracy = {}
+    for name, trial in trials.items():
+        row = by_id.get(trial.id)
+        accuracy[name] = float(row['test_accuracy']) if row and row['test_accuracy'] else None
+    return accuracy
+
+
+def print_table(rows, chosen=None):
+    print('%-22s %9s %9s %10s %9s %9s %9s %8s' % ('bien the', 'tham so', 'MFLOPs', 'keras ms', 'tflite ms',
+                                                 'arena KB', 'test acc', ''))
+    for name, r in rows.items():
+        acc = r.get('test_accuracy')
+        print('%-22s %9d %9.2f %10.4f %9.4f %9.1f %9s %8s' % (
+            name, r['params'], r['mflops'], r['keras_ms_per_image'], r['tflite_ms'], r['arena_kb'],
+            '-' if acc is None else '%.4f' % acc, '<- chon' if name == chosen else ''))
+
+
+def print_layers(name, layers):
+    print('\n%s' % name)
+    total = float(sum(f for _, _, _, f in layers)) or 1.0
+    for layer, kind, shape, flops in layers:
+        if flops:
+            print('  %-28s %-22s %14s %12d %5.1f%%' % (layer, kind, 'x'.join(map(str, shape)), flops,
+                                                      100 * flops / total))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Do chi phi cac bien the myModel va chon bien the nhanh nhat')
+    parser.add_argument('--variants', nargs='+', choices=sorted(VARIANTS), default=list(VARIANTS))
+    parser.add_argument('--classes', type=int, default=43, help='so lop khi khong train (Dataset goc: 43)')
+    parser.add_argument('--path', default='Dataset', help='thu muc Dataset/<lop>/ de train va tinh accuracy')
+    parser.add_argument('--output', default=os.path.join('sweep', 'variants'), help='thu muc ket qua cua sweep.py')
+    parser.add_argument('--no-train', action='store_true', help='chi do FLOPs/thoi gian/arena')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--epochs', type=int, default=12)
+    parser.add_argument('--patience', type=int, default=3)
+    parser.add_argument('--max-drop', type=float, default=0.01, help='muc giam test accuracy chap nhan duoc')
+    parser.add_argument('--layers', action='store_true', help='in FLOPs tung lop')
+    args = parser.parse_args()
+    if 'baseline' not in args.variants:
+        args.variants.insert(0, 'baseline')
+    variants = dict((name, VARIANTS[name]) for name in args.variants)
+    train = not args.no_train and os.path.isdir(args.path)
+    if train:
+        from dataset import list_classes
+        args.classes = len(list_classes(args.path))
+    rows = profile(variants, args.classes)
+    chosen = None
+    if train:
+        for name, acc in train_variants(variants, args.path, args.output, args.workers, args.epochs,
+                                        args.patience).items():
+            rows[name]['test_accuracy'] = acc
+        chosen = select(rows, args.max_drop)
+    elif not args.no_train:
+        print('Khong thay %s: chi do chi phi, khong chon duoc theo accuracy' % args.path)
+    print()
+    print_table(rows, chosen)
+    if args.layers:
+        for name, r in rows.items():
+            print_layers(name, r['layers'])
+    if train:
+        print('\nChon: %s' % chosen if chosen else '\nKhong bien the nao giu duoc accuracy trong %.3f' % args.max_drop)
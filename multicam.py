@@ -0,0 +1,276 @@
+"""Dich vu asyncio doc nhieu ESP32-CAM cung luc, dung chung mot model.
+
+Moi camera co mot coroutine giu ket noi MJPEG va chi giu frame moi nhat.
+Vong suy luan gom frame moi nhat cua moi camera thanh mot batch, chay
+mot lan predict cho tat ca, roi cong bo ket qua va thong ke tung camera
+qua GET /status (JSON).
+
+Vi du:
+    python multicam.py cam1=http://192.168.1.10:81/stream cam2=http://192.168.1.11:81/stream
+    python multicam.py --cameras cameras.txt --status-port 8090
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from decoding import decode_image
+from mjpeg import MJPEGParser, boundary_from
+from pipeline import RateMeter
+from registry import ModelRegistry
+
+
+class Camera(object):
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url
+        self.latest = None          # (seq, luc nhan, jpeg bytes)
+        self.seq = 0
+        self.done_seq = 0
+        self.connected = False
+        self.reconnects = 0
+        self.last_error = None
+        self.last_frame_at = None
+        self.fps = RateMeter()
+        self.latency = 0.0
+        self.result = None
+
+    def stats(self, now, stale_after):
+        age = now - self.last_frame_at if self.last_frame_at else None
+        return {
+            'url': self.url,
+            'connected': self.connected,
+            'healthy': self.connected and age is not None and age < stale_after,
+            'fps': round(self.fps.rate, 2),
+            'frames': self.seq,
+            'frame_age_ms': round(age * 1000, 1) if age is not None else None,
+            'latency_ms': round(self.latency * 1000, 1),
+            'reconnects': self.reconnects,
+            'last_error': self.last_error,
+            'result': self.result,
+        }
+
+
+async def _read_body(reader, chunked, size):
+    if not chunked:
+        return await reader.read(size)
+    line = await reader.readline()
+    n = int(line.split(b';')[0].strip() or b'0', 16)
+    if n == 0:
+        return b''
+    data = await reader.readexactly(n)
+    await reader.readexactly(2)
+    return data
+
+
+class MultiCameraService(object):
+    def __init__(self, cameras, models, model_name=None, max_batch=64, batch_window=0.02,
+                 timeout=5.0, max_backoff=10.0, stale_after=2.0, decode_workers=4):
+        self.cameras = [Camera(name, url) for name, url in cameras]
+        self.models = models
+        self.model_name = model_name
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.stale_after = stale_after
+        self.batches = 0
+        self.batch_size = 0
+        self.infer_fps = RateMeter()
+        # camera bat dau cua batch sau: xoay vong de camera nao cung duoc phan loai khi co hon max_batch camera
+        self._next_cam = 0
+        self._new_frame = asyncio.Event()
+        self._decode_pool = ThreadPoolExecutor(max_workers=decode_workers)
+        # mot thread duy nhat cho model: predict khong chay song song voi chinh no
+        self._model_pool = ThreadPoolExecutor(max_workers=1)
+
+    async def _stream(self, cam):
+        parts = urlsplit(cam.url)
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(parts.hostname, parts.port or 80), self.timeout)
+        try:
+            writer.write(('GET %s HTTP/1.1\r\nHost: %s\r\nConnection: keep-alive\r\n\r\n'
+                          % (path, parts.netloc)).encode())
+            await writer.drain()
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.timeout)
+            lines = head.decode('latin-1').split('\r\n')
+            if ' 200 ' not in lines[0] + ' ':
+                raise IOError(lines[0])
+            headers = dict(l.split(':', 1) for l in lines[1:] if ':' in l)
+            headers = dict((k.strip().lower(), v.strip()) for k, v in headers.items())
+            content_type = headers.get('content-type', '')
+            if 'multipart' not in content_type:
+                raise IOError('Khong phai stream MJPEG: %s' % content_type)
+            chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+            parser = MJPEGParser(boundary_from(content_type))
+            cam.connected = True
+            while True:
+                data = await asyncio.wait_for(_read_body(reader, chunked, 64 * 1024), self.timeout)
+                if not data:
+                    raise IOError('Stream bi dong')
+                for frame in parser.feed(data):
+                    now = time.monotonic()
+                    cam.seq += 1
+                    cam.latest = (cam.seq, now, frame)
+                    cam.last_frame_at = now
+                    cam.fps.tick(now)
+                    self._new_frame.set()
+        finally:
+            cam.connected = False
+            writer.close()
+
+    async def _camera_loop(self, cam):
+        backoff = 0.5
+        while True:
+            seq = cam.seq
+            try:
+                await self._stream(cam)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                cam.last_error = str(e) or e.__class__.__name__
+            if cam.seq > seq:
+                backoff = 0.5
+            cam.reconnects += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def _predict(self, images):
+        # lay model mot lan cho ca batch: model co the duoc thay giua hai batch
+        current = self.models.get(self.model_name)
+        return current.entries(current.predict_images(images))
+
+    def _pick_frames(self):
+        # frame moi chua phan loai, lay tu camera _next_cam tro di: moi camera duoc phuc vu
+        # trong toi da ceil(so camera / max_batch) batch
+        n = len(self.cameras)
+        order = [(self._next_cam + i) % n for i in range(n)]
+        picked = [i for i in order if self.cameras[i].latest is not None
+                  and self.cameras[i].latest[0] > self.cameras[i].done_seq][:self.max_batch]
+        if picked:
+            self._next_cam = (picked[-1] + 1) % n
+        return [(self.cameras[i], self.cameras[i].latest) for i in picked]
+
+    async def _infer_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._new_frame.wait()
+            if self.batch_window:
+                # cho them mot chut de frame cua cac camera khac kip den, gom chung mot batch
+                await asyncio.sleep(self.batch_window)
+            self._new_frame.clear()
+            todo = self._pick_frames()
+            if not todo:
+                continue
+            imgs = await asyncio.gather(*[
+                loop.run_in_executor(self._decode_pool, decode_image, item[2]) for _, item in todo])
+            ready = [(cam, item, img) for (cam, item), img in zip(todo, imgs) if img is not None]
+            for cam, item in todo:
+                cam.done_seq = item[0]
+            if not ready:
+                continue
+            batch = np.stack([img for _, _, img in ready])
+            entries = await loop.run_in_executor(self._model_pool, self._predict, batch)
+            now = time.monotonic()
+            self.batches += 1
+            self.batch_size = len(ready)
+            self.infer_fps.tick(now)
+            for (cam, item, _), entry in zip(ready, entries):
+                latency = now - item[1]
+                cam.latency = latency if cam.latency == 0.0 else cam.latency + 0.1 * (latency - cam.latency)
+                cam.result = {
+                    'class_id': entry.class_index,
+                    'label': entry.label,
+                    'probability': round(float(entry.probabilities[entry.class_index]), 4),
+                    'frame': item[0],
+                }
+            if any(cam.latest is not None and cam.latest[0] > cam.done_seq for cam in self.cameras):
+                self._new_frame.set()
+
+    def status(self):
+        now = time.monotonic()
+        return {
+            'batches': self.batches,
+            'last_batch_size': self.batch_size,
+            'inference_fps': round(self.infer_fps.rate, 2),
+            'model': self.models.loaded(self.model_name).info() if self.models.loaded(self.model_name) else None,
+            'cameras': dict((cam.name, cam.stats(now, self.stale_after)) for cam in self.cameras),
+        }
+
+    async def _handle_status(self, reader, writer):
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+            body = json.dumps(self.status(), ensure_ascii=False).encode()
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n'
+                         b'Connection: close\r\n\r\n' % len(body) + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def run(self, status_host='127.0.0.1', status_port=8090, log_every=10.0):
+        tasks = [asyncio.ensure_future(self._camera_loop(cam)) for cam in self.cameras]
+        tasks.append(asyncio.ensure_future(self._infer_loop()))
+        server = await asyncio.start_server(self._handle_status, status_host, status_port) if status_port else None
+        try:
+            while True:
+                await asyncio.sleep(log_every)
+                st = self.status()
+                healthy = sum(1 for c in st['cameras'].values() if c['healthy'])
+                print('%d/%d camera OK, infer %.1f batch/s, batch %d' % (
+                    healthy, len(self.cameras), st['inference_fps'], st['last_batch_size']))
+        finally:
+            for task in tasks:
+                task.cancel()
+            if server is not None:
+                server.close()
+
+
+def parse_cameras(items, path=None):
+    lines = list(items)
+    if path:
+        with open(path) as f:
+            lines += [l.strip() for l in f if l.strip() and not l.startswith('#')]
+    cameras = []
+    for i, line in enumerate(lines):
+        name, sep, url = line.partition('=')
+        if not sep or name.startswith('http'):
+            name, url = 'cam%d' % (i + 1), line
+        cameras.append((name, url))
+    return cameras
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Nhan dien bien bao tu nhieu ESP32-CAM voi mot model')
+    parser.add_argument('urls', nargs='*', help='ten=url hoac url cua stream MJPEG')
+    parser.add_argument('--cameras', help='file danh sach camera, moi dong mot ten=url')
+    parser.add_argument('--name', default=os.environ.get('MODEL_NAME') or os.environ.get('INFERENCE_BACKEND', 'keras'),
+                        help='ten model trong models.json')
+    parser.add_argument('--backend', help='ghi de backend (di kem --model)')
+    parser.add_argument('--model', default=os.environ.get('MODEL_PATH'), help='ghi de file model')
+    parser.add_argument('--labels', help='ghi de file nhan')
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--batch-window-ms', type=float, default=20.0)
+    parser.add_argument('--status-port', type=int, default=8090)
+    args = parser.parse_args()
+    cameras = parse_cameras(args.urls, args.cameras)
+    if not cameras:
+        parser.error('Chua co camera nao')
+    models = ModelRegistry(default=args.name)
+    if args.model or args.labels or args.name not in models.specs:
+        models.register(args.name, args.backend, args.model, args.labels)
+    models.get()
+    models.watch(2.0)
+    service = MultiCameraService(cameras, models, args.name,
+                                 max_batch=args.max_batch, batch_window=args.batch_window_ms / 1000.0)
+    try:
+        asyncio.run(service.run(status_port=args.status_port))
+    except KeyboardInterrupt:
+        pass
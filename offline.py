@@ -0,0 +1,327 @@
+"""Nhan dien bien bao tren video quay san va thu muc anh, chay tren moi core.
+
+Moi video duoc chia thanh doan `--segment` frame, thu muc anh thanh nhom
+`--segment` file; moi doan la mot viec cho process pool. Trong moi process
+frame di qua chuoi generator: giai ma -> (tim vung) -> tien xu ly theo
+batch -> predict, nen chi giu mot batch frame trong RAM.
+
+Ket qua moi doan ghi ra <output>.parts/<id>.csv (ghi xong moi doi ten),
+chay lai cung lenh thi bo qua cac doan da xong (id gom duong dan, kich
+thuoc/mtime file, khoang frame, file model/nhan va moi tham so anh huong
+den ket qua). Het viec thi ghep thanh mot
+file CSV hoac Parquet (theo duoi file, Parquet can pandas + pyarrow).
+
+--annotate DIR ghi video co ve ket qua; khi do moi video la mot doan
+(khong chia) de khoi phai ghep video.
+
+    python offline.py dashcam/ --output ketqua.csv
+    python offline.py a.mp4 b.mp4 anh/ --output ketqua.parquet --workers 8 --stride 2
+    MODEL_NAME=tflite python offline.py dashcam/ --detect --annotate annotated/
+"""
+import argparse
+import csv
+import hashlib
+import itertools
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2
+import numpy as np
+
+from bulk import IMAGE_EXTENSIONS, chunked
+from cache import file_signature
+from regions import Region, crop_regions, propose_regions
+from registry import LoadedModel, ModelRegistry
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v', '.webm', '.mpg', '.mpeg')
+COLUMNS = ['source', 'frame', 'time_s', 'class_id', 'label', 'probability', 'x', 'y', 'w', 'h']
+
+# kind = 'video' (paths = [duong dan], frame [start, stop)) | 'images' (paths = nhom file anh)
+Shard = namedtuple('Shard', ['id', 'kind', 'paths', 'start', 'stop'])
+Options = namedtuple('Options', ['spec', 'batch_size', 'stride', 'detect', 'annotate', 'threshold'])
+
+
+def find_inputs(inputs):
+    """Tach danh sach file/thu muc thanh (video, anh), da sap xep."""
+    videos, images = [], []
+    for item in inputs:
+        paths = [item] if os.path.isfile(item) else \
+            [os.path.join(root, name) for root, _, names in os.walk(item) for name in names]
+        for path in sorted(paths):
+            ext = os.path.splitext(path)[1].lower()
+            if ext in VIDEO_EXTENSIONS:
+                videos.append(path)
+            elif ext in IMAGE_EXTENSIONS:
+                images.append(path)
+    return videos, images
+
+
+def video_info(path):
+    cap = cv2.VideoCapture(path)
+    try:
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    finally:
+        cap.release()
+    return max(frames, 0), fps, size
+
+
+def _shard_id(kind, paths, start, stop, options):
+    h = hashlib.sha1()
+    for path in paths:
+        h.update(('%s|%s\n' % (os.path.abspath(path), file_signature(path))).encode())
+    h.update(('%s|%s|%s\n' % (kind, start, stop)).encode())
+    # moi tham so anh huong den dong ket qua (hoac video ve ra): doi tham so thi khong dung lai .part cu
+    spec = options.spec
+    h.update(('%s|%s|%s|%s|%s\n' % (spec.name, spec.backend, tuple(spec.input_size), os.path.abspath(spec.model_path),
+                                    file_signature(spec.model_path))).encode())
+    h.update(('%s|%s\n' % (os.path.abspath(spec.labels_path), file_signature(spec.labels_path))).encode())
+    h.update(('%d|%d|%d|%s|%r' % (options.batch_size, options.stride, options.detect, options.annotate,
+                                  options.threshold)).encode())
+    return h.hexdigest()[:16]
+
+
+def make_shards(videos, images, options, segment=1000):
+    shards = []
+    for path in videos:
+        frames = video_info(path)[0]
+        # khong biet so frame (mot so container) hoac can ghi video: ca file la mot doan
+        if frames <= 0 or options.annotate:
+            bounds = [(0, None)]
+        else:
+            bounds = [(start, min(start + segment, frames)) for start in range(0, frames, segment)]
+        for start, stop in bounds:
+            shards.append(Shard(_shard_id('video', [path], start, stop, options), 'video', [path], start, stop))
+    for group in chunked(images, segment):
+        shards.append(Shard(_shard_id('images', group, None, None, options), 'images', group, None, None))
+    return shards
+
+
+def iter_video(path, start=0, stop=None, stride=1):
+    """Sinh (chi so frame, frame BGR) trong [start, stop), chi giai ma frame chia het cho stride."""
+    cap = cv2.VideoCapture(path)
+    try:
+        if start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        index = start
+        while stop is None or index < stop:
+            if index % stride:
+                # grab() bo qua buoc chuyen frame sang BGR
+                if not cap.grab():
+                    break
+            else:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                yield index, frame
+            index += 1
+    finally:
+        cap.release()
+
+
+def iter_images(paths):
+    for path in paths:
+        img = cv2.imread(path)
+        if img is not None:
+            yield path, img
+
+
+def classify_frames(model, frames, detect=False):
+    """frames: list anh BGR -> list (Region hoac None, CacheEntry) tot nhat cua moi frame, mot lan predict."""
+    if not detect:
+        entries = model.entries(model.predict_images(frames))
+        return [(None, entry) for entry in entries]
+    crops, owners, regions = [], [], []
+    for i, frame in enumerate(frames):
+        found = propose_regions(frame) or [Region((0, 0, frame.shape[1], frame.shape[0]), None, None)]
+        crops.append(crop_regions(frame, found, model.input_size))
+        owners.extend([i] * len(found))
+        regions.extend(found)
+    entries = model.entries(model.predict_images(np.concatenate(crops)))
+    best = [None] * len(frames)
+    for i, region, entry in zip(owners, regions, entries):
+        p = entry.probabilities[entry.class_index]
+        if best[i] is None or p > best[i][1].probabilities[best[i][1].class_index]:
+            best[i] = (region, entry)
+    return best
+
+
+_model = None
+
+
+def _init_worker(spec):
+    # moi process mot luong cho OpenCV/TensorFlow: song song theo process, khong tranh core voi nhau
+    global _model
+    cv2.setNumThreads(1)
+    os.environ.setdefault('TF_NUM_INTRAOP_THREADS', '1')
+    os.environ.setdefault('TF_NUM_INTEROP_THREADS', '1')
+    _model = LoadedModel(spec).warmup()
+
+
+def _annotate(frame, region, entry, threshold):
+    p = float(entry.probabilities[entry.class_index])
+    if region is not None and region.color is not None and p >= threshold:
+        x, y, w, h = region.box
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+    cv2.putText(frame, '%s %.0f%%' % (entry.label, p * 100), (20, 35), cv2.FONT_HERSHEY_SIMPLEX, 0.75,
+                (0, 0, 255) if p >= threshold else (128, 128, 128), 2, cv2.LINE_AA)
+
+
+def run_shard(shard, options, parts_dir):
+    """Xu ly mot doan trong process con, tra ve (id, so frame)."""
+    model = _model
+    writer = None
+    if shard.kind == 'video':
+        path = shard.paths[0]
+        _, fps, size = video_info(path)
+        frames = ((path, index, index / fps if fps else None, frame)
+                  for index, frame in iter_video(path, shard.start or 0, shard.stop, options.stride))
+        if options.annotate:
+            out = os.path.join(options.annotate, os.path.splitext(os.path.basename(path))[0] + '_annotated.mp4')
+            writer = cv2.VideoWriter(out + '.tmp.mp4', cv2.VideoWriter_fourcc(*'mp4v'),
+                                     (fps or 25.0) / options.stride, size)
+    else:
+        frames = ((path, 0, None, img) for path, img in iter_images(shard.paths))
+
+    part = os.path.join(parts_dir, shard.id + '.csv')
+    count = 0
+    with open(part + '.tmp', 'w', newline='', encoding='utf-8') as f:
+        out_csv = csv.writer(f)
+        for batch in chunked(frames, options.batch_size):
+            results = classify_frames(model, [item[3] for item in batch], options.detect)
+            for (source, index, t, frame), (region, entry) in zip(batch, results):
+                box = region.box if region is not None and region.color is not None else ('', '', '', '')
+                out_csv.writerow([source, index, '' if t is None else '%.3f' % t, entry.class_index, entry.label,
+                                  '%.6f' % entry.probabilities[entry.class_index]] + list(box))
+                if writer is not None:
+                    _annotate(frame, region, entry, options.threshold)
+                    writer.write(frame)
+            count += len(batch)
+    if writer is not None:
+        writer.release()
+        os.replace(out + '.tmp.mp4', out)
+    os.replace(part + '.tmp', part)
+    return shard.id, count
+
+
+def _executor(workers, spec):
+    # co fork thi dung fork (khoi dong nhanh); spawn van chay duoc vi file nay co __main__
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(spec,))
+
+
+def merge(shards, parts_dir, output):
+    """Ghep cac file .csv cua tung doan (theo thu tu dau vao) thanh output .csv hoac .parquet."""
+    parts = [os.path.join(parts_dir, shard.id + '.csv') for shard in shards]
+    if output.lower().endswith('.parquet'):
+        import pandas as pd
+        frames = [pd.read_csv(part, header=None, names=COLUMNS, keep_default_na=False,
+                              dtype={'source': str, 'label': str}) for part in parts]
+        table = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUMNS)
+        for column in ('time_s', 'x', 'y', 'w', 'h'):
+            table[column] = pd.to_numeric(table[column], errors='coerce')
+        table.to_parquet(output + '.tmp', index=False)
+    else:
+        with open(output + '.tmp', 'w', newline='', encoding='utf-8') as out:
+            csv.writer(out).writerow(COLUMNS)
+            for part in parts:
+                with open(part, encoding='utf-8') as f:
+                    shutil.copyfileobj(f, out)
+    os.replace(output + '.tmp', output)
+
+
+def _progress(done, total, frames, start, skipped):
+    elapsed = time.perf_counter() - start
+    rate = frames / elapsed if elapsed > 0 else 0.0
+    eta = (total - done) * elapsed / (done - skipped) if done > skipped else 0.0
+    sys.stdout.write('\r%d/%d doan (%d da co tu lan truoc), %d frame, %.1f frame/s, con ~%.0fs   ' % (
+        done, total, skipped, frames, rate, eta))
+    sys.stdout.flush()
+
+
+def run(inputs, output, spec, workers=None, batch_size=64, segment=1000, stride=1, detect=False, annotate=None,
+        threshold=0.75, keep_parts=False):
+    if output.lower().endswith('.parquet'):
+        # bao loi truoc khi chay ca tieng dong ho roi moi hong o buoc ghep
+        try:
+            import pandas  # noqa: F401
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError('Ghi Parquet can pandas va pyarrow (pip install pandas pyarrow), hoac dung .csv')
+    videos, images = find_inputs(inputs)
+    if not videos and not images:
+        raise ValueError('Khong tim thay video hoac anh trong: %s' % ', '.join(inputs))
+    if annotate:
+        os.makedirs(annotate, exist_ok=True)
+    options = Options(spec, batch_size, max(1, stride), detect, annotate, threshold)
+    shards = make_shards(videos, images, options, segment)
+    parts_dir = output + '.parts'
+    os.makedirs(parts_dir, exist_ok=True)
+    todo = [s for s in shards if not os.path.exists(os.path.join(parts_dir, s.id + '.csv'))]
+    skipped = len(shards) - len(todo)
+    print('%d video, %d anh -> %d doan, con %d doan, %d process' % (
+        len(videos), len(images), len(shards), len(todo), workers or os.cpu_count()))
+
+    start = time.perf_counter()
+    frames = 0
+    done = skipped
+    if todo:
+        with _executor(workers, spec) as pool:
+            # chi gui truoc vai doan moi process, Ctrl+C khong phai doi ca hang doi
+            it = iter(todo)
+            pending = set(pool.submit(run_shard, s, options, parts_dir)
+                          for s in itertools.islice(it, 2 * (workers or os.cpu_count() or 1)))
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    frames += future.result()[1]
+                    done += 1
+                    shard = next(it, None)
+                    if shard is not None:
+                        pending.add(pool.submit(run_shard, shard, options, parts_dir))
+                _progress(done, len(shards), frames, start, skipped)
+        print()
+    merge(shards, parts_dir, output)
+    if not keep_parts:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+    elapsed = time.perf_counter() - start
+    print('Da ghi %s: %d frame moi trong %.1fs (%.1f frame/s)' % (
+        output, frames, elapsed, frames / elapsed if elapsed > 0 else 0.0))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Nhan dien bien bao tren video va thu muc anh (nhieu process)')
+    parser.add_argument('inputs', nargs='+', help='file video, file anh hoac thu muc')
+    parser.add_argument('--output', default='ketqua.csv', help='.csv hoac .parquet')
+    parser.add_argument('--workers', type=int, default=None, help='so process (mac dinh = so CPU)')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--segment', type=int, default=1000, help='so frame (hoac so anh) moi doan')
+    parser.add_argument('--stride', type=int, default=1, help='chi xu ly 1 trong moi n frame')
+    parser.add_argument('--detect', action='store_true', help='tim vung bien bao thay vi phan loai ca frame')
+    parser.add_argument('--annotate', help='thu muc ghi video da ve ket qua')
+    parser.add_argument('--threshold', type=float, default=0.75)
+    parser.add_argument('--keep-parts', action='store_true', help='giu file ket qua tung doan sau khi ghep')
+    parser.add_argument('--name', default=os.environ.get('MODEL_NAME') or os.environ.get('INFERENCE_BACKEND', 'keras'),
+                        help='ten model trong models.json')
+    parser.add_argument('--backend', help='ghi de backend (di kem --model)')
+    parser.add_argument('--model', default=os.environ.get('MODEL_PATH'), help='ghi de file model')
+    parser.add_argument('--labels', help='ghi de file nhan')
+    args = parser.parse_args()
+    models = ModelRegistry(default=args.name)
+    if args.model or args.labels or args.name not in models.specs:
+        models.register(args.name, args.backend, args.model, args.labels)
+    try:
+        run(args.inputs, args.output, models.specs[args.name], args.workers, args.batch_size, args.segment,
+            args.stride, args.detect, args.annotate, args.threshold, args.keep_parts)
+    except ValueError as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        print('\nDa dung; chay lai cung lenh de tiep tuc tu cac doan chua xong')
+        sys.exit(1)
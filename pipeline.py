@@ -0,0 +1,126 @@
+import queue
+import threading
+import time
+
+
+class RateMeter(object):
+    """Dem so su kien/giay, lam muot bang trung binh luy thua (EMA)."""
+
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+        self.rate = 0.0
+        self._last = None
+        self._lock = threading.Lock()
+
+    def tick(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._last is not None and now > self._last:
+                inst = 1.0 / (now - self._last)
+                self.rate = inst if self.rate == 0.0 else self.rate + self.alpha * (inst - self.rate)
+            self._last = now
+
+
+class LatestSlot(object):
+    """Hang doi 1 phan tu: put() de len phan tu cu (bo frame cu)."""
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=1)
+        self.dropped = 0
+
+    def put(self, item):
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        return self._queue.get(timeout=timeout)
+
+
+class FrameGrabber(threading.Thread):
+    """Thread doc camera lien tuc, chi giu frame moi nhat."""
+
+    def __init__(self, read_fn, on_frame=None):
+        threading.Thread.__init__(self, name='frame-grabber', daemon=True)
+        self.read_fn = read_fn
+        self.on_frame = on_frame
+        self.fps = RateMeter()
+        self.running = True
+        self._lock = threading.Lock()
+        self._latest = None
+        self.seq = 0
+
+    def run(self):
+        while self.running:
+            success, frame = self.read_fn()
+            if not success or frame is None:
+                time.sleep(0.005)
+                continue
+            now = time.monotonic()
+            self.fps.tick(now)
+            with self._lock:
+                self.seq += 1
+                self._latest = (self.seq, now, frame)
+                item = self._latest
+            if self.on_frame is not None:
+                self.on_frame(item)
+
+    def latest(self):
+        with self._lock:
+            return self._latest
+
+    def stop(self):
+        self.running = False
+
+
+class InferenceWorker(threading.Thread):
+    """Lay frame moi nhat tu LatestSlot, chay predict, giu ket qua moi nhat.
+
+    `infer_fn(frame)` tra ve ket qua bat ky (vd (classIndex, probability)).
+    Do tre glass-to-result = luc co ket qua - luc doc frame.
+    """
+
+    def __init__(self, infer_fn):
+        threading.Thread.__init__(self, name='inference-worker', daemon=True)
+        self.infer_fn = infer_fn
+        self.slot = LatestSlot()
+        self.fps = RateMeter()
+        self.latency = 0.0
+        self.running = True
+        self._lock = threading.Lock()
+        self._result = None
+
+    def submit(self, item):
+        self.slot.put(item)
+
+    def run(self):
+        while self.running:
+            try:
+                seq, captured_at, frame = self.slot.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            result = self.infer_fn(frame)
+            now = time.monotonic()
+            self.fps.tick(now)
+            with self._lock:
+                latency = now - captured_at
+                self.latency = latency if self.latency == 0.0 else self.latency + 0.1 * (latency - self.latency)
+                self._result = (seq, result)
+
+    def result(self):
+        with self._lock:
+            return self._result
+
+    def reset(self):
+        with self._lock:
+            self._result = None
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,103 @@
+"""Tien xu ly anh cho model, xu ly ca batch mot luc.
+
+Thay cho bo ba grayscale/equalize/preprocessing truoc day bi copy o moi
+file. Ca batch duoc chuyen xam bang mot lan goi cv2.cvtColor, can bang
+histogram ghi thang vao mang ket qua, roi chuan hoa ve float32 (thay vi
+float64 nhu `img/255`) hoac giu uint8 cho model luong tu hoa.
+
+Kiem tra khop voi cach cu va do toc do: python preprocess.py
+"""
+import cv2
+import numpy as np
+
+INPUT_SIZE = (32, 32)
+
+
+def resize_batch(images, size=INPUT_SIZE, interpolation=cv2.INTER_AREA):
+    """Resize danh sach/mang anh ve `size`; bo qua neu da dung kich thuoc."""
+    w, h = size
+    if isinstance(images, np.ndarray) and images.ndim >= 3 and images.shape[1:3] == (h, w):
+        return images
+    return np.stack([img if img.shape[:2] == (h, w) else cv2.resize(img, size, interpolation=interpolation)
+                     for img in images])
+
+
+def grayscale_batch(images):
+    """(N,H,W,3) BGR uint8 -> (N,H,W) uint8 bang mot lan goi cv2.cvtColor."""
+    if images.ndim == 3:
+        return images
+    n, h, w = images.shape[:3]
+    gray = cv2.cvtColor(np.ascontiguousarray(images).reshape(n * h, w, 3), cv2.COLOR_BGR2GRAY)
+    return gray.reshape(n, h, w)
+
+
+def equalize_batch(gray, out=None):
+    """Can bang histogram tung anh trong (N,H,W) uint8."""
+    if out is None:
+        out = np.empty_like(gray)
+    for i in range(len(gray)):
+        cv2.equalizeHist(gray[i], dst=out[i])
+    return out
+
+
+def preprocess_batch(images, size=INPUT_SIZE, dtype=np.float32, interpolation=cv2.INTER_AREA):
+    """Anh BGR uint8 (N,H,W,3) hoac danh sach anh -> tensor (N,h,w,1) cho model.
+
+    dtype=np.float32: gia tri trong [0,1] (model Keras/TFLite float).
+    dtype=np.uint8:   gia tri 0..255 da can bang (model luong tu hoa / cache).
+    """
+    if len(images) == 0:
+        return np.empty((0, size[1], size[0], 1), dtype=dtype)
+    images = resize_batch(images, size, interpolation)
+    gray = grayscale_batch(np.asarray(images))
+    out = equalize_batch(gray, out=gray if gray is not images else None)
+    if np.dtype(dtype) != np.uint8:
+        out = out.astype(dtype)
+        out *= dtype(1.0 / 255)
+    return out[..., None]
+
+
+def preprocess_image(img, size=INPUT_SIZE, dtype=np.float32, interpolation=cv2.INTER_AREA):
+    """Mot anh BGR -> (h,w,1)."""
+    return preprocess_batch(img[None], size, dtype, interpolation)[0]
+
+
+def _reference(img, size=INPUT_SIZE, interpolation=cv2.INTER_AREA):
+    # cach cu: grayscale -> equalize -> img/255 tren tung anh
+    img = cv2.resize(img, size, interpolation=interpolation)
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    img = cv2.equalizeHist(img)
+    return img / 255
+
+
+def check_parity(images):
+    """So sanh voi cach cu; tra ve sai so lon nhat."""
+    ours = preprocess_batch(images)[..., 0]
+    ref = np.stack([_reference(img) for img in images])
+    return float(np.abs(ours - ref).max())
+
+
+if __name__ == '__main__':
+    import glob
+    import time
+    rng = np.random.default_rng(0)
+    samples = [cv2.imread(p) for p in sorted(glob.glob('uploads/*'))]
+    samples = [img for img in samples if img is not None]
+    batches = {
+        'uploads': samples,
+        'random': list(rng.integers(0, 256, (256, 48, 64, 3), dtype=np.uint8)),
+        'low-contrast': list(rng.integers(100, 110, (256, 32, 32, 3), dtype=np.uint8)),
+        'constant': [np.full((32, 32, 3), v, np.uint8) for v in (0, 7, 255)],
+    }
+    for name, imgs in batches.items():
+        print('%-13s %4d anh, sai so lon nhat %.2g' % (name, len(imgs), check_parity(imgs)))
+
+    frames = rng.integers(0, 256, (512, 32, 32, 3), dtype=np.uint8)
+    start = time.perf_counter()
+    old = np.array([_reference(img) for img in frames]).reshape(-1, 32, 32, 1)
+    t_old = time.perf_counter() - start
+    start = time.perf_counter()
+    new = preprocess_batch(frames)
+    t_new = time.perf_counter() - start
+    print('512 anh 32x32: tung anh %.1f ms (%.1f MB), batch %.1f ms (%.1f MB)' % (
+        t_old * 1000, old.nbytes / 1e6, t_new * 1000, new.nbytes / 1e6))
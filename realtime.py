@@ -1,7 +1,15 @@
+import os
+import sys
+import time
 import numpy as np
 import cv2
 import pickle
-from keras.models import load_model
+from metrics import Metrics, PeriodicLog, draw_timings
+from preprocess import preprocess_batch, preprocess_image
+from pipeline import FrameGrabber, InferenceWorker, RateMeter
+from regions import crop_regions, propose_regions
+from registry import registry_from_env
+from tracker import SignTracker, draw_tracks
 
 # CAMERA RESOLUTION
 frameWidth = 640
@@ -9,6 +17,15 @@ frameHeight = 480
 brightness = 180
 threshold = 0.75 
 font = cv2.FONT_HERSHEY_SIMPLEX
+# Che do pipeline: doc camera / du doan / hien thi chay tren cac thread rieng
+PIPELINE = os.environ.get('REALTIME_PIPELINE', '0') == '1' or '--pipeline' in sys.argv
+# Tim vung bien bao (mau + hinh dang) va phan loai tung vung; 0 = phan loai ca frame nhu cu
+DETECT = os.environ.get('REALTIME_DETECT', '1') == '1'
+# Thoi gian tung buoc (ms): SHOW_TIMINGS=1 ve len frame, TIMING_LOG_S=n in moi n giay (0 = tat)
+SHOW_TIMINGS = os.environ.get('SHOW_TIMINGS', '0') == '1'
+TIMING_LOG_S = float(os.environ.get('TIMING_LOG_S', 0))
+metrics = Metrics(SHOW_TIMINGS or TIMING_LOG_S > 0)
+timing_log = PeriodicLog(TIMING_LOG_S)
 
 
 # SETUP CAMERA
@@ -17,155 +34,131 @@ cap.set(3, frameWidth)
 cap.set(4, frameHeight)
 cap.set(10, brightness)
 
-# Load model
-model = load_model("model.h5")
-
-
-def grayscale(img):
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    return img
-
-
-def equalize(img):
-    img = cv2.equalizeHist(img)
-    return img
-
-
-def preprocessing(img):
-    img = grayscale(img)
-    img = equalize(img)
-    img = img / 255
-    return img
-
-
-def getCalssName(classNo):
-    if classNo == 0:
-        return 'Gioi han toc do (20km/h)'
-    elif classNo == 1:
-        return 'Gioi han toc do (30km/h)'
-    elif classNo == 2:
-        return 'Gioi han toc do (50km/h)'
-    elif classNo == 3:
-        return 'Gioi han toc do (60km/h)'
-    elif classNo == 4:
-        return 'Gioi han toc do (70km/h)'
-    elif classNo == 5:
-        return 'Gioi han toc do (80km/h)'
-    elif classNo == 6:
-        return 'Het gioi han toc do (80km/h)'
-    elif classNo == 7:
-        return 'Gioi han toc do (100km/h)'
-    elif classNo == 8:
-        return 'Gioi han toc do (120km/h)'
-    elif classNo == 9:
-        return 'Cam vuot'
-    elif classNo == 10:
-        return 'Cam vuot cho xe co trong luong tren 3.5 tan'
-    elif classNo == 11:
-        return 'Uu tien tai giao lo ke tiep'
-    elif classNo == 12:
-        return 'Duong uu tien'
-    elif classNo == 13:
-        return 'Nhuong duong'
-    elif classNo == 14:
-        return 'Dung lai'
-    elif classNo == 15:
-        return 'Cam xe co gioi'
-    elif classNo == 16:
-        return 'Cam xe co trong luong tren 3.5 tan'
-    elif classNo == 17:
-        return 'Cam di nguoc chieu'
-    elif classNo == 18:
-        return 'Canh bao nguy hiem'
-    elif classNo == 19:
-        return 'Duong cong nguy hiem ben trai'
-    elif classNo == 20:
-        return 'Duong cong nguy hiem ben phai'
-    elif classNo == 21:
-        return 'Duong cong kep'
-    elif classNo == 22:
-        return 'Duong gap ghenh'
-    elif classNo == 23:
-        return 'Duong tron truot'
-    elif classNo == 24:
-        return 'Duong hep ben phai'
-    elif classNo == 25:
-        return 'Cong truong dang thi cong'
-    elif classNo == 26:
-        return 'Den tin hieu giao thong'
-    elif classNo == 27:
-        return 'Nguoi di bo'
-    elif classNo == 28:
-        return 'Tre em qua duong'
-    elif classNo == 29:
-        return 'Giao nhau voi xe dap'
-    elif classNo == 30:
-        return 'Canh bao bang tuyet/da'
-    elif classNo == 31:
-        return 'Gap dong vat hoang da bang qua'
-    elif classNo == 32:
-        return 'Het moi gioi han toc do va cam vuot'
-    elif classNo == 33:
-        return 'Re phai phia truoc'
-    elif classNo == 34:
-        return 'Re trai phia truoc'
-    elif classNo == 35:
-        return 'Chi di thang'
-    elif classNo == 36:
-        return 'Di thang hoac re phai'
-    elif classNo == 37:
-        return 'Di thang hoac re trai'
-    elif classNo == 38:
-        return 'Giu ben phai'
-    elif classNo == 39:
-        return 'Giu ben trai'
-    elif classNo == 40:
-        return 'Bat buoc vong xuyen'
-    elif classNo == 41:
-        return 'Het cam vuot'
-    elif classNo == 42:
-        return 'Het cam vuot cho xe co trong luong tren 3.5 tan'
-
-
-stop = 0
-
-while True:
-    # READ IMAGE
-    success, imgOrignal = cap.read()
-
-    # PROCESS IMAGE
-    img = np.asarray(imgOrignal)
-    img = cv2.resize(img, (32, 32))
-    img = preprocessing(img)
-    cv2.imshow("Processed Image", img)
-    img = img.reshape(1, 32, 32, 1)
-    cv2.putText(imgOrignal, "CLASS: ", (20, 35), font, 0.75, (0, 0, 255), 2, cv2.LINE_AA)
-    cv2.putText(imgOrignal, "PROBABILITY: ", (20, 75), font, 0.75, (0, 0, 255), 2, cv2.LINE_AA)
-    # Du doan
-    if (stop == 0):
-        predictions = model.predict(img)
-        classIndex = np.argmax(predictions, axis=-1)
-        probabilityValue = np.amax(predictions)
-        cv2.putText(imgOrignal, str(getCalssName(classIndex)), (120, 35), font, 0.75, (0, 0, 255), 2, cv2.LINE_AA)
-        cv2.putText(imgOrignal, str(round(probabilityValue * 100, 2)) + "%", (180, 75), font, 0.75, (0, 0, 255), 2,
-                    cv2.LINE_AA)
-    str_result = ""
-    str_probility = ""
-    if (round(probabilityValue * 100, 2) > 96):
-        str_result = str(getCalssName(classIndex))
-        str_probility = str(round(probabilityValue * 100, 2))
-        cv2.putText(imgOrignal, str_result, (120, 35), font, 0.75,
-                    (0, 0, 255), 2, cv2.LINE_AA)
-        cv2.putText(imgOrignal, str_probility + "%", (180, 75), font, 0.75, (0, 0, 255), 2,
-                    cv2.LINE_AA)
-        print("=============>" + str_result + " " + str_probility)
-        stop = 1
-    cv2.imshow("Result", imgOrignal)
-    k = cv2.waitKey(1)
-    if k == ord('q'):
-        break
-    if k == ord('r'):
-        stop = 0
+# Load model tu models.json (MODEL_NAME hoac INFERENCE_BACKEND = keras | tflite | tflite-int8),
+# tu nap lai khi file model thay doi
+models = registry_from_env()
+models.get()
+models.watch(float(os.environ.get('MODEL_WATCH_INTERVAL', 2)))
+
+
+def classify(frame, regions):
+    # tat ca vung can phan loai lai cua frame -> mot lan predict
+    current = models.get()
+    with metrics.stage('crop'):
+        crops = crop_regions(frame, regions, current.input_size)
+    with metrics.stage('preprocess'):
+        batch = preprocess_batch(crops, current.input_size)
+    with metrics.stage('inference'):
+        predictions = current.predict(batch)
+    return current.entries(predictions)
+
+
+# Theo doi bien bao qua cac frame: chi phan loai lai moi TRACK_EVERY frame hoac khi anh thay doi,
+# bo qua frame khi canh dung yen
+tracker = SignTracker(classify, propose_fn=metrics.timed('propose', propose_regions) if DETECT else (lambda frame: []),
+                      reclassify_every=int(os.environ.get('TRACK_EVERY', 10)))
+update = metrics.timed('track', tracker.update)
+# id cac track da doc thanh tieng (moi bien bao chi doc mot lan)
+announced = set()
+
+
+def show_timings(imgOrignal):
+    if SHOW_TIMINGS:
+        draw_timings(imgOrignal, metrics)
+    if timing_log.due():
+        print('TIMING ms: ' + metrics.summary_text())
+
+
+def show_tracks(imgOrignal, tracks):
+    draw_tracks(imgOrignal, tracks, threshold)
+    if not tracks:
+        return
+    best = max(tracks, key=lambda t: t.probability)
+    cv2.putText(imgOrignal, best.label, (120, 35), font, 0.75, (0, 0, 255), 2, cv2.LINE_AA)
+    cv2.putText(imgOrignal, str(round(best.probability * 100, 2)) + "%", (180, 75), font, 0.75, (0, 0, 255), 2,
+                cv2.LINE_AA)
+    for track in tracks:
+        # moi bien bao chi bao mot lan khi da chac chan (thay cho co `stop` truoc day)
+        if track.id not in announced and round(track.probability * 100, 2) > 96:
+            announced.add(track.id)
+            print("=============>" + track.label + " " + str(round(track.probability * 100, 2)))
+
+
+def run_sequential():
+    while True:
+        # READ IMAGE
+        with metrics.stage('capture'):
+            success, imgOrignal = cap.read()
+
+        # PROCESS IMAGE
+        img = preprocess_image(imgOrignal)
+        cv2.imshow("Processed Image", img)
+        cv2.putText(imgOrignal, "CLASS: ", (20, 35), font, 0.75, (0, 0, 255), 2, cv2.LINE_AA)
+        cv2.putText(imgOrignal, "PROBABILITY: ", (20, 75), font, 0.75, (0, 0, 255), 2, cv2.LINE_AA)
+        # Du doan
+        show_tracks(imgOrignal, update(imgOrignal))
+        show_timings(imgOrignal)
+        cv2.imshow("Result", imgOrignal)
+        k = cv2.waitKey(1)
+        if k == ord('q'):
+            break
+        if k == ord('r'):
+            tracker.reset()
+            announced.clear()
+
+
+def run_pipelined():
+    worker = InferenceWorker(update)
+    grabber = FrameGrabber(metrics.timed('capture', cap.read), on_frame=worker.submit)
+    worker.start()
+    grabber.start()
+    display_fps = RateMeter()
+    last_seq = 0
+    last_log = time.monotonic()
+    while True:
+        item = grabber.latest()
+        if item is None or item[0] == last_seq:
+            # chua co frame moi: cho mot chut, van xu ly phim
+            k = cv2.waitKey(1)
+            if k == ord('q'):
+                break
+            continue
+        last_seq, _, frame = item
+        imgOrignal = frame.copy()
+        display_fps.tick()
+        cv2.putText(imgOrignal, "CLASS: ", (20, 35), font, 0.75, (0, 0, 255), 2, cv2.LINE_AA)
+        cv2.putText(imgOrignal, "PROBABILITY: ", (20, 75), font, 0.75, (0, 0, 255), 2, cv2.LINE_AA)
+        result = worker.result()
+        if result is not None:
+            show_tracks(imgOrignal, result[1])
+        st = tracker.stats()
+        stats = "CAM %.1f fps  INFER %.1f fps  LATENCY %.0f ms  CLS %.2f/frame" % (
+            grabber.fps.rate, worker.fps.rate, worker.latency * 1000, st['classified_per_frame'])
+        cv2.putText(imgOrignal, stats, (20, frameHeight - 20), font, 0.5, (0, 255, 0), 1, cv2.LINE_AA)
+        show_timings(imgOrignal)
+        now = time.monotonic()
+        if now - last_log >= 5:
+            last_log = now
+            print(stats + "  DISPLAY %.1f fps  DROPPED %d  STATIC %d/%d" % (
+                display_fps.rate, worker.slot.dropped, st['static_skips'], st['frames']))
+        cv2.imshow("Result", imgOrignal)
+        k = cv2.waitKey(1)
+        if k == ord('q'):
+            break
+        if k == ord('r'):
+            tracker.reset()
+            announced.clear()
+            worker.reset()
+    grabber.stop()
+    worker.stop()
+    grabber.join(1)
+    worker.join(1)
+
+
+if PIPELINE:
+    run_pipelined()
+else:
+    run_sequential()
 
 cv2.destroyAllWindows()
 cap.release()
@@ -0,0 +1,203 @@
+"""Tim vung nghi la bien bao trong frame de phan loai tung vung.
+
+Thay vi thu nho ca frame 640x480 ve 32x32 (bien bao nho gan nhu bien
+mat), frame duoc thu nho con ~320 px, tach mau do/xanh/vang trong HSV, lay
+contour va giu cac contour co hinh tron, tam giac, bat giac (STOP) hoac
+chu nhat. Tat ca vung cua mot frame duoc cat ra va phan loai bang mot
+lan predict.
+
+Thu tren anh tong hop: python regions.py
+"""
+import math
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from preprocess import INPUT_SIZE
+
+Region = namedtuple('Region', ['box', 'color', 'shape'])
+
+# (H thap, H cao), S va V toi thieu; mau do nam o hai dau vong H cua OpenCV (0..180)
+COLOR_RANGES = {
+    'red': [((0, 70, 50), (10, 255, 255)), ((160, 70, 50), (180, 255, 255))],
+    'blue': [((100, 90, 50), (130, 255, 255))],
+    # bien "duong uu tien" (hinh thoi vang)
+    'yellow': [((15, 100, 100), (35, 255, 255))],
+}
+
+
+def color_masks(hsv):
+    kernel = np.ones((3, 3), np.uint8)
+    masks = {}
+    for color, ranges in COLOR_RANGES.items():
+        mask = None
+        for lo, hi in ranges:
+            m = cv2.inRange(hsv, lo, hi)
+            mask = m if mask is None else cv2.bitwise_or(mask, m)
+        # chi noi lai vien bi dut; khong MORPH_OPEN vi vien mong cua bien bao o xa se mat.
+        # Nhieu nho bi loai sau do bang kich thuoc va hinh dang contour
+        masks[color] = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+    return masks
+
+
+def shape_of(contour):
+    """'circle' | 'triangle' | 'octagon' | 'rectangle' hoac None."""
+    area = cv2.contourArea(contour)
+    perimeter = cv2.arcLength(contour, True)
+    if area <= 0 or perimeter <= 0:
+        return None
+    approx = cv2.approxPolyDP(contour, 0.04 * perimeter, True)
+    vertices = len(approx)
+    if vertices == 3:
+        return 'triangle'
+    if vertices == 4 and cv2.isContourConvex(approx):
+        return 'rectangle'
+    circularity = 4 * math.pi * area / (perimeter * perimeter)
+    if circularity > 0.7:
+        return 'circle'
+    if 7 <= vertices <= 9 and circularity > 0.6:
+        return 'octagon'
+    return None
+
+
+def iou(a, b):
+    """Ti le giao / hop cua hai khung (x, y, w, h)."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    w = min(ax + aw, bx + bw) - max(ax, bx)
+    h = min(ay + ah, by + bh) - max(ay, by)
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+def propose_regions(frame, max_regions=16, min_size=12, max_aspect=1.6, pad=0.1, work_width=320,
+                    overlap=0.5):
+    """Frame BGR -> list Region (box = (x, y, w, h) theo toa do frame goc), vung lon truoc."""
+    fh, fw = frame.shape[:2]
+    scale = min(1.0, work_width / float(fw))
+    small = cv2.resize(frame, (int(fw * scale), int(fh * scale)), interpolation=cv2.INTER_AREA) \
+        if scale < 1.0 else frame
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    candidates = []
+    for color, mask in color_masks(hsv).items():
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            if w < min_size * scale or h < min_size * scale or max(w, h) > max_aspect * min(w, h):
+                continue
+            shape = shape_of(contour)
+            if shape is None:
+                continue
+            candidates.append((w * h, (x, y, w, h), color, shape))
+    candidates.sort(key=lambda c: c[0], reverse=True)
+
+    regions = []
+    for _, (x, y, w, h), color, shape in candidates:
+        # doi ve toa do frame goc, noi rong them `pad` de lay ca vien bien
+        p = pad * max(w, h)
+        x0 = max(0, int((x - p) / scale))
+        y0 = max(0, int((y - p) / scale))
+        x1 = min(fw, int(math.ceil((x + w + p) / scale)))
+        y1 = min(fh, int(math.ceil((y + h + p) / scale)))
+        box = (x0, y0, x1 - x0, y1 - y0)
+        if any(iou(box, r.box) > overlap for r in regions):
+            continue
+        regions.append(Region(box, color, shape))
+        if len(regions) >= max_regions:
+            break
+    return regions
+
+
+def crop_regions(frame, regions, size=INPUT_SIZE):
+    """Cat va resize cac vung ve `size` -> mang (N,h,w,3) uint8, san sang cho preprocess_batch."""
+    out = np.empty((len(regions), size[1], size[0], 3), dtype=np.uint8)
+    for i, region in enumerate(regions):
+        x, y, w, h = region.box
+        cv2.resize(frame[y:y + h, x:x + w], size, dst=out[i], interpolation=cv2.INTER_AREA)
+    return out
+
+
+def classify_regions(model, frame, regions):
+    """Phan loai tat ca vung bang mot lan predict; `model` la LoadedModel (registry.py)."""
+    if not regions:
+        return []
+    return model.entries(model.predict_images(crop_regions(frame, regions, model.input_size)))
+
+
+def detect(model, frame, max_regions=16, full_frame=True):
+    """Tra ve list (Region, CacheEntry). Khong tim thay vung nao thi phan loai ca frame
+    (truong hop bien bao chiem gan het khung hinh) neu `full_frame`; max_regions=0 chi
+    phan loai ca frame."""
+    regions = propose_regions(frame, max_regions) if max_regions else []
+    if not regions and full_frame:
+        regions = [Region((0, 0, frame.shape[1], frame.shape[0]), None, None)]
+    return list(zip(regions, classify_regions(model, frame, regions)))
+
+
+def best_detection(detections):
+    """(Region, CacheEntry) co xac suat cao nhat, hoac None."""
+    if not detections:
+        return None
+    return max(detections, key=lambda d: d[1].probabilities[d[1].class_index])
+
+
+def draw_detections(frame, detections, threshold=0.75, font=cv2.FONT_HERSHEY_SIMPLEX):
+    """Ve khung + nhan cho cac vung co xac suat >= threshold (bo qua vung ca frame)."""
+    for region, entry in detections:
+        probability = float(entry.probabilities[entry.class_index])
+        if probability < threshold or region.color is None:
+            continue
+        x, y, w, h = region.box
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        text = '%s %.0f%%' % (entry.label, probability * 100)
+        cv2.putText(frame, text, (x, max(12, y - 6)), font, 0.5, (0, 255, 0), 1, cv2.LINE_AA)
+    return frame
+
+
+def synthetic_scene(rng, signs=3, size=(640, 480)):
+    """Frame gia co `signs` bien bao -> (frame BGR, list (tam x, tam y, ban kinh)), dung cho mo phong va bench."""
+    # nen xam chuyen dan + nhieu nhe, vai hinh tron/tam giac do va tron xanh o vi tri ngau nhien
+    w, h = size
+    base = np.linspace(70, 150, w, dtype=np.float32)[None, :, None] + rng.normal(0, 8, (h, w, 3))
+    frame = np.clip(base, 0, 255).astype(np.uint8)
+    boxes = []
+    for i in range(signs):
+        r = int(rng.integers(14, 50))
+        cx = int(rng.integers(r + 5, w - r - 5))
+        cy = int(rng.integers(r + 5, h - r - 5))
+        if any(abs(cx - bx) < r + br + 10 and abs(cy - by) < r + br + 10 for bx, by, br in boxes):
+            continue
+        boxes.append((cx, cy, r))
+        kind = i % 3
+        if kind == 0:
+            cv2.circle(frame, (cx, cy), r, (30, 30, 220), -1)
+            cv2.circle(frame, (cx, cy), int(r * 0.7), (240, 240, 240), -1)
+        elif kind == 1:
+            pts = np.array([(cx, cy - r), (cx - r, cy + r * 0.8), (cx + r, cy + r * 0.8)], np.int32)
+            cv2.fillPoly(frame, [pts], (30, 30, 220))
+            cv2.fillPoly(frame, [((pts - (cx, cy)) * 0.6 + (cx, cy)).astype(np.int32)], (240, 240, 240))
+        else:
+            cv2.circle(frame, (cx, cy), r, (200, 90, 20), -1)
+    return frame, boxes
+
+
+if __name__ == '__main__':
+    import time
+    rng = np.random.default_rng(0)
+    found = total = 0
+    elapsed = []
+    for _ in range(200):
+        frame, signs = synthetic_scene(rng)
+        start = time.perf_counter()
+        regions = propose_regions(frame)
+        crops = crop_regions(frame, regions)
+        elapsed.append(time.perf_counter() - start)
+        total += len(signs)
+        for cx, cy, r in signs:
+            if any(x <= cx <= x + w and y <= cy <= y + h for (x, y, w, h), _, _ in (rg for rg in regions)):
+                found += 1
+    print('Tim thay %d/%d bien bao tong hop, %.2f ms/frame (640x480, tim vung + cat)' % (
+        found, total, 1000 * float(np.median(elapsed))))
@@ -0,0 +1,267 @@
+"""Danh muc model: moi model gan voi file nhan va kich thuoc dau vao.
+
+models.json khai bao tung model (backend, file model, file nhan csv,
+input_size). Model chi duoc nap o lan dung dau tien. Khi file model hoac
+file nhan thay doi (vd. vua train lai bang main.py), ban moi duoc nap va
+chay thu o thread nen roi moi thay cho ban cu bang mot phep gan: request
+dang chay van dung tron ven ban cu (ca model lan bang nhan).
+"""
+import csv
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from backends import DEFAULT_MODEL_PATHS, load_backend
+from cache import CacheEntry, file_signature
+from preprocess import INPUT_SIZE, preprocess_batch
+
+MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models.json')
+
+ModelSpec = namedtuple('ModelSpec', ['name', 'backend', 'model_path', 'labels_path', 'input_size'])
+
+
+def load_labels(path='labels.csv'):
+    """Doc file nhan (ClassId,Name) thanh list, nhan cua lop i o vi tri i."""
+    with open(path, encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    if rows and 'ClassId' in rows[0]:
+        labels = [None] * (max(int(row['ClassId']) for row in rows) + 1)
+        for row in rows:
+            labels[int(row['ClassId'])] = row['Name']
+        return [name if name is not None else str(i) for i, name in enumerate(labels)]
+    return [row['Name'] for row in rows]
+
+
+def load_manifest(path=MANIFEST_PATH):
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    specs = {}
+    for name, e in entries.items():
+        specs[name] = ModelSpec(name, e.get('backend', 'keras'), os.path.join(base, e['model']),
+                                os.path.join(base, e.get('labels', 'labels.csv')),
+                                tuple(e.get('input_size', INPUT_SIZE)))
+    return specs
+
+
+def _signature(spec):
+    return file_signature(spec.model_path), file_signature(spec.labels_path)
+
+
+class LoadedModel(object):
+    """Mot phien ban model da nap: backend + bang nhan + input spec."""
+
+    def __init__(self, spec, version=1):
+        self.spec = spec
+        self.name = spec.name
+        self.version = version
+        # gan vao moi CacheEntry de cache biet ket qua thuoc phien ban nao
+        self.tag = (spec.name, version)
+        self.input_size = spec.input_size
+        # lay chu ky truoc khi doc file de khong bo sot thay doi trong luc nap
+        self.signature = _signature(spec)
+        start = time.perf_counter()
+        self.backend = load_backend(spec.backend, spec.model_path)
+        self.labels = load_labels(spec.labels_path)
+        self._labels = np.array(self.labels, dtype=object)
+        self.load_time = time.perf_counter() - start
+        self.warmup_time = None
+        self.loaded_at = time.time()
+
+    def warmup(self):
+        """Chay thu mot batch va kiem tra so lop khop voi file nhan."""
+        start = time.perf_counter()
+        w, h = self.input_size
+        out = self.predict(np.zeros((1, h, w, 1), dtype=np.float32))
+        if out.shape[-1] != len(self.labels):
+            raise ValueError('Model %s co %d lop nhung %s co %d nhan' % (
+                self.spec.model_path, out.shape[-1], self.spec.labels_path, len(self.labels)))
+        self.warmup_time = time.perf_counter() - start
+        return self
+
+    def predict(self, batch):
+        return self.backend.predict(batch)
+
+    def predict_images(self, images):
+        # anh BGR uint8 -> xac suat (N, so lop)
+        return self.predict(preprocess_batch(images, self.input_size))
+
+    def label(self, classIndex):
+        return self.labels[classIndex]
+
+    def entries(self, predictions):
+        """Xac suat (N, so lop) -> list CacheEntry, tra nhan bang chi so mang."""
+        predictions = np.asarray(predictions)
+        classes = np.argmax(predictions, axis=-1)
+        return [CacheEntry(int(c), name, row, self.tag)
+                for c, name, row in zip(classes, self._labels[classes], predictions)]
+
+    def top(self, probabilities, k=3):
+        """k lop co xac suat cao nhat -> list (chi so, nhan, xac suat), giam dan."""
+        probabilities = np.asarray(probabilities)
+        k = max(1, min(k, probabilities.shape[-1]))
+        best = np.argpartition(probabilities, -k)[-k:]
+        best = best[np.argsort(probabilities[best])[::-1]]
+        return [(int(c), self._labels[c], float(probabilities[c])) for c in best]
+
+    def info(self):
+        return {
+            'backend': self.backend.name,
+            'model': self.spec.model_path,
+            'labels': self.spec.labels_path,
+            'classes': len(self.labels),
+            'input_size': list(self.input_size),
+            'version': self.version,
+            'loaded_at': self.loaded_at,
+            'load_ms': round(self.load_time * 1000, 1),
+            'warmup_ms': round(self.warmup_time * 1000, 1) if self.warmup_time is not None else None,
+        }
+
+
+class ModelRegistry(object):
+    """Nap model luc can, thay model moi khong can khoi dong lai process.
+
+    get() tra ve phien ban hien tai; nguoi goi nen giu lai doi tuong do
+    trong suot mot request de du doan va tra nhan cung mot phien ban.
+    """
+
+    def __init__(self, manifest=MANIFEST_PATH, default=None):
+        self.specs = load_manifest(manifest) if manifest and os.path.exists(manifest) else {}
+        self.default = default or next(iter(self.specs), 'keras')
+        self.swaps = 0
+        self.errors = {}
+        self._models = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._pending = {}
+        self._failed = {}
+        self._thread = None
+        self._interval = None
+
+    def register(self, name, backend=None, model_path=None, labels_path=None, input_size=None):
+        """Them/ghi de mot model; truong nao bo trong thi giu nhu trong models.json."""
+        old = self.specs.get(name)
+        backend = backend or (old.backend if old else 'keras')
+        spec = ModelSpec(name, backend,
+                         model_path or (old.model_path if old and old.backend == backend
+                                        else DEFAULT_MODEL_PATHS[backend]),
+                         labels_path or (old.labels_path if old else 'labels.csv'),
+                         tuple(input_size or (old.input_size if old else INPUT_SIZE)))
+        self.specs[name] = spec
+        return spec
+
+    def on_swap(self, fn):
+        # fn(name, model_moi, model_cu) duoc goi sau moi lan thay model
+        self._listeners.append(fn)
+
+    def _name_lock(self, name):
+        with self._lock:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _load(self, name, version):
+        if name not in self.specs:
+            raise ValueError('Model khong co trong danh muc: %s (co %s)' % (name, ', '.join(self.specs)))
+        return LoadedModel(self.specs[name], version).warmup()
+
+    def get(self, name=None):
+        name = name or self.default
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._name_lock(name):
+            model = self._models.get(name)
+            if model is None:
+                model = self._models[name] = self._load(name, 1)
+        return model
+
+    def loaded(self, name=None):
+        return self._models.get(name or self.default)
+
+    def reload(self, name=None):
+        """Nap lai, chay thu roi moi thay; neu loi thi giu model cu va nem loi."""
+        name = name or self.default
+        with self._name_lock(name):
+            old = self._models.get(name)
+            try:
+                model = self._load(name, old.version + 1 if old else 1)
+            except Exception as e:
+                self.errors[name] = str(e)
+                raise
+            self._models[name] = model
+            self.errors.pop(name, None)
+            self.swaps += 1
+        for fn in self._listeners:
+            fn(name, model, old)
+        return model
+
+    def check(self):
+        """Nap lai cac model da dung co file thay doi; tra ve ten cac model da thay."""
+        swapped = []
+        for name, model in list(self._models.items()):
+            sig = _signature(model.spec)
+            if sig == model.signature or None in (sig[0], sig[1]):
+                self._pending.pop(name, None)
+                continue
+            # file co the dang duoc ghi do: chi nap khi chu ky dung yen qua hai lan kiem tra
+            if self._pending.get(name) != sig:
+                self._pending[name] = sig
+                continue
+            if self._failed.get(name) == sig:
+                continue
+            try:
+                self.reload(name)
+                swapped.append(name)
+                self._failed.pop(name, None)
+            except Exception as e:
+                self._failed[name] = sig
+                print('Khong nap duoc model moi %s, giu ban cu: %s' % (name, e))
+        return swapped
+
+    def watch(self, interval=2.0):
+        """Thread nen kiem tra file model moi `interval` giay."""
+        if self._thread is not None or not interval:
+            return
+        self._interval = interval
+
+        def run():
+            while True:
+                time.sleep(interval)
+                for name in self.check():
+                    print('Da thay model %s -> phien ban %d' % (name, self._models[name].version))
+
+        self._thread = threading.Thread(target=run, name='model-watch', daemon=True)
+        self._thread.start()
+
+    def after_fork(self):
+        """Goi trong process con sau fork: tao lai lock va thread watcher."""
+        self._lock = threading.Lock()
+        self._locks = {}
+        if self._thread is not None:
+            self._thread = None
+            self.watch(self._interval)
+
+    def stats(self):
+        return {
+            'default': self.default,
+            'swaps': self.swaps,
+            'errors': dict(self.errors),
+            'loaded': dict((name, model.info()) for name, model in self._models.items()),
+        }
+
+
+def registry_from_env(default=None, manifest=MANIFEST_PATH):
+    """MODEL_NAME chon model trong models.json (mac dinh theo INFERENCE_BACKEND);
+    INFERENCE_BACKEND / MODEL_PATH / MODEL_LABELS de ghi de tung truong."""
+    backend = os.environ.get('INFERENCE_BACKEND')
+    name = os.environ.get('MODEL_NAME') or default or backend or 'keras'
+    registry = ModelRegistry(manifest, default=name)
+    model_path = os.environ.get('MODEL_PATH')
+    labels_path = os.environ.get('MODEL_LABELS')
+    if name not in registry.specs or model_path or labels_path:
+        registry.register(name, backend if model_path or name not in registry.specs else None, model_path, labels_path)
+    return registry
@@ -0,0 +1,118 @@
+"""Chay app.py cho production: nap model mot lan roi fork nhieu worker.
+
+Process cha import app, nap va warm-up model roi moi fork. Cac worker
+dung chung trang bo nho chua trong so model (copy-on-write) va cung
+accept tren mot socket; worker nao chet thi duoc fork lai. TensorFlow
+(backend keras) khong an toan khi fork sau khi da khoi tao, nen voi
+keras moi worker tu nap model cua minh sau khi fork.
+
+Khong co fork (Windows) hoac --workers 1 thi chay mot process.
+
+    python serve.py --workers 4 --port 5001
+    MODEL_NAME=tflite python serve.py --workers 8 --host 0.0.0.0
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import time
+
+from werkzeug.serving import make_server
+
+
+def _listen(host, port, backlog=128):
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _serve(service, host, port, sock=None):
+    if not service.ready.is_set():
+        service.warm_up()
+    server = make_server(host, port, service.app, threaded=True, fd=sock.fileno() if sock else None)
+    server.serve_forever()
+
+
+def preload_in_master(service):
+    # tflite doc trong so tu bytes chi doc -> chia se duoc giua cac worker sau fork
+    return service.models.specs[service.models.default].backend != 'keras'
+
+
+def run(workers=None, host='127.0.0.1', port=5001):
+    start = time.perf_counter()
+    import app as service
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or not hasattr(os, 'fork'):
+        print('Chay 1 process tai http://%s:%d' % (host, port))
+        _serve(service, host, port)
+        return
+
+    sock = _listen(host, port)
+    if preload_in_master(service):
+        service.warm_up()
+    else:
+        # chi import (chua tao model/session): phan lon thoi gian khoi dong keras nam o day
+        import tensorflow.keras.models  # noqa: F401
+    # dua cac object da co vao vung "bat tu" de GC trong worker khong cham vao (giu copy-on-write)
+    gc.freeze()
+    print('Master %d: %d worker tai http://%s:%d (khoi tao %.2fs)' % (
+        os.getpid(), workers, host, port, time.perf_counter() - start))
+
+    children = {}
+    stopping = []
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            code = 0
+            try:
+                _serve(service, host, port, sock)
+            except Exception as e:
+                print('[%d] Worker loi: %s' % (os.getpid(), e))
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if stopping or started is None:
+            continue
+        print('Worker %d thoat (status %d), fork lai' % (pid, status))
+        if time.monotonic() - started < 1.0:
+            # chet ngay sau khi khoi dong: cho mot chut de khong fork lien tuc
+            time.sleep(1.0)
+        spawn()
+    sock.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Chay web nhan dien bien bao voi nhieu worker (prefork)')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', 0)) or None,
+                        help='so worker (mac dinh = so CPU)')
+    parser.add_argument('--host', default=os.environ.get('HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5001)))
+    args = parser.parse_args()
+    run(args.workers, args.host, args.port)
@@ -0,0 +1,336 @@
+"""Chay app.py sau mot vong lap asyncio, inference tren pool thread co kich thuoc co dinh.
+
+Vong lap asyncio chi doc/ghi socket. /predict va /predict_batch duoc dua
+vao pool `--workers` thread (chay app Flask qua WSGI), toi da `--queue`
+request cho them; qua muc do tra 429 ngay, khong doc them viec. Moi
+request co han chot (REQUEST_TIMEOUT_S hoac header X-Request-Timeout, tinh
+tu luc nhan): het han khi con trong hang doi thi bi huy (khong ton cong
+predict) va tra 503. Ca hai kem Retry-After. /healthz, /readyz, /metrics,
+/stats chay tren pool rieng nen van tra loi khi dang qua tai.
+
+Response khong co Content-Length (NDJSON cua /predict_batch) duoc gui tung
+chunk (Transfer-Encoding: chunked) ngay khi thread cua pool tao ra, qua
+mot hang doi co gioi han: client doc cham thi thread cho, RAM khong tang
+theo kich thuoc file zip. Han chot chi ap dung den luc co dong dau; sau do
+app tu dung stream khi qua han (xem upload_batch trong app.py).
+
+    python serve_async.py --workers 4 --queue 32 --port 5001
+"""
+import argparse
+import asyncio
+import io
+import math
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from urllib.parse import unquote
+
+ADMIT_PATHS = ('/predict', '/predict_batch')
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 64 * 1024 * 1024
+# so chunk toi da nam cho trong hang doi giua thread cua pool va socket
+STREAM_CHUNKS = 8
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 411: 'Length Required', 413: 'Payload Too Large',
+           429: 'Too Many Requests', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+_FAILED = object()
+
+
+class BodyStream(object):
+    """Chuyen response tu thread cua pool sang vong lap asyncio.
+
+    Phan tu dau la (status, headers, body): body la bytes thi response da du,
+    None thi cac chunk theo sau, ket thuc bang None. put() chan khi hang doi
+    day va tra False khi client da ngat (close()).
+    """
+
+    def __init__(self, loop, max_chunks=STREAM_CHUNKS):
+        self.loop = loop
+        self.queue = asyncio.Queue(max_chunks)
+        self.closed = False
+
+    def put(self, item):
+        # goi tu thread cua pool
+        while not self.closed:
+            try:
+                future = asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop)
+            except RuntimeError:
+                return False  # vong lap da dong
+            try:
+                future.result(1.0)
+                return not self.closed
+            except FutureTimeout:
+                future.cancel()
+        return False
+
+    async def get(self):
+        item = await self.queue.get()
+        if item is _FAILED:
+            raise ConnectionAbortedError('app loi giua luc stream')
+        return item
+
+    def close(self):
+        # goi trong vong lap: bo cac chunk con lai de thread dang cho put() thoat ra
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+
+def call_app(app, environ, stream=None):
+    """Chay WSGI app trong thread cua pool -> (status, headers, body); app loi thi tra 500.
+
+    Co `stream`: ket qua dua vao BodyStream; response khong co Content-Length
+    duoc dua tung chunk thay vi gom du.
+    """
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [status, headers]
+
+    head_sent = False
+    try:
+        result = app(environ, start_response)
+        try:
+            if stream is None or any(k.lower() == 'content-length' for k, _ in started[1]):
+                response = started[0], started[1], b''.join(result)
+                return stream.put(response) if stream is not None else response
+            head_sent = True
+            if not stream.put((started[0], started[1], None)):
+                return False
+            for chunk in result:
+                if chunk and not stream.put(chunk):
+                    return False
+            return stream.put(None)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+    except Exception:
+        # loi lot qua Flask (hoac app khong goi start_response): tra 500 thay vi lam rot ket noi;
+        # da gui dong dau thi chi con cach cat ket noi
+        traceback.print_exc()
+        if head_sent:
+            return stream.put(_FAILED)
+        response = '500 %s' % REASONS[500], [('Content-Type', 'text/plain; charset=utf-8')], b'Loi may chu'
+        return stream.put(response) if stream is not None else response
+
+
+class AsyncServer(object):
+    def __init__(self, app, workers=4, max_queue=32, timeout=10.0, alpha=0.1):
+        self.app = app
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.alpha = alpha
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='infer')
+        self.control_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='control')
+        # so request dang chay + dang cho trong pool; chi doi trong vong lap nen khong can lock
+        self.pending = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.service_time = None
+
+    def retry_after(self):
+        per = self.service_time or 1.0
+        return max(1, int(math.ceil(per * (self.pending - self.workers + 1) / self.workers)))
+
+    def environ(self, method, target, headers, body, peer, deadline):
+        path, _, query = target.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote(path),
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '0',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': peer[0] if peer else '',
+            'CONTENT_TYPE': headers.get('content-type', ''),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'bbgt.deadline': deadline,
+        }
+        for name, value in headers.items():
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            if key not in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
+                environ[key] = value
+        return environ
+
+    async def dispatch(self, method, target, headers, body, peer, arrived):
+        timeout = self.timeout
+        try:
+            timeout = min(timeout, float(headers.get('x-request-timeout', timeout)))
+        except ValueError:
+            pass
+        deadline = arrived + timeout
+        environ = self.environ(method, target, headers, body, peer, deadline)
+        loop = asyncio.get_running_loop()
+        if target.partition('?')[0] not in ADMIT_PATHS:
+            return await loop.run_in_executor(self.control_pool, call_app, self.app, environ)
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            return self.overloaded(429, 'Hang doi day')
+        self.pending += 1
+        start = time.monotonic()
+        stream = BodyStream(loop)
+        job = self.pool.submit(self.call_before_deadline, environ, stream)
+        # chi giam pending khi thread that su xong (hoac viec bi huy khi con trong hang doi):
+        # huy phan await khong dung duoc thread dang chay, no van chiem mot cho cua pool
+        job.add_done_callback(lambda _: self._job_finished(loop))
+        try:
+            status, headers, body = await asyncio.wait_for(stream.get(), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            # het han: viec chua chay thi bi bo han, dang chay thi dung o lan put() ke tiep
+            job.cancel()
+            stream.close()
+            self.timed_out += 1
+            return self.overloaded(503, 'Het han truoc khi xu ly xong')
+        elapsed = time.monotonic() - start
+        self.service_time = elapsed if self.service_time is None else \
+            self.service_time + self.alpha * (elapsed - self.service_time)
+        return status, headers, stream if body is None else body
+
+    def _job_finished(self, loop):
+        # goi tu thread cua pool: chuyen ve vong lap (pending chi doi trong vong lap nen khong can lock)
+        try:
+            loop.call_soon_threadsafe(self._release_pending)
+        except RuntimeError:
+            pass  # vong lap da dong (tat server) khi thread moi xong
+
+    def _release_pending(self):
+        self.pending -= 1
+
+    def call_before_deadline(self, environ, stream):
+        # thread nhan viec dung luc han chot vua qua (chua kip bi huy): bo luon, khong chay app
+        if time.monotonic() >= environ['bbgt.deadline']:
+            return stream.put(self.overloaded(503, 'Het han truoc khi xu ly xong'))
+        return call_app(self.app, environ, stream)
+
+    def overloaded(self, status, reason):
+        return ('%d %s' % (status, REASONS[status]),
+                [('Content-Type', 'text/plain; charset=utf-8'), ('Retry-After', str(self.retry_after()))],
+                reason.encode('utf-8'))
+
+    async def handle(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except asyncio.IncompleteReadError:
+                    return
+                except asyncio.LimitOverrunError:
+                    await self.send(writer, ('400 Bad Request', [], b'Header qua lon'), False)
+                    return
+                arrived = time.monotonic()
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    await self.send(writer, ('400 Bad Request', [], b''), False)
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    name, sep, value = line.partition(':')
+                    if sep:
+                        headers[name.strip().lower()] = value.strip()
+                if 'chunked' in headers.get('transfer-encoding', '').lower():
+                    await self.send(writer, ('411 Length Required', [], b''), False)
+                    return
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0 or length > MAX_BODY_BYTES:
+                    await self.send(writer, ('413 Payload Too Large', [], b''), False)
+                    return
+                body = await reader.readexactly(length) if length else b''
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                response = await self.dispatch(method, target, headers, body, peer, arrived)
+                await self.send(writer, response, keep_alive, chunked=version == 'HTTP/1.1')
+                if isinstance(response[2], BodyStream) and version != 'HTTP/1.1':
+                    return  # HTTP/1.0: dong ket noi de bao het body
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def send(self, writer, response, keep_alive, chunked=True):
+        status, headers, body = response
+        lines = ['HTTP/1.1 %s' % status]
+        lines += ['%s: %s' % (k, v) for k, v in headers
+                  if k.lower() not in ('content-length', 'connection', 'transfer-encoding')]
+        if isinstance(body, BodyStream):
+            lines += ['Transfer-Encoding: chunked'] if chunked else []
+        else:
+            lines += ['Content-Length: %d' % len(body)]
+        lines += ['Connection: %s' % ('keep-alive' if keep_alive else 'close')]
+        head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        if not isinstance(body, BodyStream):
+            writer.write(head + body)
+            await writer.drain()
+            return
+        writer.write(head)
+        try:
+            while True:
+                chunk = await body.get()
+                if chunk is None:
+                    break
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk) if chunked else chunk)
+                await writer.drain()
+            if chunked:
+                writer.write(b'0\r\n\r\n')
+            await writer.drain()
+        finally:
+            # client ngat giua chung: bao thread cua pool dung lai
+            body.close()
+
+    def stats(self):
+        return {'workers': self.workers, 'max_queue': self.max_queue, 'pending': self.pending,
+                'rejected': self.rejected, 'timed_out': self.timed_out,
+                'service_ms': round(self.service_time * 1000, 2) if self.service_time is not None else None}
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER_BYTES)
+        async with server:
+            await server.serve_forever()
+
+
+def run(workers=4, max_queue=32, host='127.0.0.1', port=5001, timeout=None):
+    import app as service
+    # pool cua server da gioi han so request dong thoi: bo gioi han ben trong app de khong cho hai lan
+    service.admission.max_concurrent = 0
+    service.warm_up()
+    server = AsyncServer(service.app, workers, max_queue, timeout or service.REQUEST_TIMEOUT_S)
+    service.metrics.collect(lambda: [('async_%s' % k, 'counter' if k in ('rejected', 'timed_out') else 'gauge',
+                                      {}, v) for k, v in server.stats().items() if v is not None])
+    print('asyncio tai http://%s:%d: %d worker, hang doi %d, han chot %.1fs' % (
+        host, port, workers, max_queue, server.timeout))
+    try:
+        asyncio.run(server.serve(host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Chay web nhan dien bien bao voi asyncio + pool inference')
+    parser.add_argument('--workers', type=int,
+                        default=int(os.environ.get('MAX_CONCURRENT', 0)) or os.cpu_count() or 4,
+                        help='so thread chay /predict cung luc')
+    parser.add_argument('--queue', type=int, default=int(os.environ.get('MAX_QUEUE', 32)),
+                        help='so request duoc cho them')
+    parser.add_argument('--timeout', type=float, default=None, help='han chot moi request (giay)')
+    parser.add_argument('--host', default=os.environ.get('HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5001)))
+    args = parser.parse_args()
+    run(args.workers, args.queue, args.host, args.port, args.timeout)
@@ -24,30 +24,101 @@ $(document).ready(function () {
         readURL(this);
     });
 
+    // Downscale on a canvas before upload: the model only sees 32x32, so sending
+    // the original photo wastes bandwidth and server decode time
+    var form = $('#upload-file');
+    var imageSize = parseInt(form.data('image-size'), 10) || 0;
+    var jpegQuality = parseFloat(form.data('jpeg-quality')) || 0.9;
+    var topK = parseInt(form.data('top-k'), 10) || 3;
+
+    function downscale(file, size, callback) {
+        var canvas = document.createElement('canvas');
+        if (!size || !canvas.getContext || !canvas.toBlob || !window.URL) {
+            callback(null);
+            return;
+        }
+        var url = URL.createObjectURL(file);
+        var img = new Image();
+        img.onload = function () {
+            URL.revokeObjectURL(url);
+            var w = img.naturalWidth, h = img.naturalHeight;
+            var source = img;
+            // halve step by step (close to INTER_AREA on the server) instead of one big jump
+            while (w / 2 >= size && h / 2 >= size) {
+                w = Math.floor(w / 2);
+                h = Math.floor(h / 2);
+                var step = document.createElement('canvas');
+                step.width = w;
+                step.height = h;
+                step.getContext('2d').drawImage(source, 0, 0, w, h);
+                source = step;
+            }
+            // the server resizes to a square without keeping the aspect ratio, so do the same here
+            canvas.width = size;
+            canvas.height = size;
+            var ctx = canvas.getContext('2d');
+            ctx.imageSmoothingQuality = 'high';
+            ctx.drawImage(source, 0, 0, size, size);
+            canvas.toBlob(callback, 'image/jpeg', jpegQuality);
+        };
+        img.onerror = function () {
+            URL.revokeObjectURL(url);
+            callback(null);
+        };
+        img.src = url;
+    }
+
+    function showResult(data) {
+        $('.loader').hide();
+        $('#result').empty().fadeIn(600);
+        if (typeof data === 'string') {
+            $('#result').text(' Ket qua:  ' + data);
+            return;
+        }
+        $('#result').text(' Ket qua:  ' + data.label + ' (' + (data.probability * 100).toFixed(1) + '%)');
+        var list = $('<ol class="top-k"></ol>');
+        $.each(data.top, function (i, item) {
+            list.append($('<li></li>').text(item.label + ': ' + (item.probability * 100).toFixed(1) + '%'));
+        });
+        $('#result').append(list);
+    }
+
     // Predict
     $('#btn-predict').click(function () {
-        var form_data = new FormData($('#upload-file')[0]);
+        var file = $('#imageUpload')[0].files[0];
+        if (!file) {
+            return;
+        }
 
         // Show loading animation
         $(this).hide();
         $('.loader').show();
 
-        // Make prediction by calling api /predict
-        $.ajax({
-            type: 'POST',
-            url: '/predict',
-            data: form_data,
-            contentType: false,
-            cache: false,
-            processData: false,
-            async: true,
-            success: function (data) {
-                // Get and display the result
-                $('.loader').hide();
-                $('#result').fadeIn(600);
-                $('#result').text(' Ket qua:  ' + data);
-                console.log('Success!');
-            },
+        downscale(file, imageSize, function (blob) {
+            // no canvas support (or CLIENT_IMAGE_SIZE=0): send the original file as before
+            var body = blob || new FormData(form[0]);
+
+            // Make prediction by calling api /predict
+            $.ajax({
+                type: 'POST',
+                url: '/predict?top=' + topK,
+                data: body,
+                contentType: blob ? blob.type : false,
+                dataType: 'json',
+                cache: false,
+                processData: false,
+                async: true,
+                success: function (data) {
+                    // Get and display the result
+                    showResult(data);
+                    console.log('Success!');
+                },
+                error: function (xhr) {
+                    $('.loader').hide();
+                    $('#btn-predict').show();
+                    $('#result').fadeIn(600).text(' Loi: ' + (xhr.responseText || xhr.statusText));
+                },
+            });
         });
     });
 
@@ -0,0 +1,283 @@
+"""Do nhieu bo sieu tham so cung luc, moi trial mot process, dung chung dataset memmap.
+
+Cache tien xu ly (dataset.py, .dataset_cache/images.npy) duoc tao mot lan
+roi moi process mo bang memmap: cac trial doc chung page cache cua he dieu
+hanh, moi batch chi copy dung so anh cua batch do (khong ai giu ca
+dataset trong RAM). Moi process chi dung `cores / workers` thread TF.
+
+Trial dung som khi val_accuracy khong tang sau `--patience` epoch
+(EarlyStopping) hoac bi cat (prune) khi sau `--prune-after` epoch ket qua
+tot nhat con duoi trung vi cua cac trial khac o cung epoch, de nhuong core
+cho trial khac. Ket qua tung epoch ghi vao epochs.jsonl (de so trung vi),
+ket qua tung trial ghi vao results.csv; chay lai cung lenh thi bo qua cac
+trial da xong (trial dang do dang bi chay lai tu dau).
+
+    python sweep.py --workers 4
+    python sweep.py --trials 8 --set lr=0.001,0.0003 --set dense=500,128 --save-models
+"""
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from dataset import CACHE_DIR, build_cache, list_classes
+
+# Khong gian tim kiem mac dinh; gia tri dau tien cua moi tham so la cau hinh cua main.py
+SPACE = {
+    'lr': [1e-3, 3e-4],
+    'batch_size': [32, 64],
+    'conv1': [60, 32],
+    'conv2': [30, 16],
+    'dense': [500, 128],
+    'dropout': [0.5, 0.3],
+    'augment': [1, 0],
+    # bien the kien truc cua model_factory.py, mac dinh chi do cau hinh goc (--set conv=standard,separable)
+    'conv': ['standard'],
+    'head': ['dense'],
+}
+COLUMNS = ['trial', 'status'] + list(SPACE) + ['epochs', 'best_epoch', 'val_accuracy', 'val_loss',
+                                                 'test_accuracy', 'params', 'seconds']
+
+Trial = namedtuple('Trial', ['id', 'params'])
+Options = namedtuple('Options', ['epochs', 'patience', 'prune_after', 'prune_min_trials', 'threads', 'out_dir',
+                                 'save_models'])
+Data = namedtuple('Data', ['images_path', 'labels_path', 'classes', 'train', 'validation', 'test'])
+
+
+def trial_id(params):
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:10]
+
+
+def make_trials(space, limit=None, seed=0):
+    """Tich Descartes cua khong gian tim kiem; `limit` thi lay ngau nhien `limit` trial (co dinh theo seed)."""
+    keys = list(space)
+    combos = [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+    if limit and limit < len(combos):
+        # luon giu cau hinh goc (trial dau) de co moc so sanh
+        rng = np.random.default_rng(seed)
+        combos = [combos[0]] + [combos[i] for i in sorted(rng.choice(np.arange(1, len(combos)), limit - 1, False))]
+    return [Trial(trial_id(p), p) for p in combos]
+
+
+def parse_value(text):
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def split(n, test_ratio=0.2, validation_ratio=0.2, seed=0):
+    """Chia chi so (train, validation, test) giong main.py, co dinh theo seed de moi trial dung chung."""
+    idx = np.random.default_rng(seed).permutation(n)
+    n_test = int(n * test_ratio)
+    n_val = int((n - n_test) * validation_ratio)
+    return np.sort(idx[n_test + n_val:]), np.sort(idx[n_test:n_test + n_val]), np.sort(idx[:n_test])
+
+
+def memmap_dataset(images, labels, idx, batch_size, shuffle=False, augment=False, seed=None):
+    """tf.data doc tung batch tu memmap theo chi so (khong copy ca dataset vao graph nhu from_tensor_slices)."""
+    import tensorflow as tf
+    from input_pipeline import AUGMENT, random_affine
+    rng = np.random.default_rng(seed)
+
+    def batches():
+        order = rng.permutation(idx) if shuffle else idx
+        for i in range(0, len(order), batch_size):
+            # chi so tang dan: doc memmap gan nhu tuan tu
+            b = np.sort(order[i:i + batch_size])
+            yield images[b][..., None], labels[b]
+
+    ds = tf.data.Dataset.from_generator(batches, output_signature=(
+        tf.TensorSpec((None, 32, 32, 1), tf.uint8), tf.TensorSpec((None,), tf.int32)))
+    ds = ds.map(lambda x, y: (tf.cast(x, tf.float32) / 255.0, y))
+    if augment:
+        ds = ds.map(lambda x, y: (random_affine(x, **AUGMENT), y))
+    return ds.prefetch(2)
+
+
+def read_epochs(path):
+    """epochs.jsonl -> {trial: {epoch: val_accuracy}}."""
+    history = {}
+    if not os.path.exists(path):
+        return history
+    with open(path) as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue  # dong cuoi cua lan chay bi ngat giua chung
+            history.setdefault(row['trial'], {})[row['epoch']] = row['val_accuracy']
+    return history
+
+
+def should_prune(history, trial, epoch, best, min_trials):
+    """Cat neu ket qua tot nhat toi `epoch` duoi trung vi cua cac trial khac (tot nhat toi cung epoch)."""
+    others = [max(v for e, v in epochs.items() if e <= epoch)
+              for t, epochs in history.items() if t != trial and max(epochs) >= epoch]
+    return len(others) >= min_trials and best < float(np.median(others))
+
+
+def _init_worker(threads):
+    # dat truoc khi import tensorflow trong process con: cac trial khong tranh core voi nhau
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+
+def run_trial(trial, data, options):
+    """Train mot trial trong process con, tra ve mot dong cua results.csv."""
+    import tensorflow as tf
+    from model_factory import build_model
+    start = time.perf_counter()
+    params = trial.params
+    images = np.load(data.images_path, mmap_mode='r')
+    labels = np.load(data.labels_path, mmap_mode='r')
+    tf.keras.utils.set_random_seed(0)
+    model = build_model(data.classes, **params)
+    train = memmap_dataset(images, labels, data.train, params['batch_size'], shuffle=True,
+                           augment=bool(params['augment']), seed=0)
+    validation = memmap_dataset(images, labels, data.validation, 256)
+    epochs_path = os.path.join(options.out_dir, 'epochs.jsonl')
+    state = {'status': 'done', 'best': -1.0, 'best_epoch': 0, 'val_loss': None}
+
+    class Report(tf.keras.callbacks.Callback):
+        def on_epoch_end(self, epoch, logs=None):
+            acc = float(logs['val_accuracy'])
+            if acc > state['best']:
+                state.update(best=acc, best_epoch=epoch + 1, val_loss=float(logs['val_loss']))
+            # mot dong ngan ghi bang mot lan write o che do append: cac process khong ghi chen nhau
+            with open(epochs_path, 'a') as f:
+                f.write(json.dumps({'trial': trial.id, 'epoch': epoch + 1, 'val_accuracy': acc,
+                                    'val_loss': float(logs['val_loss'])}) + '\n')
+            if epoch + 1 >= options.prune_after and should_prune(
+                    read_epochs(epochs_path), trial.id, epoch + 1, state['best'], options.prune_min_trials):
+                state['status'] = 'pruned'
+                self.model.stop_training = True
+
+    stopper = tf.keras.callbacks.EarlyStopping(monitor='val_accuracy', patience=options.patience,
+                                               restore_best_weights=True)
+    history = model.fit(train, validation_data=validation, epochs=options.epochs, verbose=0,
+                        callbacks=[Report(), stopper])
+    epochs = len(history.history['loss'])
+    if state['status'] == 'done' and epochs < options.epochs:
+        state['status'] = 'early_stopped'
+    test_accuracy = None
+    if state['status'] != 'pruned':
+        test_accuracy = float(model.evaluate(memmap_dataset(images, labels, data.test, 256), verbose=0)[1])
+        if options.save_models:
+            model.save(os.path.join(options.out_dir, 'models', trial.id + '.h5'))
+    row = dict(params, trial=trial.id, status=state['status'], epochs=epochs, best_epoch=state['best_epoch'],
+               val_accuracy=round(state['best'], 5), val_loss=round(state['val_loss'], 5),
+               test_accuracy=round(test_accuracy, 5) if test_accuracy is not None else '',
+               params=model.count_params(), seconds=round(time.perf_counter() - start, 1))
+    return row
+
+
+def read_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def append_result(path, row):
+    new = not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, 'a', newline='') as f:
+        writer = csv.DictWriter(f, COLUMNS)
+        if new:
+            writer.writeheader()
+        writer.writerow(row)
+
+
+def _executor(workers, threads):
+    # fork chi an toan khi process cha chua nap tensorflow (sweep.py chay truc tiep);
+    # goi tu model_factory.py thi dung spawn (file nay co __main__ nen van chay duoc)
+    methods = multiprocessing.get_all_start_methods()
+    fork = 'fork' in methods and 'tensorflow' not in sys.modules
+    context = multiprocessing.get_context('fork' if fork else 'spawn')
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                               initargs=(threads,))
+
+
+def leaderboard(rows, top=10):
+    rows = sorted((r for r in rows if r['status'] != 'failed'), key=lambda r: -float(r['val_accuracy'] or 0))
+    print('%-10s %-13s %7s %7s %6s %9s  %s' % ('trial', 'status', 'val', 'test', 'epoch', 'params', 'cau hinh'))
+    for r in rows[:top]:
+        config = ' '.join('%s=%s' % (k, r[k]) for k in SPACE)
+        print('%-10s %-13s %7s %7s %6s %9s  %s' % (r['trial'], r['status'], r['val_accuracy'],
+                                                    r['test_accuracy'] or '-', r['epochs'], r['params'], config))
+
+
+def run(trials, path='Dataset', out_dir='sweep', workers=None, epochs=12, patience=3, prune_after=2,
+        prune_min_trials=3, save_models=False, cache_dir=CACHE_DIR):
+    workers = workers or os.cpu_count() or 1
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    os.makedirs(os.path.join(out_dir, 'models') if save_models else out_dir, exist_ok=True)
+    results_path = os.path.join(out_dir, 'results.csv')
+    # trial loi thi chay lai; cac trial khac (xong, dung som, bi cat) khong chay lai
+    finished = {r['trial'] for r in read_results(results_path) if r['status'] != 'failed'}
+    todo = [t for t in trials if t.id not in finished]
+    print('%d trial (%d da xong tu lan truoc), %d process x %d thread' % (
+        len(trials), len(trials) - len(todo), workers, threads))
+    if todo:
+        # tao cache mot lan o process cha; cac trial chi mo memmap
+        images_path, labels_path = build_cache(path, cache_dir)
+        n = len(np.load(labels_path, mmap_mode='r'))
+        train, validation, test = split(n)
+        data = Data(images_path, labels_path, len(list_classes(path)), train, validation, test)
+        options = Options(epochs, patience, prune_after, prune_min_trials, threads, out_dir, save_models)
+        start = time.perf_counter()
+        with _executor(workers, threads) as pool:
+            futures = {pool.submit(run_trial, t, data, options): t for t in todo}
+            for i, future in enumerate(as_completed(futures), 1):
+                trial = futures[future]
+                try:
+                    row = future.result()
+                except Exception as e:
+                    print('Trial %s loi: %s' % (trial.id, e), file=sys.stderr)
+                    row = dict(trial.params, trial=trial.id, status='failed')
+                append_result(results_path, row)
+                print('[%d/%d %.0fs] %s %s val=%s epoch=%s' % (
+                    i, len(todo), time.perf_counter() - start, trial.id, row['status'],
+                    row.get('val_accuracy', '-'), row.get('epochs', '-')))
+    rows = read_results(results_path)
+    leaderboard(rows)
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Do sieu tham so song song tren dataset memmap dung chung')
+    parser.add_argument('--path', default='Dataset', help='thu muc Dataset/<lop>/')
+    parser.add_argument('--output', default='sweep', help='thu muc ghi results.csv, epochs.jsonl, models/')
+    parser.add_argument('--workers', type=int, default=None, help='so trial chay cung luc (mac dinh: so core)')
+    parser.add_argument('--trials', type=int, default=None, help='chi lay ngau nhien n cau hinh')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--set', action='append', default=[], metavar='TEN=GT1,GT2',
+                        help='thay gia tri cua mot tham so, vd. --set lr=0.001,0.0003')
+    parser.add_argument('--epochs', type=int, default=12)
+    parser.add_argument('--patience', type=int, default=3, help='EarlyStopping theo val_accuracy')
+    parser.add_argument('--prune-after', type=int, default=2, help='chi cat trial tu epoch nay')
+    parser.add_argument('--prune-min-trials', type=int, default=3, help='so trial khac toi thieu de so trung vi')
+    parser.add_argument('--save-models', action='store_true', help='luu model tung trial vao <output>/models/')
+    args = parser.parse_args()
+    space = dict(SPACE)
+    for item in args.set:
+        name, _, values = item.partition('=')
+        if name not in SPACE or not values:
+            parser.error('--set %s: tham so phai la mot trong %s' % (item, ', '.join(SPACE)))
+        space[name] = [parse_value(v) for v in values.split(',')]
+    if not os.path.isdir(args.path):
+        parser.error('khong thay thu muc %s' % args.path)
+    run(make_trials(space, args.trials, args.seed), args.path, args.output, args.workers, args.epochs,
+        args.patience, args.prune_after, args.prune_min_trials, args.save_models)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# cac module nam o thu muc goc cua repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,34 @@
+"""preprocess_batch phai cho cung ket qua voi cach cu (tung anh, img/255)."""
+import numpy as np
+import pytest
+
+from preprocess import check_parity, preprocess_batch
+
+# float32 so voi float64 cua cach cu: sai so ~1e-7
+TOLERANCE = 1e-6
+
+rng = np.random.default_rng(0)
+BATCHES = {
+    'random-32': list(rng.integers(0, 256, (16, 32, 32, 3), dtype=np.uint8)),
+    'random-resize': list(rng.integers(0, 256, (16, 48, 64, 3), dtype=np.uint8)),
+    'mixed-sizes': [rng.integers(0, 256, (h, w, 3), dtype=np.uint8) for h, w in ((20, 20), (32, 32), (90, 120))],
+    'low-contrast': list(rng.integers(100, 110, (8, 32, 32, 3), dtype=np.uint8)),
+    'constant': [np.full((32, 32, 3), v, np.uint8) for v in (0, 7, 255)],
+}
+
+
+@pytest.mark.parametrize('name', sorted(BATCHES))
+def test_parity(name):
+    assert check_parity(BATCHES[name]) <= TOLERANCE
+
+
+def test_array_input_matches_list():
+    images = rng.integers(0, 256, (8, 32, 32, 3), dtype=np.uint8)
+    assert check_parity(images) <= TOLERANCE
+    np.testing.assert_array_equal(preprocess_batch(images), preprocess_batch(list(images)))
+
+
+def test_shape_and_dtype():
+    out = preprocess_batch(BATCHES['random-resize'])
+    assert out.shape == (16, 32, 32, 1) and out.dtype == np.float32
+    assert preprocess_batch([]).shape == (0, 32, 32, 1)
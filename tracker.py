@@ -0,0 +1,247 @@
+"""Theo doi bien bao qua cac frame de khong phai phan loai lai moi frame.
+
+Moi frame:
+  1. So frame (thu nho) voi frame da xu ly lan truoc; canh gan nhu
+     dung yen thi giu nguyen ket qua, khong tim vung cung khong predict.
+  2. Tim vung (regions.py), ghep voi track cu theo IoU, neu khong du thi
+     theo khoang cach tam.
+  3. Chi phan loai track moi, track da qua `reclassify_every` frame, hoac
+     track co anh thay doi qua `change_threshold`; tat ca trong mot batch.
+  4. Xac suat cua track duoc lam min (EMA) nen nhan khong nhay qua lai.
+
+Mo phong so lan predict so voi phan loai moi frame: python tracker.py
+"""
+import copy
+import itertools
+
+import cv2
+import numpy as np
+
+from regions import Region, iou, propose_regions
+
+
+def _thumb(frame, box, size=(16, 16)):
+    x, y, w, h = box
+    crop = frame[y:y + h, x:x + w]
+    if crop.ndim == 3:
+        crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(crop, size, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+class Track(object):
+    def __init__(self, track_id, region):
+        self.id = track_id
+        self.region = region
+        self.box = region.box
+        self.hits = 1
+        self.missed = 0
+        self.since_classified = 0
+        self.thumb = None
+        self.probabilities = None
+        self.class_index = None
+        self.label = None
+        self.probability = 0.0
+
+
+class SignTracker(object):
+    """`classify_fn(frame, regions)` -> list CacheEntry (mot lan predict cho ca list)."""
+
+    def __init__(self, classify_fn, propose_fn=propose_regions, reclassify_every=10, change_threshold=12.0,
+                 iou_threshold=0.3, max_missed=5, alpha=0.4, motion_threshold=0.001, pixel_threshold=15,
+                 max_static=30, min_hits=2):
+        self.classify_fn = classify_fn
+        self.propose_fn = propose_fn
+        self.reclassify_every = reclassify_every
+        self.change_threshold = change_threshold
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.alpha = alpha
+        self.motion_threshold = motion_threshold
+        self.pixel_threshold = pixel_threshold
+        self.max_static = max_static
+        self.min_hits = min_hits
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self._last_small = None
+        self._static = 0
+        self._reset = False
+        self.frames = 0
+        self.static_skips = 0
+        self.classified = 0
+
+    def reset(self):
+        # co the goi tu thread khac: ap dung o lan update ke tiep
+        self._reset = True
+
+    def _is_static(self, frame):
+        # ti le diem anh thay doi ro (> pixel_threshold o kenh mau bat ky) tren anh 160x120.
+        # Khong dung trung binh (bien bao nho di chuyen bi chim trong ca frame) va khong dung
+        # anh xam (bien do co the cung do sang voi nen)
+        small = cv2.resize(frame, (160, 120), interpolation=cv2.INTER_AREA)
+        if self._last_small is not None and self._static < self.max_static:
+            diff = cv2.absdiff(small, self._last_small).max(axis=2)
+            if np.count_nonzero(diff > self.pixel_threshold) < self.motion_threshold * diff.size:
+                self._static += 1
+                return True
+        # chi cap nhat frame moc khi da xu ly, de chuyen dong cham van duoc cong don
+        self._last_small = small
+        self._static = 0
+        return False
+
+    def _match(self, regions):
+        pairs = sorted(((iou(t.box, r.box), ti, ri) for ti, t in enumerate(self.tracks)
+                        for ri, r in enumerate(regions) if r.color == t.region.color), reverse=True)
+        matched = {}
+        used = set()
+        for score, ti, ri in pairs:
+            if score < self.iou_threshold:
+                break
+            if ti not in matched and ri not in used:
+                matched[ti] = ri
+                used.add(ri)
+        # vat di chuyen nhanh (IoU thap): ghep theo khoang cach tam, nho hon kich thuoc track,
+        # cung mau va kich thuoc khong lech qua 2 lan
+        for ti, t in enumerate(self.tracks):
+            if ti in matched:
+                continue
+            tx, ty, tw, th = t.box
+            best = None
+            for ri, r in enumerate(regions):
+                if ri in used or r.color != t.region.color:
+                    continue
+                x, y, w, h = r.box
+                if not 0.5 <= float(w * h) / (tw * th) <= 2.0:
+                    continue
+                d = np.hypot((x + w / 2.0) - (tx + tw / 2.0), (y + h / 2.0) - (ty + th / 2.0))
+                if d < max(tw, th) and (best is None or d < best[0]):
+                    best = (d, ri)
+            if best is not None:
+                matched[ti] = best[1]
+                used.add(best[1])
+        return matched
+
+    def _smooth(self, track, entry):
+        probs = np.asarray(entry.probabilities, dtype=np.float32)
+        if track.probabilities is None or track.probabilities.shape != probs.shape:
+            track.probabilities = probs
+        else:
+            track.probabilities = self.alpha * probs + (1 - self.alpha) * track.probabilities
+        track.class_index = int(np.argmax(track.probabilities))
+        track.probability = float(track.probabilities[track.class_index])
+        # nhan lay tu entry (cung phien ban model) neu trung lop, neu khong giu nhan cu cua lop do
+        if track.class_index == entry.class_index or track.label is None:
+            track.label = entry.label
+
+    def update(self, frame):
+        """Xu ly mot frame, tra ve ban sao cac track da du `min_hits`."""
+        if self._reset:
+            self.tracks = []
+            self._last_small = None
+            self._reset = False
+        self.frames += 1
+        # track chua du min_hits thi chua bo qua frame nao, de bien bao moi hien ra ngay
+        confirmed = self.tracks and all(t.hits >= self.min_hits for t in self.tracks)
+        if confirmed and self._is_static(frame):
+            self.static_skips += 1
+            return self.visible()
+        if not confirmed:
+            self._is_static(frame)
+
+        regions = self.propose_fn(frame)
+        if not regions:
+            # khong thay vung nao: theo doi ca frame (bien bao chiem gan het khung hinh)
+            regions = [Region((0, 0, frame.shape[1], frame.shape[0]), None, None)]
+        matched = self._match(regions)
+        alive = []
+        todo = []
+        for ti, track in enumerate(self.tracks):
+            ri = matched.get(ti)
+            if ri is None:
+                track.missed += 1
+                if track.missed <= self.max_missed:
+                    alive.append(track)
+                continue
+            track.region = regions[ri]
+            track.box = regions[ri].box
+            track.hits += 1
+            track.missed = 0
+            track.since_classified += 1
+            thumb = _thumb(frame, track.box)
+            # track chua phan loai xong lan nao (classify_fn loi o frame truoc) thi phan loai lai ngay
+            changed = track.thumb is None or track.probabilities is None or \
+                float(np.abs(thumb - track.thumb).mean()) > self.change_threshold
+            if changed or track.since_classified >= self.reclassify_every:
+                todo.append((track, thumb))
+            alive.append(track)
+        used = set(matched.values())
+        for ri, region in enumerate(regions):
+            if ri not in used:
+                track = Track(next(self._ids), region)
+                track.thumb = _thumb(frame, region.box)
+                todo.append((track, track.thumb))
+                alive.append(track)
+        self.tracks = alive
+
+        if todo:
+            entries = self.classify_fn(frame, [t.region for t, _ in todo])
+            self.classified += len(todo)
+            for (track, thumb), entry in zip(todo, entries):
+                self._smooth(track, entry)
+                track.thumb = thumb
+                track.since_classified = 0
+        return self.visible()
+
+    def visible(self):
+        return [copy.copy(t) for t in self.tracks
+                if t.hits >= self.min_hits and t.missed == 0 and t.probabilities is not None]
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'static_skips': self.static_skips,
+            'classified': self.classified,
+            'classified_per_frame': round(self.classified / float(self.frames), 3) if self.frames else 0.0,
+            'tracks': len(self.tracks),
+        }
+
+
+def draw_tracks(frame, tracks, threshold=0.75, font=cv2.FONT_HERSHEY_SIMPLEX):
+    """Ve khung + nhan da lam min cho cac track (bo qua track ca frame)."""
+    for track in tracks:
+        if track.probability < threshold or track.region.color is None:
+            continue
+        x, y, w, h = track.box
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        text = '#%d %s %.0f%%' % (track.id, track.label, track.probability * 100)
+        cv2.putText(frame, text, (x, max(12, y - 6)), font, 0.5, (0, 255, 0), 1, cv2.LINE_AA)
+    return frame
+
+
+if __name__ == '__main__':
+    # Mo phong 300 frame: canh dung yen co nhieu camera, thinh thoang mot bien bao di chuyen qua.
+    # Bo phan loai gia chi dem so vung, de so sanh voi cach phan loai moi vung o moi frame.
+    from cache import CacheEntry
+    from regions import synthetic_scene
+    rng = np.random.default_rng(0)
+    background, _ = synthetic_scene(rng, signs=2)
+    naive = [0]
+
+    def fake_classify(frame, regions):
+        out = []
+        for region in regions:
+            p = np.full(43, 0.01, np.float32)
+            p[hash(region.shape) % 43] = 1.0
+            out.append(CacheEntry(int(np.argmax(p)), region.shape, p / p.sum()))
+        return out
+
+    tracker = SignTracker(fake_classify)
+    for i in range(300):
+        frame = np.clip(background.astype(np.int16) + rng.integers(-2, 3, background.shape), 0, 255).astype(np.uint8)
+        if 100 <= i < 160:
+            # mot bien bao tron do chay ngang khung hinh
+            cv2.circle(frame, (40 + (i - 100) * 9, 400), 30, (30, 30, 220), -1)
+        naive[0] += len(propose_regions(frame)) or 1
+        tracker.update(frame)
+    st = tracker.stats()
+    print('300 frame: phan loai moi frame %d vung, co tracker %d vung (%.0f%%), bo qua %d frame dung yen' % (
+        naive[0], st['classified'], 100.0 * st['classified'] / naive[0], st['static_skips']))
@@ -0,0 +1,206 @@
+"""Luu anh upload theo hash noi dung, ghi o thread nen, gioi han dung luong.
+
+Ten file la hash noi dung (content_key) + duoi theo dinh dang anh, nen cung
+mot anh upload nhieu lan chi luu mot lan va khong con de len file khac trung
+ten. Request chi dua viec vao hang doi co gioi han: hang doi day thi bo anh
+(dem `dropped`) chu khong bat request cho dia. Sau moi lan ghi, file dung
+lau nhat (LRU) bi xoa cho den khi tong dung luong <= `max_bytes`; file cu
+hon `max_age` giay cung bi xoa.
+
+Chi quan ly file dat ten theo hash; cac anh mau san co trong thu muc giu
+nguyen. Nhieu process (serve.py) cung ghi mot thu muc: moi `rescan_interval`
+giay doc lai thu muc de gioi han dung luong tinh ca file cua process khac.
+"""
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from cache import content_key
+
+_NAME = re.compile(r'^([0-9a-f]{32})\.(jpg|png|gif|bmp|webp|bin)$')
+
+
+def image_extension(data):
+    """Duoi file theo magic bytes (khong tin ten file client gui)."""
+    if data[:3] == b'\xff\xd8\xff':
+        return 'jpg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if data[:2] == b'BM':
+        return 'bmp'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return 'bin'
+
+
+class UploadStore(object):
+    """max_bytes=0: khong gioi han dung luong; max_age=None: khong xoa theo tuoi."""
+
+    def __init__(self, folder, max_bytes=0, max_age=None, max_queue=64, rescan_interval=60.0):
+        self.folder = folder
+        self.max_bytes = int(max_bytes)
+        self.max_age = max_age
+        self.rescan_interval = rescan_interval
+        self.queue = queue.Queue(max_queue)
+        self._lock = threading.Lock()
+        # key -> (ten file, so byte, lan dung cuoi), thu tu tu cu den moi
+        self._index = OrderedDict()
+        self._pending = set()
+        self._bytes = 0
+        self._last_scan = 0.0
+        self.written = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.evicted = 0
+        self.errors = 0
+        self.write_seconds = 0.0
+        os.makedirs(folder, exist_ok=True)
+        self._scan()
+        self._thread = threading.Thread(target=self._run, name='upload-store', daemon=True)
+        self._thread.start()
+
+    def put(self, data, key=None):
+        """Dua anh vao hang doi ghi; tra ve ten file, hoac None neu hang doi day."""
+        key = key or content_key(data)
+        name = '%s.%s' % (key, image_extension(data))
+        with self._lock:
+            if key in self._index or key in self._pending:
+                # da co (hoac dang cho ghi): chi danh dau vua dung
+                if key in self._index:
+                    self._index[key] = self._index[key][:2] + (time.time(),)
+                    self._index.move_to_end(key)
+                self.deduplicated += 1
+                return name
+            self._pending.add(key)
+        try:
+            self.queue.put_nowait((key, name, data))
+        except queue.Full:
+            with self._lock:
+                self._pending.discard(key)
+                self.dropped += 1
+            return None
+        return name
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.rescan_interval)
+            except queue.Empty:
+                item = False
+            if item is None:
+                self.queue.task_done()
+                return
+            if item:
+                self._write(*item)
+            self._evict()
+            if item:
+                self.queue.task_done()
+
+    def _write(self, key, name, data):
+        start = time.perf_counter()
+        tmp = self.path('.%s.tmp' % name)
+        try:
+            # ghi ra file tam roi doi ten: process khac khong bao gio doc phai file ghi do
+            with open(tmp, 'wb') as out:
+                out.write(data)
+            os.replace(tmp, self.path(name))
+        except OSError:
+            with self._lock:
+                self._pending.discard(key)
+                self.errors += 1
+            return
+        with self._lock:
+            self._pending.discard(key)
+            if key in self._index:
+                # process khac vua ghi cung anh (thay qua lan doc lai thu muc)
+                self._bytes -= self._index.pop(key)[1]
+            self._index[key] = (name, len(data), time.time())
+            self._bytes += len(data)
+            self.written += 1
+            self.write_seconds += time.perf_counter() - start
+
+    def _scan(self):
+        # doc lai thu muc (file cua process khac, file bi xoa tay); lan dung cuoi lay theo mtime
+        found = []
+        try:
+            entries = list(os.scandir(self.folder))
+        except OSError:
+            return
+        for entry in entries:
+            m = _NAME.match(entry.name)
+            if m is None:
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            found.append((st.st_mtime, m.group(1), entry.name, st.st_size))
+        found.sort()
+        with self._lock:
+            index = OrderedDict((key, (name, size, mtime)) for mtime, key, name, size in found)
+            # giu thu tu LRU (va lan dung cuoi) da biet trong process nay cho cac file van con
+            for key in [k for k in self._index if k in index]:
+                index[key] = index[key][:2] + (max(index[key][2], self._index[key][2]),)
+                index.move_to_end(key)
+            self._index = index
+            self._bytes = sum(size for _, size, _ in index.values())
+            self._last_scan = time.monotonic()
+
+    def _evict(self):
+        if time.monotonic() - self._last_scan >= self.rescan_interval:
+            self._scan()
+        victims = []
+        cutoff = time.time() - self.max_age if self.max_age else None
+        with self._lock:
+            while self._index:
+                key, (name, size, used) = next(iter(self._index.items()))
+                over = self.max_bytes > 0 and self._bytes > self.max_bytes
+                if not over and (cutoff is None or used >= cutoff):
+                    break
+                del self._index[key]
+                self._bytes -= size
+                self.evicted += 1
+                victims.append(name)
+        for name in victims:
+            try:
+                os.remove(self.path(name))
+            except OSError:
+                pass
+
+    def flush(self, timeout=None):
+        """Cho hang doi ghi xong (dung khi tat may / kiem tra)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self):
+        self.queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'folder': self.folder,
+                'files': len(self._index),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'max_age': self.max_age,
+                'queued': self.queue.qsize(),
+                'written': self.written,
+                'deduplicated': self.deduplicated,
+                'dropped': self.dropped,
+                'evicted': self.evicted,
+                'errors': self.errors,
+                'write_ms': round(self.write_seconds * 1000 / self.written, 3) if self.written else None,
+            }